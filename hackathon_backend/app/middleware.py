@@ -0,0 +1,68 @@
+# app/middleware.py
+
+# --- Middleware de Métricas ---
+# Mide cada petición a la API: latencia por ruta y código de estado, y número de
+# peticiones en curso. Es un middleware ASGI puro (y no BaseHTTPMiddleware) para
+# que las respuestas en streaming (SSE, NDJSON) se midan hasta el último byte.
+
+import time
+
+from app.services.metrics import HTTP_IN_FLIGHT, HTTP_REQUEST_SECONDS
+
+
+class MetricsMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        method = scope["method"]
+        status = {"code": 500}
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+            await send(message)
+
+        # La plantilla de la ruta solo se conoce después del enrutado: el contador en curso
+        # se etiqueta con el grupo de la URL (un conjunto fijo de valores).
+        in_flight = HTTP_IN_FLIGHT.labels(method, _route_group(scope["path"]))
+        in_flight.inc()
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            in_flight.dec()
+            HTTP_REQUEST_SECONDS.labels(method, _route_template(scope), str(status["code"])).observe(
+                time.perf_counter() - started
+            )
+
+
+# Valor de la etiqueta 'route' para las peticiones que no coinciden con ninguna ruta
+# (ej: sondeos a URLs inexistentes), para no crear una serie por cada URL.
+UNMATCHED = "unmatched"
+
+# Grupos de URL del contador de peticiones en curso.
+ROUTE_GROUPS = ("/api", "/health", "/static", "/media", "/metrics")
+
+
+def _route_template(scope) -> str:
+    """
+    Devuelve la plantilla de la ruta (ej: '/media/{filename}') para no crear
+    una serie distinta por cada URL, o UNMATCHED si ninguna ruta coincidió.
+    """
+    route = scope.get("route")
+    if route is not None and hasattr(route, "path"):
+        return route.path
+    return UNMATCHED
+
+
+def _route_group(path: str) -> str:
+    # Primer segmento de la URL, si es uno de los conocidos.
+    for group in ROUTE_GROUPS:
+        if path == group or path.startswith(group + "/"):
+            return group
+    return "/" if path == "/" else "other"
@@ -1,18 +1,63 @@
+# Importa asyncio para evaluar varias respuestas a la vez y json para la respuesta NDJSON.
+import asyncio
+import json
+import os
 # Importa la clase APIRouter de FastAPI para crear un grupo de rutas.
 from fastapi import APIRouter
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import StreamingResponse
 # Importa los modelos Pydantic para validar la solicitud y estructurar la respuesta.
-from app.schemas.evaluation import EvaluationRequest, EvaluationResponse 
-# Importa el servicio que contiene la lógica para comunicarse con OpenAI.
-from app.services import openai_service
+from app.schemas.evaluation import (
+    EvaluationRequest, EvaluationResponse,
+    BatchEvaluationRequest, BatchEvaluationResult
+)
+# Importa el servicio que contiene la lógica para comunicarse con OpenAI y la
+# pre-evaluación local que resuelve los casos obvios sin llamarlo.
+from app.services import openai_service, pregrader, resilience, upstream_scheduler
+from app.services.metrics import PREGRADE_DECISIONS
+from app.services.response_cache import normalize_text
 
 # Crea una instancia de APIRouter.
 router = APIRouter()
 
+# Número máximo de evaluaciones de un lote que se envían a OpenAI al mismo tiempo.
+BATCH_CONCURRENCY = int(os.getenv("EVALUATE_BATCH_CONCURRENCY", "8"))
+# Segundos que puede tardar una evaluación (incluidos los reintentos); al superarlos se
+# devuelve la evaluación "Error" en lugar de seguir esperando a OpenAI.
+EVALUATE_DEADLINE = float(os.getenv("EVALUATE_DEADLINE_SECONDS", "20"))
+
+
+async def _get_feedback(student_text: str, reference_text: str) -> dict:
+    """
+    Evalúa una respuesta: primero con la pre-evaluación local y, solo si el caso
+    es ambiguo, con OpenAI.
+    """
+    feedback_data, outcome = pregrader.pregrade(student_text, reference_text)
+    PREGRADE_DECISIONS.labels(outcome).inc()
+    if feedback_data is not None:
+        return feedback_data
+    return await openai_service.get_ai_feedback(student_text=student_text, reference_text=reference_text)
+
+
+def _build_response(feedback_data: dict, student_text: str) -> EvaluationResponse:
+    """
+    Construye la respuesta final usando el modelo Pydantic.
+    Se utiliza .get() con valores por defecto para manejar de forma segura
+    el caso en que el servicio devuelva un error y el diccionario no
+    contenga todas las claves esperadas.
+    """
+    return EvaluationResponse(
+        evaluation=feedback_data.get("evaluation", "Error"),
+        feedback=feedback_data.get("feedback", "No se recibió retroalimentación."),
+        corrected_text=feedback_data.get("corrected_text", student_text)
+    )
+
+
 # Define un endpoint en la ruta "/evaluate" que responde a peticiones POST.
 # 'response_model=EvaluationResponse' le indica a FastAPI que la respuesta
 # debe cumplir con la estructura del modelo EvaluationResponse.
 @router.post("/evaluate", response_model=EvaluationResponse)
-def evaluate_student_description(request: EvaluationRequest):
+async def evaluate_student_description(request: EvaluationRequest):
     """
     Endpoint para recibir el texto de un estudiante y un texto de referencia,
     y devolver una evaluación generada por IA.
@@ -24,19 +69,71 @@ def evaluate_student_description(request: EvaluationRequest):
     Returns:
         EvaluationResponse: Un objeto JSON con la evaluación, feedback y texto corregido.
     """
-    # 1. Llama a la función del servicio de OpenAI, pasándole los dos textos
-    # que vienen en el cuerpo de la solicitud.
-    feedback_data = openai_service.get_ai_feedback(
-        student_text=request.student_text,
-        reference_text=request.reference_text
-    )
-    
-    # 2. Construye la respuesta final usando el modelo Pydantic.
-    # Se utiliza .get() con valores por defecto para manejar de forma segura
-    # el caso en que el servicio devuelva un error y el diccionario no
-    # contenga todas las claves esperadas.
-    return EvaluationResponse(
-        evaluation=feedback_data.get("evaluation", "Error"),
-        feedback=feedback_data.get("feedback", "No se recibió retroalimentación."),
-        corrected_text=feedback_data.get("corrected_text", request.student_text)
-    )
\ No newline at end of file
+    # 1. Evalúa los dos textos que vienen en el cuerpo de la solicitud. Los casos obvios
+    # (respuesta vacía, en otro idioma, idéntica a la referencia...) se resuelven localmente;
+    # el resto se envía a OpenAI. `await` deja libre el bucle de eventos mientras responde.
+    with resilience.deadline(EVALUATE_DEADLINE):
+        feedback_data = await _get_feedback(request.student_text, request.reference_text)
+
+    # 2. Construye la respuesta final.
+    return _build_response(feedback_data, request.student_text)
+
+
+# Define un endpoint en la ruta "/evaluate/batch" para re-evaluar una tarea completa.
+# La respuesta es NDJSON: una línea JSON (BatchEvaluationResult) por cada elemento,
+# en el mismo orden de la solicitud, enviada en cuanto está lista.
+@router.post("/evaluate/batch")
+async def evaluate_batch(request: BatchEvaluationRequest):
+    """
+    Endpoint para evaluar de una sola vez las respuestas de toda una clase.
+    Las respuestas idénticas se evalúan una sola vez y las distintas se envían
+    a OpenAI en paralelo, con como máximo EVALUATE_BATCH_CONCURRENCY a la vez.
+    Un fallo en un elemento no detiene el resto del lote.
+
+    Args:
+        request (BatchEvaluationRequest): La lista de elementos a evaluar (como máximo
+                                          EVALUATE_BATCH_MAX_ITEMS; si hay más, FastAPI
+                                          responde 422 sin evaluar ninguno).
+
+    Returns:
+        StreamingResponse: Un flujo 'application/x-ndjson' con un resultado por línea.
+    """
+    semaphore = asyncio.Semaphore(BATCH_CONCURRENCY)
+
+    async def evaluate(item: EvaluationRequest) -> dict:
+        async with semaphore:
+            # El plazo empieza a contar al salir de la cola del lote, como una evaluación individual.
+            with resilience.deadline(EVALUATE_DEADLINE):
+                return await _get_feedback(item.student_text, item.reference_text)
+
+    # 1. Deduplicación: las respuestas idénticas (tras normalizar los espacios)
+    # comparten una única tarea.
+    # Las tareas se crean dentro de `bulk()`: en el planificador de OpenAI, las
+    # evaluaciones individuales de los estudiantes pasan por delante del lote.
+    tasks = {}
+    item_keys = []
+    with upstream_scheduler.bulk():
+        for item in request.items:
+            key = (normalize_text(item.student_text), normalize_text(item.reference_text))
+            if key not in tasks:
+                tasks[key] = asyncio.ensure_future(evaluate(item))
+            item_keys.append(key)
+
+    async def lines():
+        try:
+            # 2. Se recorren los elementos en el orden de entrada; cada línea se envía
+            # en cuanto su evaluación termina, mientras las demás siguen en curso.
+            for index, (item, key) in enumerate(zip(request.items, item_keys)):
+                try:
+                    response = _build_response(await tasks[key], item.student_text)
+                    error = response.feedback if response.evaluation == "Error" else None
+                    result = BatchEvaluationResult(index=index, result=response, error=error)
+                except Exception as e:
+                    result = BatchEvaluationResult(index=index, error=f"{type(e).__name__}: {e}")
+                yield json.dumps(jsonable_encoder(result), ensure_ascii=False) + "\n"
+        finally:
+            # Si el cliente se desconecta, se cancelan las evaluaciones pendientes.
+            for task in tasks.values():
+                task.cancel()
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
@@ -1,17 +1,27 @@
 # app/routers/exercise.py
 
 # --- Importaciones Necesarias ---
-import random  # Para seleccionar elementos de forma aleatoria.
-import os      # Para interactuar con el sistema operativo, como listar archivos de un directorio.
-from fastapi import APIRouter
+import os
+from typing import Literal, Optional
+from fastapi import APIRouter, HTTPException, Query
 from pydantic import BaseModel
 
-# Importa el servicio que contiene la lógica para describir imágenes.
+# Importa el servicio de BLIP para saber si el modelo ya está cargado.
 from app.services import blip_service
+# Importa el almacén de descripciones precalculadas (usa BLIP solo si la imagen no está guardada).
+from app.services import caption_store
+# Importa el índice en memoria de las imágenes, que reparte un mazo barajado por cliente.
+from app.services.image_index import index as image_index
+# Importa el servicio de variantes redimensionadas (WebP/JPEG) de las imágenes.
+from app.services import image_variants
+from app.services.metrics import BLIP_REJECTED
 
 # Crea una instancia de APIRouter para agrupar las rutas de esta sección.
 router = APIRouter()
 
+# Segundos que se indica al cliente que espere cuando la cola de BLIP está llena.
+QUEUE_FULL_RETRY_AFTER = os.getenv("BLIP_QUEUE_RETRY_AFTER_SECONDS", "5")
+
 # --- Modelo de Datos para la Respuesta ---
 class NewExerciseResponse(BaseModel):
     """
@@ -25,22 +35,67 @@ class NewExerciseResponse(BaseModel):
 # Define un endpoint en la ruta "/exercise/new" que responde a peticiones GET.
 # 'response_model' asegura que la respuesta se ajuste al modelo NewExerciseResponse.
 @router.get("/exercise/new", response_model=NewExerciseResponse)
-def get_new_exercise():
+async def get_new_exercise(
+    client_id: Optional[str] = None,
+    width: Optional[int] = Query(None, gt=0),
+    format: Literal["webp", "jpeg"] = "webp"
+):
     """
-    Endpoint que selecciona una imagen al azar, genera su descripción
+    Endpoint que selecciona una imagen al azar, obtiene su descripción
     y devuelve ambos datos para crear un nuevo ejercicio.
+
+    Args:
+        client_id (str, opcional): Identificador de la sesión o del estudiante. Si se
+                                   indica, no se repite ninguna imagen hasta haber
+                                   mostrado todas las demás.
+        width (int, opcional): Ancho (en píxeles) en que se mostrará la imagen. Si se
+                               indica, 'image_url' apunta a la variante más pequeña
+                               que lo cubre en vez de al original.
+        format (str): Formato de la variante: "webp" (por defecto) o "jpeg".
     """
-    # 1. Obtiene una lista de todos los nombres de archivo en el directorio 'images'.
-    image_files = os.listdir("images")
-    # Elige un nombre de archivo de la lista de forma aleatoria.
-    random_image_name = random.choice(image_files)
+    # 1. Toma la siguiente imagen del índice en memoria (sin listar el directorio).
+    try:
+        random_image_name = image_index.draw(client_id)
+    except LookupError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+
+    # 2. Obtiene la descripción desde el almacén precalculado. Solo si la imagen
+    # no está guardada (o cambió) se ejecuta BLIP en vivo.
+    # Si la cola de inferencia está llena, se responde 503 de inmediato en vez de
+    # hacer esperar al estudiante detrás de todas las peticiones pendientes. La espera
+    # de BLIP es asíncrona: no retiene ningún hilo del servidor.
+    try:
+        description = await caption_store.get_or_describe_async(random_image_name)
+    except blip_service.QueueFullError:
+        BLIP_REJECTED.inc()
+        raise HTTPException(
+            status_code=503,
+            detail="El servicio de descripciones está saturado. Inténtalo de nuevo en unos segundos.",
+            headers={"Retry-After": QUEUE_FULL_RETRY_AFTER}
+        )
 
-    # 2. Llama al servicio de BLIP para que genere una descripción para la imagen seleccionada.
-    description = blip_service.describe_image(random_image_name)
+    # Si la imagen no estaba guardada y el modelo no está listo, no hay descripción
+    # posible. Si la carga falló, reintentar no sirve: se responde 503 sin Retry-After.
+    # Si todavía se está cargando, se pide al cliente que reintente más tarde.
+    if not blip_service.is_ready() and description.startswith("Error"):
+        if blip_service.get_status()["state"] == "error":
+            raise HTTPException(
+                status_code=503,
+                detail="El modelo BLIP no pudo cargarse; no se pueden generar descripciones nuevas.",
+            )
+        raise HTTPException(
+            status_code=503,
+            detail="El modelo BLIP todavía se está cargando. Inténtalo de nuevo en unos segundos.",
+            headers={"Retry-After": "10"}
+        )
 
     # 3. Construye y devuelve la respuesta utilizando el modelo Pydantic.
-    # La URL se formatea para apuntar al endpoint de archivos estáticos.
+    # La URL apunta a la variante del ancho pedido o, si no se pidió un ancho (o la
+    # variante aún no se generó), al original en el endpoint de archivos estáticos.
+    image_url = None
+    if width is not None:
+        image_url = image_variants.variant_url(random_image_name, width, format)
     return NewExerciseResponse(
-        image_url=f"/static/{random_image_name}",
+        image_url=image_url or f"/static/{random_image_name}",
         reference_text=description
     )
\ No newline at end of file
@@ -0,0 +1,70 @@
+# Importa la clase APIRouter de FastAPI y la respuesta JSON con código de estado personalizado.
+from fastapi import APIRouter
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+# Importa el modelo Pydantic de la respuesta.
+from app.schemas.health import ReadinessResponse
+# Importa el servicio de BLIP para consultar el estado del modelo y los circuit breakers de cada proveedor.
+from app.services import blip_service, openai_service, resilience
+# Importa los planificadores de las llamadas a OpenAI y Gemini.
+from app.services.upstream_scheduler import gemini_scheduler, openai_scheduler
+
+# Crea una instancia de APIRouter.
+router = APIRouter()
+
+# Endpoint de vida (liveness): responde siempre que el proceso esté en marcha.
+@router.get("/health/live")
+def liveness():
+    """
+    Indica que el proceso de la API está vivo, aunque el modelo siga cargando.
+    """
+    return {"status": "alive"}
+
+# Endpoint de disponibilidad (readiness): devuelve 200 solo cuando el modelo BLIP está listo.
+# Mientras carga (o si la carga falló) devuelve 503, para que un balanceador de carga
+# no envíe ejercicios a esta instancia todavía.
+@router.get("/health/ready", response_model=ReadinessResponse)
+def readiness():
+    """
+    Informa del estado del modelo BLIP.
+
+    Returns:
+        ReadinessResponse: El estado general y el detalle del modelo.
+    """
+    model_status = blip_service.get_status()
+    if blip_service.is_ready():
+        status = "ready"
+    elif model_status["state"] == "error":
+        status = "error"
+    else:
+        status = "loading"
+
+    response = ReadinessResponse(status=status, model=model_status)
+    return JSONResponse(
+        status_code=200 if status == "ready" else 503,
+        content=jsonable_encoder(response)
+    )
+
+# Endpoint con los contadores de las cachés de respuestas de OpenAI.
+@router.get("/health/cache")
+def cache_stats():
+    """
+    Devuelve los aciertos, fallos y tamaño de cada caché de respuestas.
+    """
+    return {
+        "evaluate": openai_service.feedback_cache.stats(),
+        "quiz": openai_service.gift_cache.stats(),
+    }
+
+# Endpoint con el estado de los planificadores de llamadas a los servicios externos.
+@router.get("/health/upstream")
+def upstream_stats():
+    """
+    Devuelve, por proveedor, el límite de concurrencia actual, las llamadas en curso y
+    en espera, y el estado de su circuit breaker.
+    """
+    return {
+        "openai": {**openai_scheduler.stats(), "circuit": resilience.openai_breaker.stats()},
+        "gemini": {**gemini_scheduler.stats(), "circuit": resilience.gemini_breaker.stats()},
+        "youtube": {"circuit": resilience.youtube_breaker.stats()},
+    }
@@ -0,0 +1,56 @@
+# Importa la clase APIRouter de FastAPI y las respuestas para archivos.
+from fastapi import APIRouter, HTTPException, Request
+from fastapi.responses import FileResponse, Response
+from fastapi.staticfiles import StaticFiles
+# Importa el servicio que genera y localiza las variantes de las imágenes.
+from app.services import image_variants
+
+# Crea una instancia de APIRouter.
+router = APIRouter()
+
+# Las variantes se nombran con el hash del contenido: una URL nunca cambia de
+# contenido, así que el navegador puede guardarla un año sin volver a preguntar.
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+# Los originales de /static conservan su nombre aunque cambie el archivo, así que
+# se guardan menos tiempo y se revalidan con su ETag.
+STATIC_CACHE_CONTROL = "public, max-age=86400"
+
+MEDIA_TYPES = {"webp": "image/webp", "jpeg": "image/jpeg"}
+
+
+class CachedStaticFiles(StaticFiles):
+    """
+    StaticFiles que añade la cabecera Cache-Control a los archivos originales.
+    (StaticFiles ya envía ETag y responde 304 si el navegador tiene la versión actual.)
+    """
+
+    async def get_response(self, path, scope):
+        response = await super().get_response(path, scope)
+        if response.status_code in (200, 304):
+            response.headers["Cache-Control"] = STATIC_CACHE_CONTROL
+        return response
+
+
+# Define un endpoint que sirve las variantes redimensionadas de las imágenes.
+@router.get("/media/{filename}")
+def get_image_variant(filename: str, request: Request):
+    """
+    Sirve una variante (WebP o JPEG) de una imagen con ETag y caché inmutable.
+
+    Args:
+        filename (str): El nombre de la variante, ej: "3fa4c1d2e5b6a7f8-640.webp".
+
+    Returns:
+        FileResponse: El archivo, o una respuesta 304 si el navegador ya lo tiene.
+    """
+    path = image_variants.resolve(filename)
+    if path is None:
+        raise HTTPException(status_code=404, detail="Variante no encontrada.")
+
+    # El nombre ya identifica el contenido, así que sirve directamente como ETag.
+    etag = f'"{filename}"'
+    headers = {"ETag": etag, "Cache-Control": IMMUTABLE_CACHE_CONTROL}
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=headers)
+    media_type = MEDIA_TYPES[filename.rsplit(".", 1)[1]]
+    return FileResponse(path, media_type=media_type, headers=headers)
@@ -0,0 +1,18 @@
+# Importa la clase APIRouter de FastAPI y la respuesta de texto plano.
+from fastapi import APIRouter, Response
+# Importa el servicio que genera el texto de las métricas.
+from app.services import metrics
+
+# Crea una instancia de APIRouter.
+router = APIRouter()
+
+# Endpoint de métricas en el formato de texto de Prometheus.
+# Lo consulta periódicamente el servidor de Prometheus (no está pensado para Moodle).
+@router.get("/metrics", include_in_schema=False)
+def prometheus_metrics():
+    """
+    Devuelve las latencias por ruta, las peticiones en curso, los tiempos de BLIP,
+    las llamadas a OpenAI/Gemini/YouTube, los tokens consumidos y los aciertos de las cachés.
+    """
+    content, content_type = metrics.render()
+    return Response(content=content, media_type=content_type)
@@ -1,18 +1,30 @@
+import os
 # Importa la clase APIRouter para crear un conjunto de rutas modular.
 from fastapi import APIRouter
+# Respuesta que se va enviando al cliente a medida que se genera.
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import StreamingResponse
 # Importa los modelos Pydantic para la solicitud y la respuesta.
 from app.schemas.quiz import GiftRequest, GiftResponse
-# Importa el servicio que se comunica con la API de OpenAI.
-from app.services import openai_service
+# Importa el servicio que se comunica con la API de OpenAI y el banco de
+# cuestionarios pregenerados para las descripciones del corpus.
+from app.services import openai_service, quiz_bank, resilience
+# Utilidades para separar preguntas GIFT y formatear eventos SSE.
+from app.services.gift import GiftStreamParser, split_questions
+from app.services.sse import SSE_HEADERS, format_error, format_event
 
 # Crea una instancia de APIRouter.
 router = APIRouter()
 
+# Segundos que puede tardar la generación en vivo de un cuestionario (incluidos los
+# reintentos); al superarlos se devuelve la pregunta GIFT de error.
+QUIZ_DEADLINE = float(os.getenv("QUIZ_DEADLINE_SECONDS", "60"))
+
 # Define un endpoint en la ruta "/quiz/generate" que responde a peticiones POST.
 # 'response_model=GiftResponse' asegura que la respuesta de la API tendrá
 # la estructura definida en el modelo GiftResponse.
 @router.post("/quiz/generate", response_model=GiftResponse)
-def create_gift_quiz(request: GiftRequest):
+async def create_gift_quiz(request: GiftRequest):
     """
     Endpoint para generar un cuestionario en formato GIFT a partir de la
     descripción de una imagen.
@@ -24,12 +36,64 @@ def create_gift_quiz(request: GiftRequest):
     Returns:
         GiftResponse: Un objeto JSON con el texto del cuestionario en formato GIFT.
     """
-    # Llama a la función del servicio de OpenAI, pasándole la descripción
-    # de la imagen que viene en la solicitud.
-    gift_formatted_text = openai_service.generate_gift_questions(
-        image_description=request.image_description
-    )
-    
+    # Si la descripción es la de una imagen del corpus, se sirve al instante una de
+    # las variantes pregeneradas y ya validadas.
+    gift_formatted_text = quiz_bank.get_variant(request.image_description)
+    if gift_formatted_text is None:
+        # Descripción desconocida: se llama a OpenAI en vivo.
+        # `await` deja libre el bucle de eventos mientras OpenAI responde.
+        with resilience.deadline(QUIZ_DEADLINE):
+            gift_formatted_text = await openai_service.generate_gift_questions(
+                image_description=request.image_description
+            )
+
     # Crea una instancia del modelo de respuesta con el texto GIFT obtenido
     # y la devuelve para que FastAPI la envíe como respuesta JSON.
-    return GiftResponse(gift_text=gift_formatted_text)
\ No newline at end of file
+    return GiftResponse(gift_text=gift_formatted_text)
+
+
+# Versión en streaming del endpoint anterior, con Server-Sent Events (SSE).
+# Emite un evento "question" por cada pregunta GIFT en cuanto está completa y,
+# al final, un evento "done" con el mismo contenido que devolvería /quiz/generate. Si
+# OpenAI falla con el stream ya empezado, se envía un evento "error" en vez de "done".
+@router.post("/quiz/generate/stream")
+async def stream_gift_quiz(request: GiftRequest):
+    """
+    Endpoint para generar un cuestionario GIFT enviando cada pregunta en cuanto
+    el modelo termina de escribirla.
+
+    Args:
+        request (GiftRequest): El cuerpo de la solicitud, que debe contener
+                               una 'image_description'.
+
+    Returns:
+        StreamingResponse: Un flujo 'text/event-stream' con eventos "question" y "done"
+                           (o "error" en vez de "done" si OpenAI falla a mitad del stream).
+    """
+    async def events():
+        # Con una variante del banco todas las preguntas están disponibles de inmediato.
+        variant = quiz_bank.get_variant(request.image_description)
+        if variant is not None:
+            for question in split_questions(variant):
+                yield format_event("question", {"question": question})
+            yield format_event("done", jsonable_encoder(GiftResponse(gift_text=variant)))
+            return
+
+        parser = GiftStreamParser()
+        parts = []
+        try:
+            with resilience.deadline(QUIZ_DEADLINE):
+                async for piece in openai_service.stream_gift_questions(request.image_description):
+                    parts.append(piece)
+                    for question in parser.feed(piece):
+                        yield format_event("question", {"question": question})
+        except Exception:
+            # El servicio ya registró el error; lo recibido está incompleto y no hay "done".
+            yield format_error()
+            return
+        for question in parser.flush():
+            yield format_event("question", {"question": question})
+        # El evento final es compatible con GiftResponse.
+        yield format_event("done", jsonable_encoder(GiftResponse(gift_text="".join(parts))))
+
+    return StreamingResponse(events(), media_type="text/event-stream", headers=SSE_HEADERS)
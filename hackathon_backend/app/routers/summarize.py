@@ -1,14 +1,27 @@
+import os
 # Importa la clase APIRouter de FastAPI para crear un conjunto de rutas modular.
-from fastapi import APIRouter
+from fastapi import APIRouter, HTTPException, Response
+# Respuesta que se va enviando al cliente a medida que se genera.
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import StreamingResponse
 # Importa los modelos Pydantic para validar la solicitud y estructurar la respuesta.
-from app.schemas.summarize import SummarizeRequest, SummarizeResponse
-# Importa el servicio que contiene la lógica para resumir videos.
-from app.services import summarize_service
+from app.schemas.summarize import SummarizeRequest, SummarizeResponse, SummaryJobResponse
+# Importa el servicio que contiene la lógica para resumir videos y el gestor de
+# trabajos de resumen en segundo plano.
+from app.services import resilience, summarize_service, summary_jobs
+# Utilidad para formatear eventos SSE.
+from app.services.sse import SSE_HEADERS, format_error, format_event
 
 # Crea una instancia de APIRouter. Todas las rutas definidas aquí
 # se podrán incluir en la aplicación principal de FastAPI.
 router = APIRouter()
 
+# Segundos que se indica al cliente que espere cuando la cola de trabajos está llena.
+JOBS_RETRY_AFTER = os.getenv("SUMMARY_JOB_RETRY_AFTER_SECONDS", "30")
+# Segundos que puede tardar un resumen en vivo (transcripción, fragmentos y paso final);
+# al superarlos se devuelve el mensaje de error. Los videos largos deben usar /summarize/jobs.
+SUMMARIZE_DEADLINE = float(os.getenv("SUMMARIZE_DEADLINE_SECONDS", "180"))
+
 # Define un endpoint en la ruta "/summarize" que responde a peticiones POST.
 # 'response_model=SummarizeResponse' le dice a FastAPI que la respuesta
 # debe tener la estructura del modelo SummarizeResponse. Esto es útil para
@@ -27,8 +40,90 @@ async def get_video_summary(request: SummarizeRequest):
     """
     # Llama a la función del servicio de resumen, pasándole la URL del video
     # que viene en el cuerpo de la solicitud.
-    summary = summarize_service.summarize_youtube_video(request.video_url)
+    # El servicio es asíncrono: mientras espera a YouTube y Gemini, el bucle de eventos
+    # sigue atendiendo otras peticiones.
+    with resilience.deadline(SUMMARIZE_DEADLINE):
+        summary = await summarize_service.summarize_youtube_video(request.video_url)
     
     # Crea una instancia del modelo de respuesta con el resumen obtenido
     # y la devuelve. FastAPI se encargará de convertirla a JSON.
-    return SummarizeResponse(summary_text=summary)
\ No newline at end of file
+    return SummarizeResponse(summary_text=summary)
+
+
+# Versión en streaming del endpoint anterior, con Server-Sent Events (SSE).
+# Emite un evento "token" por cada fragmento de texto que genera Gemini y, al final,
+# un evento "done" con el mismo contenido que devolvería /summarize. Si Gemini falla
+# con el stream ya empezado, se envía un evento "error" en vez de "done".
+@router.post("/summarize/stream")
+async def stream_video_summary(request: SummarizeRequest):
+    """
+    Endpoint para resumir un video de YouTube enviando el resumen a medida que se genera.
+
+    Args:
+        request (SummarizeRequest): El cuerpo de la solicitud, que debe contener
+                                    una 'video_url'.
+
+    Returns:
+        StreamingResponse: Un flujo 'text/event-stream' con eventos "token" y "done"
+                           (o "error" en vez de "done" si Gemini falla a mitad del stream).
+    """
+    async def events():
+        parts = []
+        try:
+            with resilience.deadline(SUMMARIZE_DEADLINE):
+                async for piece in summarize_service.stream_youtube_summary(request.video_url):
+                    parts.append(piece)
+                    yield format_event("token", {"text": piece})
+        except Exception:
+            # El servicio ya registró el error; lo recibido está incompleto y no hay "done".
+            yield format_error()
+            return
+        # El evento final es compatible con SummarizeResponse.
+        yield format_event("done", jsonable_encoder(SummarizeResponse(summary_text="".join(parts))))
+
+    return StreamingResponse(events(), media_type="text/event-stream", headers=SSE_HEADERS)
+
+
+# Trabajos de resumen en segundo plano: el cliente recibe un id al instante (202) y
+# consulta el estado y el resultado con GET /summarize/jobs/{job_id}.
+@router.post("/summarize/jobs", response_model=SummaryJobResponse, status_code=202)
+async def create_summary_job(request: SummarizeRequest, response: Response):
+    """
+    Endpoint para encargar el resumen de un video sin esperar a que termine.
+    Si ya hay un trabajo en marcha para el mismo video, se devuelve ese mismo.
+
+    Args:
+        request (SummarizeRequest): El cuerpo de la solicitud, que debe contener
+                                    una 'video_url'.
+
+    Returns:
+        SummaryJobResponse: El trabajo, con su id y su estado actual.
+    """
+    try:
+        job, _ = await summary_jobs.manager.submit(request.video_url)
+    except summary_jobs.JobQueueFullError:
+        raise HTTPException(
+            status_code=503,
+            detail="Hay demasiados resúmenes en cola. Inténtalo de nuevo más tarde.",
+            headers={"Retry-After": JOBS_RETRY_AFTER}
+        )
+    response.headers["Location"] = f"/api/summarize/jobs/{job.id}"
+    return SummaryJobResponse(**job.to_dict())
+
+
+@router.get("/summarize/jobs/{job_id}", response_model=SummaryJobResponse)
+async def get_summary_job(job_id: str):
+    """
+    Endpoint para consultar el estado de un trabajo de resumen y, cuando termina,
+    su resultado.
+
+    Args:
+        job_id (str): El id devuelto por POST /summarize/jobs.
+
+    Returns:
+        SummaryJobResponse: El trabajo con su estado y, si terminó, el resumen o el error.
+    """
+    job = await summary_jobs.manager.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="El trabajo no existe o ya caducó.")
+    return SummaryJobResponse(**job.to_dict())
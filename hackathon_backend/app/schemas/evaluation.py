@@ -1,5 +1,11 @@
 # Importa la clase base 'BaseModel' de Pydantic para crear modelos de datos.
-from pydantic import BaseModel
+import os
+from typing import List, Optional
+from pydantic import BaseModel, Field
+
+# Número máximo de elementos de una evaluación por lotes. Un lote más grande se
+# rechaza con 422: cada elemento puede suponer una llamada a OpenAI.
+BATCH_MAX_ITEMS = int(os.getenv("EVALUATE_BATCH_MAX_ITEMS", "200"))
 
 # --- Modelo para la Solicitud de Evaluación (Request) ---
 class EvaluationRequest(BaseModel):
@@ -23,4 +29,25 @@ class EvaluationResponse(BaseModel):
     # La retroalimentación en texto para el estudiante.
     feedback: str
     # El texto del estudiante con las correcciones aplicadas.
-    corrected_text: str
\ No newline at end of file
+    corrected_text: str
+
+# --- Modelos para la Evaluación por Lotes (Batch) ---
+class BatchEvaluationRequest(BaseModel):
+    """
+    Define la estructura de una solicitud para evaluar de una sola vez las
+    respuestas de toda una clase.
+    """
+    # La lista de respuestas a evaluar, cada una con su texto de referencia.
+    items: List[EvaluationRequest] = Field(..., max_length=BATCH_MAX_ITEMS)
+
+class BatchEvaluationResult(BaseModel):
+    """
+    Define cada línea de la respuesta por lotes (una por elemento de la
+    solicitud, en el mismo orden).
+    """
+    # La posición del elemento en la lista 'items' de la solicitud.
+    index: int
+    # La evaluación del elemento (ausente si falló por completo).
+    result: Optional[EvaluationResponse] = None
+    # La descripción del error, si la evaluación de este elemento falló.
+    error: Optional[str] = None
@@ -0,0 +1,34 @@
+# Importa la clase base 'BaseModel' de la librería Pydantic.
+from typing import Dict, List, Optional
+from pydantic import BaseModel
+
+# --- Modelo para el Estado del Modelo BLIP ---
+class ModelStatus(BaseModel):
+    """
+    Describe el estado de carga del modelo BLIP.
+    """
+    # "not_loaded", "loading", "warming_up", "ready" o "error".
+    state: str
+    # El backend de inferencia: "eager", "quantized" u "onnx".
+    backend: str
+    # El mensaje del error de carga, si lo hubo.
+    error: Optional[str] = None
+    # Segundos que tardaron la carga y el calentamiento del modelo.
+    load_seconds: Optional[float] = None
+    # Con procesos dedicados (BLIP_WORKERS > 0): cuántos tienen el modelo cargado.
+    workers_ready: Optional[int] = None
+    # Con procesos dedicados: descripciones en cola o en curso.
+    pending: Optional[int] = None
+    # Memoria (MB: rss, uss y pss) de cada proceso que tiene el modelo cargado.
+    memory_mb: Optional[List[Dict[str, float]]] = None
+
+# --- Modelo para la Respuesta de Disponibilidad (Readiness) ---
+class ReadinessResponse(BaseModel):
+    """
+    Define la respuesta del endpoint de disponibilidad, que indica si la API
+    puede atender todas sus funcionalidades.
+    """
+    # "ready" si todo está listo, "loading" o "error" en caso contrario.
+    status: str
+    # El estado detallado del modelo BLIP.
+    model: ModelStatus
@@ -1,4 +1,5 @@
 # Importa la clase base 'BaseModel' de la librería Pydantic.
+from typing import Optional
 from pydantic import BaseModel
 
 # --- Modelo para la Solicitud (Request) ---
@@ -19,4 +20,23 @@ class SummarizeResponse(BaseModel):
     """
     # La respuesta contendrá un campo llamado 'summary_text', que será una cadena de texto.
     # Esto asegura que la respuesta de la API sea consistente.
-    summary_text: str
\ No newline at end of file
+    summary_text: str
+
+# --- Modelo para los Trabajos de Resumen en Segundo Plano ---
+class SummaryJobResponse(BaseModel):
+    """
+    Define el estado de un trabajo de resumen (ver POST /summarize/jobs).
+    """
+    # El identificador del trabajo, para consultarlo en GET /summarize/jobs/{job_id}.
+    job_id: str
+    # "queued", "running", "done" o "failed".
+    status: str
+    # La URL del video que se está resumiendo.
+    video_url: str
+    # El resumen, cuando el trabajo termina correctamente.
+    summary_text: Optional[str] = None
+    # El mensaje de error, si el trabajo falló.
+    error: Optional[str] = None
+    # Marcas de tiempo (segundos desde epoch) de creación y de fin del trabajo.
+    created_at: float
+    finished_at: Optional[float] = None
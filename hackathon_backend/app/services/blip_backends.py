@@ -0,0 +1,177 @@
+# app/services/blip_backends.py
+
+# --- Backends de Inferencia para BLIP en CPU ---
+# Hay tres formas de ejecutar el mismo modelo, que se eligen con BLIP_BACKEND:
+#
+# - "eager":     PyTorch normal (float32). Es la referencia.
+# - "quantized": PyTorch con cuantización dinámica int8 de las capas lineales.
+#                Menos memoria y multiplicaciones más rápidas en CPU, con una
+#                pequeña variación en las descripciones.
+# - "onnx":      El codificador de imagen (ViT, la parte más costosa por imagen)
+#                se exporta una vez a ONNX y se ejecuta con ONNX Runtime; el
+#                decodificador de texto sigue en PyTorch dentro de `generate`.
+#
+# Los tres parten de los mismos pesos, que por defecto se abren con memoria mapeada
+# desde un archivo safetensors (ver model_weights.py) y se comparten entre procesos.
+# Con "quantized" las capas lineales se recalculan en int8 y esas copias sí son
+# propias de cada proceso.
+#
+# torch, transformers y onnxruntime se importan dentro de las funciones porque
+# importarlos tarda varios segundos y no todos los backends los necesitan.
+
+import logging # Para registrar la exportación del modelo.
+import os      # Para leer la configuración y crear la carpeta del modelo exportado.
+
+from app.services import model_weights
+
+logger = logging.getLogger(__name__)
+
+# Nombres válidos de backend.
+BACKENDS = ("eager", "quantized", "onnx")
+# Archivo donde se guarda el codificador de imagen exportado a ONNX.
+ONNX_VISION_PATH = os.getenv("BLIP_ONNX_VISION_PATH", "cache/onnx/blip_vision.onnx")
+# Si es "1" (por defecto), los pesos se abren con memoria mapeada desde safetensors.
+MMAP_WEIGHTS = os.getenv("BLIP_MMAP_WEIGHTS", "1") == "1"
+
+
+def configure_threads(num_threads) -> None:
+    """
+    Fija el número de hilos que usa PyTorch dentro de cada operación (intra-op).
+
+    Args:
+        num_threads (int | None): El número de hilos; None deja el valor por defecto.
+    """
+    import torch
+    if num_threads:
+        torch.set_num_threads(int(num_threads))
+
+
+def _load_eager(model_path: str):
+    """
+    Carga el procesador y el modelo en PyTorch (float32).
+    """
+    from transformers import BlipProcessor, BlipForConditionalGeneration # Clases de la librería Hugging Face para el modelo BLIP.
+
+    if MMAP_WEIGHTS:
+        # Pesos compartidos entre procesos: se convierte el checkpoint la primera vez y
+        # después cada proceso solo mapea el archivo (sin leerlo ni copiarlo).
+        directory = model_weights.ensure_safetensors(model_path)
+        processor = BlipProcessor.from_pretrained(directory)
+        model = model_weights.load_model_mmap(BlipForConditionalGeneration, directory)
+        return processor, model
+
+    # Carga el 'procesador', que prepara las imágenes para el modelo (cambia tamaño, normaliza, etc.).
+    processor = BlipProcessor.from_pretrained(model_path)
+    # Carga el modelo de generación de texto condicional, que es el "cerebro" que crea la descripción.
+    model = BlipForConditionalGeneration.from_pretrained(model_path)
+    model.eval()
+    return processor, model
+
+
+def load_processor(model_path: str):
+    """
+    Carga solo el procesador (tokenizador y preprocesado de imágenes), sin el modelo.
+    """
+    from transformers import BlipProcessor
+    return BlipProcessor.from_pretrained(model_path)
+
+
+def _load_quantized(model_path: str):
+    """
+    Carga el modelo y cuantiza dinámicamente a int8 todas sus capas lineales.
+    """
+    import torch
+    processor, model = _load_eager(model_path)
+    # inplace=True: sin él, quantize_dynamic hace una copia profunda del modelo y todos
+    # los pesos mapeados en memoria pasarían a memoria privada de cada proceso. Así solo
+    # las capas lineales (ya cuantizadas) son privadas; el resto sigue compartido.
+    model = torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8, inplace=True)
+    model.eval()
+    return processor, model
+
+
+def _export_vision_model(model, image_size: int, path: str) -> None:
+    """
+    Exporta el codificador de imagen a ONNX, con el tamaño del lote dinámico.
+    """
+    import torch
+
+    class VisionEncoder(torch.nn.Module):
+        # Envoltorio que devuelve solo el tensor de salida, como espera ONNX.
+        def __init__(self, vision_model):
+            super().__init__()
+            self.vision_model = vision_model
+
+        def forward(self, pixel_values):
+            return self.vision_model(pixel_values=pixel_values, return_dict=False)[0]
+
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    dummy = torch.zeros(1, 3, image_size, image_size)
+    logger.info("Exportando el codificador de imagen a ONNX en %s...", path)
+    torch.onnx.export(
+        VisionEncoder(model.vision_model).eval(),
+        (dummy,),
+        path,
+        input_names=["pixel_values"],
+        output_names=["last_hidden_state"],
+        dynamic_axes={"pixel_values": {0: "batch"}, "last_hidden_state": {0: "batch"}},
+        opset_version=17,
+    )
+
+
+def _load_onnx(model_path: str, num_threads=None):
+    """
+    Carga el modelo y sustituye su codificador de imagen por una sesión de
+    ONNX Runtime. El codificador se exporta la primera vez; para volver a
+    exportarlo (ej. tras cambiar el modelo) basta con borrar el archivo .onnx.
+    """
+    import torch
+    import onnxruntime as ort
+
+    processor, model = _load_eager(model_path)
+    if not os.path.exists(ONNX_VISION_PATH):
+        image_size = processor.image_processor.size["height"]
+        _export_vision_model(model, image_size, ONNX_VISION_PATH)
+
+    options = ort.SessionOptions()
+    if num_threads:
+        options.intra_op_num_threads = int(num_threads)
+    options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+    session = ort.InferenceSession(ONNX_VISION_PATH, options, providers=["CPUExecutionProvider"])
+
+    class OnnxVisionModel(torch.nn.Module):
+        # Sustituto del codificador de imagen: `generate` lo llama igual que al original
+        # y solo usa el primer elemento de la salida (los embeddings de la imagen).
+        def forward(self, pixel_values=None, *args, **kwargs):
+            outputs = session.run(None, {"pixel_values": pixel_values.cpu().numpy()})
+            return (torch.from_numpy(outputs[0]),)
+
+    model.vision_model = OnnxVisionModel()
+    return processor, model
+
+
+def load_backend(name: str, model_path: str, num_threads=None):
+    """
+    Carga el procesador y el modelo BLIP con el backend indicado.
+
+    Args:
+        name (str): "eager", "quantized" u "onnx".
+        model_path (str): La carpeta del modelo.
+        num_threads (int | None): Hilos intra-op para PyTorch (y ONNX Runtime).
+
+    Returns:
+        tuple: (procesador, modelo) listos para `generate`.
+
+    Raises:
+        ValueError: Si el nombre del backend no es válido.
+    """
+    if name not in BACKENDS:
+        raise ValueError(f"Backend de BLIP desconocido: '{name}'. Opciones: {', '.join(BACKENDS)}.")
+    configure_threads(num_threads)
+    if name == "quantized":
+        return _load_quantized(model_path)
+    if name == "onnx":
+        return _load_onnx(model_path, num_threads)
+    return _load_eager(model_path)
@@ -1,68 +1,438 @@
 # app/services/blip_service.py
 
 # --- Importaciones Necesarias ---
+import asyncio   # Para esperar las descripciones desde los endpoints asíncronos sin ocupar un hilo.
+import logging   # Para registrar la carga del modelo y los lotes generados.
+import os        # Para leer la configuración desde variables de entorno.
+import queue     # Cola segura entre hilos donde se acumulan las peticiones pendientes.
+import threading # El motor de lotes se ejecuta en un hilo dedicado.
+import time      # Para medir la ventana de espera de cada lote.
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError # Resultado de cada llamador.
 from PIL import Image # Python Imaging Library (Pillow) para abrir y manipular imágenes.
-from transformers import BlipProcessor, BlipForConditionalGeneration # Clases de la librería Hugging Face para el modelo BLIP.
-import torch # PyTorch, aunque no se usa explícitamente en el código, es la base de transformers.
 
-# --- Carga del Modelo al Iniciar (se hace una sola vez) ---
-# Esta sección de código se ejecuta una única vez cuando el servicio se importa por primera vez.
-# Cargar el modelo en memoria al inicio evita tener que cargarlo en cada petición, lo que sería muy lento.
+# Backends de inferencia disponibles (PyTorch, PyTorch cuantizado u ONNX Runtime).
+from app.services import blip_backends
+# Caché de tensores ya preprocesados, mapeada en memoria.
+from app.services import pixel_cache
+# Memoria del proceso (los pesos mapeados se comparten entre procesos).
+from app.services.model_weights import memory_usage
+# Procesos dedicados de inferencia y cola acotada (con rechazo cuando está llena).
+from app.services.blip_workers import QueueFullError, WorkerPool, collect_batch
+# Métricas de Prometheus (tiempos de preprocesado e inferencia, tamaño de los lotes).
+from app.services.metrics import record_blip_batch
+
+logger = logging.getLogger(__name__)
+
+# --- Estado del Modelo (carga diferida) ---
+# El modelo NO se carga al importar este módulo: importar `main.py` debe ser inmediato
+# para que los endpoints que no usan BLIP (/evaluate, /quiz/generate, /summarize)
+# atiendan peticiones desde el primer momento. La carga la lanza `main.py` en segundo
+# plano al arrancar, llamando a `load_model()`.
 
 # Define la ruta a la carpeta donde se encuentra el modelo descargado.
-MODEL_PATH = "./model/blip2-frances" 
-print("Cargando modelo BLIP-2 en CPU...")
-try:
-    # Carga el 'procesador', que prepara las imágenes para el modelo (cambia tamaño, normaliza, etc.).
-    processor = BlipProcessor.from_pretrained(MODEL_PATH)
-    # Carga el modelo de generación de texto condicional, que es el "cerebro" que crea la descripción.
-    model = BlipForConditionalGeneration.from_pretrained(MODEL_PATH)
-    print("Modelo cargado exitosamente.")
-except Exception as e:
-    # Si la carga falla (ej. archivos corruptos o ruta incorrecta), se informa del error
-    # y se dejan las variables como None para manejarlo después.
-    print(f"Error crítico al cargar el modelo: {e}")
-    processor = None
-    model = None
-# ---------------------------------------------------------
-
-def describe_image(image_name: str) -> str:
+MODEL_PATH = "./model/blip2-frances"
+# Backend de inferencia: "eager" (por defecto), "quantized" u "onnx". Ver blip_backends.py.
+BACKEND = os.getenv("BLIP_BACKEND", "eager")
+# Hilos intra-op de PyTorch; vacío para usar el valor por defecto (un hilo por núcleo).
+TORCH_THREADS = os.getenv("BLIP_TORCH_THREADS") or None
+
+# Estados posibles del modelo: "not_loaded", "loading", "warming_up", "ready" o "error".
+MODEL_STATE = "not_loaded"
+# Mensaje del error de carga, si lo hubo.
+MODEL_ERROR = None
+# Segundos que tardaron la carga y el calentamiento (útil para diagnosticar arranques lentos).
+LOAD_SECONDS = None
+# Memoria del proceso (MB) tras cargar el modelo: rss, uss (propia) y pss (proporcional).
+MEMORY_MB = None
+
+processor = None
+model = None
+_load_lock = threading.Lock()
+
+# --- Procesos de Inferencia ---
+# Número de procesos dedicados a BLIP. Con 0, el modelo se carga en el propio proceso
+# de la API y los lotes se ejecutan en un hilo (ver CaptionBatcher).
+WORKERS = int(os.getenv("BLIP_WORKERS", "1"))
+# Número máximo de descripciones pendientes (en cola o en curso); las siguientes se rechazan.
+QUEUE_MAX_SIZE = int(os.getenv("BLIP_QUEUE_MAX_SIZE", "32"))
+# Segundos que espera una petición su descripción antes de darse por perdida.
+REQUEST_TIMEOUT = float(os.getenv("BLIP_REQUEST_TIMEOUT_SECONDS", "120"))
+
+# El grupo de procesos, si se arrancó con `start_workers()`.
+_pool = None
+
+
+def load_model() -> bool:
+    """
+    Carga el procesador y el modelo BLIP en CPU y ejecuta una inferencia de
+    calentamiento. Es seguro llamarla varias veces: solo carga el modelo una vez.
+
+    Returns:
+        bool: True si el modelo quedó listo, False si la carga falló.
+    """
+    global processor, model, MODEL_STATE, MODEL_ERROR, LOAD_SECONDS, MEMORY_MB
+    with _load_lock:
+        if MODEL_STATE == "ready":
+            return True
+
+        MODEL_STATE = "loading"
+        MODEL_ERROR = None
+        started = time.monotonic()
+        logger.info("Cargando modelo BLIP-2 en CPU (backend '%s')...", BACKEND)
+        try:
+            # Carga el procesador y el modelo con el backend configurado.
+            loaded_processor, loaded_model = blip_backends.load_backend(BACKEND, MODEL_PATH, TORCH_THREADS)
+
+            # Calentamiento: la primera inferencia es mucho más lenta (asignación de memoria,
+            # selección de kernels), así que se hace ahora y no con la petición de un estudiante.
+            MODEL_STATE = "warming_up"
+            _caption_images(loaded_processor, loaded_model, [Image.new("RGB", (384, 384))])
+
+            processor, model = loaded_processor, loaded_model
+            # Si existe la caché de tensores preprocesados, se abre (sin leerla entera).
+            pixel_cache.load()
+            MODEL_STATE = "ready"
+            LOAD_SECONDS = round(time.monotonic() - started, 2)
+            MEMORY_MB = memory_usage()
+            logger.info(
+                "Modelo cargado exitosamente en %s s (memoria del proceso %d: %s MB).",
+                LOAD_SECONDS, os.getpid(), MEMORY_MB,
+                extra={"load_seconds": LOAD_SECONDS, "pid": os.getpid(), "memory_mb": MEMORY_MB},
+            )
+            return True
+        except Exception as e:
+            # Si la carga falla (ej. archivos corruptos o ruta incorrecta), se informa del error
+            # y se dejan las variables como None para manejarlo después.
+            logger.exception("Error crítico al cargar el modelo: %s", e)
+            processor = None
+            model = None
+            MODEL_STATE = "error"
+            MODEL_ERROR = str(e)
+            return False
+
+
+def load_processor():
+    """
+    Carga solo el procesador de BLIP (sin el modelo). Lo usa el proceso de la API
+    para preprocesar la caché de tensores cuando el modelo vive en otros procesos.
+    """
+    return processor if processor is not None else blip_backends.load_processor(MODEL_PATH)
+
+
+def start_workers() -> bool:
+    """
+    Lanza WORKERS procesos de inferencia (cada uno carga su propio modelo) y espera
+    a que al menos uno esté listo.
+
+    Returns:
+        bool: True si algún proceso cargó el modelo, False si todos fallaron.
+    """
+    global _pool, MODEL_STATE, MODEL_ERROR, LOAD_SECONDS
+    # Si no se fijó BLIP_TORCH_THREADS, los núcleos se reparten entre los procesos
+    # para que sus hilos de PyTorch no compitan entre sí.
+    threads = TORCH_THREADS or max(1, (os.cpu_count() or 1) // max(1, WORKERS))
+    MODEL_STATE = "loading"
+    MODEL_ERROR = None
+    started = time.monotonic()
+    logger.info("Lanzando %d proceso(s) de inferencia BLIP (backend '%s', %s hilos cada uno)...",
+                WORKERS, BACKEND, threads)
+    pool = WorkerPool(WORKERS, QUEUE_MAX_SIZE, threads)
+    pool.start()
+    _pool = pool
+    if pool.wait_ready():
+        MODEL_STATE = "ready"
+        LOAD_SECONDS = round(time.monotonic() - started, 2)
+        logger.info("Procesos de inferencia listos en %s s.", LOAD_SECONDS, extra={"load_seconds": LOAD_SECONDS})
+        return True
+    MODEL_STATE = "error"
+    MODEL_ERROR = pool.status()["error"]
+    logger.error("Ningún proceso de inferencia pudo cargar el modelo: %s", MODEL_ERROR)
+    return False
+
+
+def set_error(error: Exception) -> None:
+    """
+    Marca la carga del modelo como fallida (la informa /health/ready). La usa el
+    arranque en segundo plano cuando falla fuera de `load_model` o `start_workers`.
+    """
+    global MODEL_STATE, MODEL_ERROR
+    MODEL_STATE = "error"
+    MODEL_ERROR = str(error)
+
+
+def stop_workers() -> None:
+    """Detiene los procesos de inferencia, si se arrancaron."""
+    if _pool is not None:
+        _pool.stop()
+
+
+def is_ready() -> bool:
+    """Indica si el modelo está cargado y puede atender peticiones."""
+    return MODEL_STATE == "ready" and (_pool is None or _pool.ready_workers() > 0)
+
+
+def get_status() -> dict:
+    """
+    Devuelve el estado actual del modelo para el endpoint de salud.
+
+    Returns:
+        dict: El estado, el backend, el error de carga (si lo hubo), el tiempo de carga,
+              la memoria de cada proceso con el modelo y, con procesos dedicados, los
+              procesos listos y las peticiones pendientes.
+    """
+    status = {"state": MODEL_STATE, "backend": BACKEND, "error": MODEL_ERROR, "load_seconds": LOAD_SECONDS}
+    if _pool is not None:
+        pool_status = _pool.status()
+        status["workers_ready"] = pool_status["workers_ready"]
+        status["pending"] = pool_status["pending"]
+        status["memory_mb"] = pool_status["memory_mb"]
+    elif MEMORY_MB is not None:
+        status["memory_mb"] = [MEMORY_MB]
+    return status
+
+
+# --- Configuración del Motor de Lotes (micro-batching) ---
+# Las peticiones concurrentes se agrupan durante unos milisegundos y se ejecutan
+# juntas en una sola llamada a `model.generate`, lo que aumenta el rendimiento en CPU.
+# Tamaño máximo de un lote.
+BATCH_MAX_SIZE = int(os.getenv("BLIP_BATCH_MAX_SIZE", "8"))
+# Tiempo máximo (en milisegundos) que la primera petición de un lote espera a que lleguen otras.
+BATCH_MAX_WAIT_MS = float(os.getenv("BLIP_BATCH_MAX_WAIT_MS", "20"))
+
+
+def _caption_pixels(blip_processor, blip_model, pixel_arrays: list) -> list:
+    """
+    Ejecuta el modelo sobre imágenes ya preprocesadas.
+
+    Args:
+        blip_processor: El procesador de BLIP (para decodificar el texto).
+        blip_model: El modelo de BLIP.
+        pixel_arrays (list): Arrays de numpy de forma (3, alto, ancho).
+
+    Returns:
+        list: Las descripciones generadas, en el mismo orden.
+    """
+    import numpy as np
+    import torch # PyTorch, la base de transformers; ya está importado cuando el modelo se cargó.
+
+    # Paso 2: Apilar las imágenes en un único tensor (batch, canales, alto, ancho).
+    # Con una sola imagen, el tensor apunta directamente a la memoria de la caché (sin copia).
+    if len(pixel_arrays) == 1:
+        pixel_values = torch.from_numpy(pixel_arrays[0][None])
+    else:
+        pixel_values = torch.from_numpy(np.stack(pixel_arrays))
+
+    # Paso 3: Generar las descripciones. Las secuencias más cortas se rellenan (padding)
+    # hasta la longitud de la más larga del lote.
+    # `max_new_tokens` limita la longitud de la descripción para que sea más rápida y concisa.
+    with torch.no_grad():
+        out = blip_model.generate(pixel_values=pixel_values, max_new_tokens=75)
+
+    # Paso 4: Decodificar el resultado. `batch_decode` descarta los tokens de relleno.
+    return blip_processor.batch_decode(out, skip_special_tokens=True)
+
+
+def _caption_images(blip_processor, blip_model, raw_images: list) -> list:
+    """
+    Ejecuta el modelo sobre una lista de imágenes ya abiertas.
+
+    Args:
+        blip_processor: El procesador de BLIP.
+        blip_model: El modelo de BLIP.
+        raw_images (list): Imágenes de Pillow en formato RGB.
+
+    Returns:
+        list: Las descripciones generadas, en el mismo orden.
+    """
+    # El procesador las redimensiona a un tamaño común y las normaliza.
+    pixel_values = blip_processor.image_processor(images=raw_images, return_tensors="np")["pixel_values"]
+    return _caption_pixels(blip_processor, blip_model, list(pixel_values))
+
+
+def _generate_batch(image_names: list, timings: dict = None) -> list:
+    """
+    Genera las descripciones de varias imágenes con una sola llamada al modelo.
+
+    Args:
+        image_names (list): Los nombres de archivo de las imágenes.
+        timings (dict): Si se indica, se rellena con los tiempos y el tamaño del lote en
+                        vez de registrarlos en las métricas. Lo usan los procesos de
+                        inferencia, que los envían a la API junto con las descripciones
+                        (sus propias métricas no se publican en /metrics).
+
+    Returns:
+        list: Una descripción (o un mensaje de error) por cada imagen, en el mismo orden.
+    """
+    record = timings is None
+    timings = {} if timings is None else timings
+    results = [None] * len(image_names)
+
+    # Paso 1: Obtener el tensor de cada imagen desde la caché preprocesada (sin
+    # decodificar ni redimensionar) o, si no está, procesarla en el momento.
+    # Un archivo que falla no debe arruinar el resto del lote.
+    pixel_arrays = []
+    positions = []
+    started = time.perf_counter()
+    for i, image_name in enumerate(image_names):
+        try:
+            pixel_arrays.append(pixel_cache.pixel_values_for(processor, image_name, timings))
+            positions.append(i)
+        except FileNotFoundError:
+            # Maneja el caso en que el archivo de la imagen no se encuentre en la ruta especificada.
+            results[i] = "Erreur: L'image n'a pas été trouvée."
+        except Exception as e:
+            results[i] = f"Erreur lors de la description de l'image: {e}"
+    timings["preprocess_seconds"] = time.perf_counter() - started
+
+    if pixel_arrays:
+        _generate_pixels(image_names, pixel_arrays, positions, results, timings)
+    if record:
+        record_blip_batch(timings)
+    return results
+
+
+def _generate_pixels(image_names: list, pixel_arrays: list, positions: list, results: list, timings: dict) -> None:
+    """
+    Paso 2 de `_generate_batch`: genera las descripciones de los tensores ya
+    preprocesados y las escribe en `results`, en las posiciones indicadas.
+    """
+    try:
+        logger.debug("Generando %d descripción(es) en CPU...", len(pixel_arrays))
+        timings["batch_size"] = len(pixel_arrays)
+        started = time.perf_counter()
+        descriptions = _caption_pixels(processor, model, pixel_arrays)
+        elapsed = time.perf_counter() - started
+        timings["generate_seconds"] = elapsed
+        logger.info(
+            "Lote de %d descripción(es) generado en %.2f s.", len(pixel_arrays), elapsed,
+            extra={"batch_size": len(pixel_arrays), "generate_seconds": round(elapsed, 3)},
+        )
+        for i, description in zip(positions, descriptions):
+            logger.debug("Descripción generada para %s: '%s'", image_names[i], description)
+            results[i] = description
+    except Exception as e:
+        # Captura cualquier otro error que pueda ocurrir durante el proceso.
+        logger.exception("Error generando un lote de descripciones: %s", e)
+        for i in positions:
+            results[i] = f"Erreur lors de la description de l'image: {e}"
+
+
+class CaptionBatcher:
+    """
+    Motor de micro-batching en el propio proceso (BLIP_WORKERS=0): acumula las
+    peticiones concurrentes en una cola y un hilo dedicado las ejecuta por lotes,
+    devolviendo a cada llamador su resultado.
+
+    La latencia añadida a cada petición está acotada por `max_wait_ms`, y el número
+    de peticiones pendientes por `max_pending`.
+    """
+
+    def __init__(self, max_batch_size: int = BATCH_MAX_SIZE, max_wait_ms: float = BATCH_MAX_WAIT_MS,
+                 max_pending: int = QUEUE_MAX_SIZE):
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max(0.0, max_wait_ms) / 1000
+        self.max_pending = max(1, max_pending)
+        self._queue = queue.Queue()
+        self._slots = threading.BoundedSemaphore(self.max_pending)
+        self._thread = None
+        self._start_lock = threading.Lock()
+
+    def submit(self, image_name: str, block: bool = False) -> Future:
+        """
+        Encola una imagen para describirla en el próximo lote.
+
+        Args:
+            image_name (str): El nombre del archivo de la imagen.
+            block (bool): Si es True, espera a que haya sitio en la cola en vez de rechazar la petición.
+
+        Returns:
+            Future: Se completa con la descripción cuando termine su lote.
+
+        Raises:
+            QueueFullError: Si ya hay `max_pending` peticiones pendientes y `block` es False.
+        """
+        if not self._slots.acquire(blocking=block):
+            raise QueueFullError(f"Hay {self.max_pending} descripciones pendientes.")
+        self._ensure_started()
+        future = Future()
+        future.add_done_callback(lambda _: self._slots.release())
+        self._queue.put((image_name, future))
+        return future
+
+    def _ensure_started(self) -> None:
+        # El hilo se arranca la primera vez que se usa el motor.
+        with self._start_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="blip-batcher", daemon=True)
+                self._thread.start()
+
+    def _run(self) -> None:
+        while True:
+            batch = collect_batch(self._queue, self.max_batch_size, self.max_wait)
+            image_names = [image_name for image_name, _ in batch]
+            try:
+                descriptions = _generate_batch(image_names)
+            except Exception as e:
+                descriptions = [f"Erreur lors de la description de l'image: {e}"] * len(batch)
+            for (_, future), description in zip(batch, descriptions):
+                future.set_result(description)
+
+
+# Instancia única compartida por todas las peticiones del proceso.
+batcher = CaptionBatcher()
+
+
+# Descripción que se devuelve si el lote no termina en REQUEST_TIMEOUT segundos.
+TIMEOUT_ERROR = "Erreur lors de la description de l'image: délai d'attente dépassé."
+
+
+def describe_image(image_name: str, block: bool = False) -> str:
     """
     Genera una descripción en francés para una imagen dada utilizando el modelo BLIP-2.
+    La petición se agrupa con otras concurrentes en un mismo lote de inferencia, en los
+    procesos dedicados (si se arrancaron) o en el hilo de lotes de este proceso.
 
     Args:
         image_name (str): El nombre del archivo de la imagen (ej: "gato.jpg").
+        block (bool): Si es True, espera a que haya sitio en la cola en vez de rechazar la petición.
 
     Returns:
         str: La descripción generada o un mensaje de error.
+
+    Raises:
+        QueueFullError: Si la cola de inferencia está llena y `block` es False.
     """
-    # Verificación inicial: si el modelo no se cargó correctamente, no se puede continuar.
-    if not model or not processor:
+    # Verificación inicial: si el modelo todavía se está cargando o falló, no se puede continuar.
+    if not is_ready():
         return "Error: El modelo BLIP no está cargado."
-    
+
+    engine = _pool if _pool is not None else batcher
+    future = engine.submit(image_name, block)
+    # Se bloquea hasta que el lote que contiene esta imagen termine.
     try:
-        # Construye la ruta completa al archivo de la imagen.
-        image_path = f"images/{image_name}"
-        # Abre la imagen usando Pillow y la convierte al formato RGB, que es el estándar para el modelo.
-        raw_image = Image.open(image_path).convert('RGB')
-        
-        # Paso 1: Procesar la imagen. El procesador la convierte a tensores numéricos.
-        inputs = processor(images=raw_image, return_tensors="pt")
-        
-        print(f"Generando descripción para {image_name} en CPU (esto puede tardar)...")
-        # Paso 2: Generar la descripción. El modelo toma los tensores y produce una secuencia de texto.
-        # `max_new_tokens` limita la longitud de la descripción para que sea más rápida y concisa.
-        out = model.generate(**inputs, max_new_tokens=75)
-        
-        # Paso 3: Decodificar el resultado. El procesador convierte la salida del modelo a texto legible.
-        description = processor.decode(out[0], skip_special_tokens=True)
-        print(f"Descripción generada: '{description}'")
-        
-        return description
-
-    except FileNotFoundError:
-        # Maneja el caso en que el archivo de la imagen no se encuentre en la ruta especificada.
-        return "Erreur: L'image n'a pas été trouvée."
-    except Exception as e:
-        # Captura cualquier otro error que pueda ocurrir durante el proceso.
-        return f"Erreur lors de la description de l'image: {e}"
\ No newline at end of file
+        return future.result(timeout=REQUEST_TIMEOUT)
+    except FutureTimeoutError:
+        return TIMEOUT_ERROR
+
+
+async def describe_image_async(image_name: str) -> str:
+    """
+    Como `describe_image`, pero para los endpoints asíncronos: la espera no ocupa
+    ningún hilo, así que el límite de peticiones en espera es el de la cola de BLIP
+    (QueueFullError) y no el del grupo de hilos del servidor.
+
+    Raises:
+        QueueFullError: Si la cola de inferencia está llena.
+    """
+    if not is_ready():
+        return "Error: El modelo BLIP no está cargado."
+
+    engine = _pool if _pool is not None else batcher
+    future = engine.submit(image_name)
+    # shield: al agotar el tiempo no se cancela el Future (el lote lo completará igualmente
+    # y su sitio en la cola se libera entonces).
+    try:
+        return await asyncio.wait_for(asyncio.shield(asyncio.wrap_future(future)), REQUEST_TIMEOUT)
+    except asyncio.TimeoutError:
+        return TIMEOUT_ERROR
+
@@ -0,0 +1,317 @@
+# app/services/blip_workers.py
+
+# --- Procesos Dedicados para la Inferencia de BLIP ---
+# Cada generación de BLIP tarda segundos de CPU. Si se ejecuta dentro del proceso de
+# la API compite por el GIL (y por los núcleos, con los hilos de PyTorch) con los
+# endpoints ligeros. Con BLIP_WORKERS > 0 el modelo se carga en N procesos aparte;
+# el proceso de la API reparte las peticiones en la cola de cada proceso (al menos
+# cargado primero), y cada proceso las agrupa en lotes y devuelve las descripciones.
+# Como la API sabe qué peticiones envió a cada proceso, si uno cae ninguna se pierde.
+#
+# La cola está acotada: si ya hay BLIP_QUEUE_MAX_SIZE peticiones pendientes, las
+# nuevas se rechazan con QueueFullError (la API responde 503 con Retry-After) en
+# vez de acumular latencia.
+
+# --- Importaciones Necesarias ---
+import itertools       # Para numerar las peticiones.
+import logging         # Para registrar el arranque y las caídas de los procesos.
+import multiprocessing # Para lanzar los procesos de inferencia.
+import queue           # Excepción queue.Empty de las colas (de hilos y de procesos).
+import threading       # El hilo recolector de resultados y el límite de peticiones pendientes.
+import time            # Para la ventana de espera de cada lote.
+from concurrent.futures import Future # Permite devolver a cada llamador su propio resultado.
+
+# Los tiempos de cada lote se registran en el proceso de la API, que es el que publica /metrics.
+from app.services.metrics import record_blip_batch
+
+logger = logging.getLogger(__name__)
+
+# Descripción que reciben las peticiones en curso si su proceso termina inesperadamente.
+WORKER_CRASHED = "Erreur lors de la description de l'image: le processus d'inférence s'est arrêté."
+
+
+class QueueFullError(RuntimeError):
+    """
+    La cola de inferencia está llena: el llamador debe reintentar más tarde.
+    """
+
+
+def collect_batch(source, max_batch_size: int, max_wait: float) -> list:
+    """
+    Espera (sin límite) la primera petición de una cola y luego acepta más hasta
+    llenar el lote o agotar la ventana de espera.
+
+    Args:
+        source: Una cola de hilos (queue.Queue) o de procesos (multiprocessing.Queue).
+        max_batch_size (int): El tamaño máximo del lote.
+        max_wait (float): Los segundos que se espera a que lleguen más peticiones.
+
+    Returns:
+        list: Los elementos sacados de la cola.
+    """
+    batch = [source.get()]
+    deadline = time.monotonic() + max_wait
+    while len(batch) < max_batch_size:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            break
+        try:
+            batch.append(source.get(timeout=remaining))
+        except queue.Empty:
+            break
+    return batch
+
+
+def _worker_main(worker_id: int, requests, results, torch_threads) -> None:
+    """
+    Punto de entrada de cada proceso de inferencia: carga el modelo y atiende
+    lotes de la cola de peticiones hasta recibir la señal de parada (None).
+    """
+    # Se importan aquí: el proceso se lanza con 'spawn' y parte de un intérprete vacío.
+    from app.logging_config import configure_logging
+    from app.services import blip_service
+
+    configure_logging()
+    if torch_threads:
+        blip_service.TORCH_THREADS = torch_threads
+    if not blip_service.load_model():
+        results.put(("failed", worker_id, blip_service.MODEL_ERROR))
+        return
+    results.put(("ready", worker_id, {"load_seconds": blip_service.LOAD_SECONDS, "memory_mb": blip_service.MEMORY_MB}))
+
+    while True:
+        batch = collect_batch(requests, blip_service.BATCH_MAX_SIZE, blip_service.BATCH_MAX_WAIT_MS / 1000)
+        stop = None in batch
+        batch = [item for item in batch if item is not None]
+        if batch:
+            request_ids = [request_id for request_id, _ in batch]
+            # Se avisa antes de generar, para que la API sepa qué peticiones se pierden si el proceso cae.
+            results.put(("started", worker_id, request_ids))
+            timings = {}
+            try:
+                descriptions = blip_service._generate_batch([image_name for _, image_name in batch], timings)
+            except Exception as e:
+                descriptions = [f"Erreur lors de la description de l'image: {e}"] * len(batch)
+            results.put(("done", worker_id, {"results": list(zip(request_ids, descriptions)), "timings": timings}))
+        if stop:
+            return
+
+
+class WorkerPool:
+    """
+    Grupo de procesos de inferencia con un límite de peticiones pendientes.
+
+    Un hilo del proceso de la API recoge los resultados y completa el Future de
+    cada petición. Si un proceso muere (ej. por falta de memoria), las peticiones de
+    su lote en curso se completan con un error, las que seguían en su cola se envían
+    a otro proceso y se lanza otro proceso en su lugar.
+    """
+
+    def __init__(self, num_workers: int, max_pending: int, torch_threads=None):
+        self.num_workers = max(1, num_workers)
+        self.max_pending = max(1, max_pending)
+        self.torch_threads = torch_threads
+        # 'spawn' evita heredar (con fork) el estado de los hilos de la API y de PyTorch.
+        self._ctx = multiprocessing.get_context("spawn")
+        self._results = self._ctx.Queue()
+        self._slots = threading.BoundedSemaphore(self.max_pending)
+        self._lock = threading.Lock()
+        self._ids = itertools.count()
+        self._pending = {}    # id de la petición -> (Future, nombre de la imagen)
+        self._queues = {}     # id del proceso -> su cola de peticiones
+        self._assigned = {}   # id del proceso -> ids de las peticiones enviadas a su cola y sin terminar
+        self._in_flight = {}  # id del proceso -> ids de las peticiones de su lote actual
+        self._processes = {}  # id del proceso -> multiprocessing.Process
+        self._ready = set()   # ids de los procesos con el modelo cargado
+        self._failed = {}     # id del proceso -> error de carga
+        self._memory = {}     # id del proceso -> memoria tras cargar el modelo (MB)
+        self._started_event = threading.Event() # Primer proceso listo, o todos fallaron.
+        self._stopping = False
+        self.load_seconds = None
+
+    def start(self) -> None:
+        """
+        Lanza los procesos y el hilo que recoge sus resultados.
+        """
+        for worker_id in range(self.num_workers):
+            self._spawn(worker_id)
+        threading.Thread(target=self._collect, name="blip-workers", daemon=True).start()
+
+    def _spawn(self, worker_id: int) -> None:
+        # Cada proceso (también el que sustituye a uno caído) recibe una cola nueva.
+        requests = self._ctx.Queue()
+        with self._lock:
+            old = self._queues.get(worker_id)
+            self._queues[worker_id] = requests
+            self._assigned.setdefault(worker_id, set())
+        if old is not None:
+            old.cancel_join_thread()
+            old.close()
+        process = self._ctx.Process(
+            target=_worker_main,
+            args=(worker_id, requests, self._results, self.torch_threads),
+            name=f"blip-worker-{worker_id}",
+            daemon=True,
+        )
+        process.start()
+        self._processes[worker_id] = process
+
+    def wait_ready(self, timeout: float = None) -> bool:
+        """
+        Espera a que al menos un proceso tenga el modelo cargado.
+
+        Returns:
+            bool: True si hay algún proceso listo; False si todos fallaron (o se agotó el tiempo).
+        """
+        self._started_event.wait(timeout)
+        return self.ready_workers() > 0
+
+    def ready_workers(self) -> int:
+        with self._lock:
+            return len(self._ready)
+
+    def status(self) -> dict:
+        """
+        Devuelve el número de procesos listos, las peticiones pendientes, la memoria
+        de cada proceso listo y el error de carga.
+        """
+        with self._lock:
+            return {
+                "workers_ready": len(self._ready),
+                "pending": len(self._pending),
+                "memory_mb": [self._memory[worker_id] for worker_id in sorted(self._ready) if worker_id in self._memory],
+                "error": next(iter(self._failed.values()), None),
+            }
+
+    def submit(self, image_name: str, block: bool = False) -> Future:
+        """
+        Encola una imagen para describirla en uno de los procesos.
+
+        Args:
+            image_name (str): El nombre del archivo de la imagen.
+            block (bool): Si es True, espera a que haya sitio en la cola en vez de rechazar la petición.
+
+        Returns:
+            Future: Se completa con la descripción cuando termine su lote.
+
+        Raises:
+            QueueFullError: Si ya hay `max_pending` peticiones pendientes y `block` es False.
+        """
+        if not self._slots.acquire(blocking=block):
+            raise QueueFullError(f"Hay {self.max_pending} descripciones pendientes.")
+        future = Future()
+        future.add_done_callback(lambda _: self._slots.release())
+        with self._lock:
+            request_id = next(self._ids)
+            self._pending[request_id] = (future, image_name)
+            assigned = self._assign(request_id)
+        if not assigned:
+            self._fail([request_id])
+        return future
+
+    def _assign(self, request_id: int) -> bool:
+        """
+        Envía una petición pendiente a la cola del proceso con menos trabajo asignado,
+        prefiriendo los que ya tienen el modelo cargado. Debe llamarse con `_lock` adquirido.
+
+        Returns:
+            bool: False si no queda ningún proceso que pueda atenderla.
+        """
+        candidates = [worker_id for worker_id in self._queues if worker_id not in self._failed]
+        if not candidates:
+            return False
+        worker_id = min(candidates, key=lambda w: (w not in self._ready, len(self._assigned[w])))
+        self._assigned[worker_id].add(request_id)
+        self._queues[worker_id].put((request_id, self._pending[request_id][1]))
+        return True
+
+    def _fail(self, request_ids) -> None:
+        """
+        Completa con un error las peticiones indicadas (libera su sitio en la cola).
+        """
+        with self._lock:
+            futures = [self._pending.pop(request_id, (None, None))[0] for request_id in request_ids]
+        for future in futures:
+            if future is not None:
+                future.set_result(WORKER_CRASHED)
+
+    def _collect(self) -> None:
+        while not self._stopping:
+            try:
+                self._handle(self._results.get(timeout=1.0))
+            except queue.Empty:
+                pass
+            self._check_workers()
+
+    def _handle(self, message: tuple) -> None:
+        kind, worker_id, payload = message
+        finished = []
+        unassigned = []
+        with self._lock:
+            if kind == "ready":
+                self._ready.add(worker_id)
+                self.load_seconds = payload["load_seconds"]
+                self._memory[worker_id] = payload["memory_mb"]
+                self._started_event.set()
+            elif kind == "failed":
+                self._failed[worker_id] = payload
+                if len(self._failed) == self.num_workers:
+                    self._started_event.set()
+                # Lo que se había enviado a este proceso pasa a los demás.
+                orphaned = self._assigned.pop(worker_id, set())
+                unassigned = [request_id for request_id in orphaned if not self._assign(request_id)]
+            elif kind == "started":
+                self._in_flight[worker_id] = payload
+            elif kind == "done":
+                self._in_flight.pop(worker_id, None)
+                for request_id, description in payload["results"]:
+                    self._assigned.get(worker_id, set()).discard(request_id)
+                    future, _ = self._pending.pop(request_id, (None, None))
+                    finished.append((future, description))
+        for future, description in finished:
+            if future is not None:
+                future.set_result(description)
+        if kind == "done":
+            record_blip_batch(payload["timings"])
+        self._fail(unassigned)
+
+    def _check_workers(self) -> None:
+        for worker_id, process in list(self._processes.items()):
+            # Un proceso que termina con código 0 es uno que no pudo cargar el modelo
+            # (ya envió "failed"): no se relanza para no repetir el fallo en bucle.
+            if process.is_alive() or process.exitcode == 0 or self._stopping:
+                continue
+            logger.error(
+                "El proceso de inferencia %d terminó inesperadamente (código %s); se relanza.",
+                worker_id, process.exitcode,
+            )
+            # Las peticiones del lote en curso fallan (pueden ser la causa de la caída). El
+            # resto de las enviadas a su cola (incluidas las que ya había sacado sin avisar
+            # con "started") se vuelven a enviar al proceso nuevo o a los demás.
+            with self._lock:
+                self._ready.discard(worker_id)
+                lost = self._in_flight.pop(worker_id, [])
+                requeue = self._assigned.get(worker_id, set()) - set(lost)
+                self._assigned[worker_id] = set()
+            self._fail(lost)
+            self._spawn(worker_id)
+            with self._lock:
+                unassigned = [request_id for request_id in requeue
+                              if request_id in self._pending and not self._assign(request_id)]
+            self._fail(unassigned)
+
+    def stop(self, timeout: float = 5.0) -> None:
+        """
+        Pide a los procesos que terminen y espera como mucho `timeout` segundos.
+        """
+        self._stopping = True
+        for requests in self._queues.values():
+            requests.put(None)
+        deadline = time.monotonic() + timeout
+        for process in self._processes.values():
+            process.join(max(0.0, deadline - time.monotonic()))
+            if process.is_alive():
+                process.terminate()
+        with self._lock:
+            pending = list(self._pending)
+        self._fail(pending)
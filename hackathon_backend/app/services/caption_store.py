@@ -0,0 +1,211 @@
+# app/services/caption_store.py
+
+# --- Importaciones Necesarias ---
+import asyncio    # Para guardar el almacén sin bloquear el bucle de eventos.
+import json       # Para guardar el almacén en disco en formato JSON.
+import logging    # Para registrar errores y el resultado del precálculo.
+import os         # Para gestionar el archivo del almacén.
+import threading  # Para proteger el almacén cuando varias peticiones lo usan a la vez.
+
+# Importa el servicio de BLIP, que se usa solo cuando una imagen no está en el almacén.
+from app.services import blip_service
+# Índice en memoria con la lista de imágenes válidas del corpus y el hash del contenido de cada una.
+from app.services.image_index import index as image_index
+# Métricas de Prometheus (aciertos del almacén).
+from app.services.metrics import record_cache
+
+logger = logging.getLogger(__name__)
+
+# --- Configuración ---
+# Archivo donde se guardan las descripciones precalculadas. Se puede cambiar con una variable de entorno.
+STORE_PATH = os.getenv("CAPTION_STORE_PATH", "cache/captions.json")
+
+# --- Estado en Memoria ---
+# El almacén completo se mantiene en memoria para responder en O(1):
+# hash del contenido -> descripción generada por BLIP. El hash de cada archivo lo
+# calcula (y lo reutiliza mientras el archivo no cambie) el índice de imágenes.
+_lock = threading.Lock()
+_captions: dict = {}
+_loaded_mtime_ns = None  # Fecha de modificación del archivo cuando se leyó por última vez.
+
+
+def _is_error(description: str) -> bool:
+    """
+    Indica si el texto devuelto por BLIP es en realidad un mensaje de error,
+    en cuyo caso no debe guardarse en el almacén.
+    """
+    return description.startswith(("Error", "Erreur"))
+
+
+def _load_store() -> None:
+    """
+    Carga el almacén desde disco la primera vez que se necesita y cada vez que el
+    archivo cambia (ej: otro proceso guardó descripciones nuevas). Las entradas del
+    archivo se combinan con las que ya hay en memoria.
+    Debe llamarse con `_lock` adquirido.
+    """
+    global _loaded_mtime_ns
+    try:
+        mtime_ns = os.stat(STORE_PATH).st_mtime_ns
+    except OSError:
+        mtime_ns = None
+    if mtime_ns is None or mtime_ns == _loaded_mtime_ns:
+        return
+    try:
+        with open(STORE_PATH, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        _captions.update(data.get("captions", {}))
+    except FileNotFoundError:
+        # Es normal en el primer arranque: el almacén todavía no existe.
+        pass
+    except (OSError, ValueError) as e:
+        # Un archivo corrupto no debe tumbar la API; se reconstruye desde cero.
+        logger.warning("No se pudo leer el almacén de descripciones (%s), se reconstruirá.", e)
+    _loaded_mtime_ns = mtime_ns
+
+
+def _save_store() -> None:
+    """
+    Escribe el almacén en disco de forma atómica (archivo temporal + reemplazo),
+    para que un proceso que lo lea nunca vea un archivo a medio escribir.
+    Debe llamarse con `_lock` adquirido.
+    """
+    global _loaded_mtime_ns
+    directory = os.path.dirname(STORE_PATH)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    # El temporal lleva el pid: varios procesos pueden guardar el almacén a la vez.
+    tmp_path = f"{STORE_PATH}.tmp-{os.getpid()}"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump({"captions": _captions}, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, STORE_PATH)
+    _loaded_mtime_ns = os.stat(STORE_PATH).st_mtime_ns
+
+
+def get_caption(image_name: str):
+    """
+    Busca en el almacén la descripción de una imagen, sin ejecutar el modelo.
+
+    Args:
+        image_name (str): El nombre del archivo de la imagen (ej: "gato.jpg").
+
+    Returns:
+        str | None: La descripción guardada, o None si la imagen no está en el almacén.
+    """
+    content_hash = image_index.content_hash(image_name)
+    with _lock:
+        _load_store()
+        return _captions.get(content_hash)
+
+
+def all_captions() -> list:
+    """
+    Devuelve todas las descripciones guardadas en el almacén.
+    """
+    with _lock:
+        _load_store()
+        return list(_captions.values())
+
+
+def get_or_describe(image_name: str, block: bool = False) -> str:
+    """
+    Devuelve la descripción de una imagen desde el almacén y, solo si no está
+    (o si el archivo cambió), la genera con BLIP y la guarda para la próxima vez.
+
+    Args:
+        image_name (str): El nombre del archivo de la imagen (ej: "gato.jpg").
+        block (bool): Si es True, espera a que haya sitio en la cola de BLIP.
+
+    Returns:
+        str: La descripción de la imagen o un mensaje de error.
+
+    Raises:
+        QueueFullError: Si hay que usar BLIP, su cola está llena y `block` es False.
+    """
+    try:
+        caption = get_caption(image_name)
+    except FileNotFoundError:
+        return "Erreur: L'image n'a pas été trouvée."
+    record_cache("captions", caption is not None)
+    if caption is not None:
+        return caption
+
+    # Fallo de caché: se ejecuta la inferencia en vivo (fuera del lock, porque tarda segundos).
+    description = blip_service.describe_image(image_name, block)
+    _remember(image_name, description)
+    return description
+
+
+async def get_or_describe_async(image_name: str) -> str:
+    """
+    Como `get_or_describe`, para los endpoints asíncronos: la espera de BLIP no ocupa
+    ningún hilo y el almacén se guarda en un hilo aparte.
+
+    Raises:
+        QueueFullError: Si hay que usar BLIP y su cola está llena.
+    """
+    try:
+        caption = get_caption(image_name)
+    except FileNotFoundError:
+        return "Erreur: L'image n'a pas été trouvée."
+    record_cache("captions", caption is not None)
+    if caption is not None:
+        return caption
+
+    description = await blip_service.describe_image_async(image_name)
+    await asyncio.to_thread(_remember, image_name, description)
+    return description
+
+
+def _remember(image_name: str, description: str) -> None:
+    """
+    Guarda en el almacén una descripción recién generada (los mensajes de error no se guardan).
+    """
+    if _is_error(description):
+        return
+    content_hash = image_index.content_hash(image_name)
+    with _lock:
+        # Se combinan antes las descripciones que otros procesos hayan guardado.
+        _load_store()
+        _captions[content_hash] = description
+        _save_store()
+
+
+def precompute_all() -> dict:
+    """
+    Genera y guarda la descripción de todas las imágenes del corpus que aún no
+    estén en el almacén. Las imágenes cuyo contenido no ha cambiado se omiten.
+
+    Returns:
+        dict: Un resumen con el número de imágenes ya presentes, generadas y fallidas.
+    """
+    stats = {"cached": 0, "generated": 0, "failed": 0}
+    image_index.refresh(force=True)
+    image_names = image_index.images()
+    for image_name in image_names:
+        if get_caption(image_name) is not None:
+            stats["cached"] += 1
+            continue
+        # El precálculo espera su turno en la cola en vez de ser rechazado.
+        description = get_or_describe(image_name, block=True)
+        if _is_error(description):
+            stats["failed"] += 1
+        else:
+            stats["generated"] += 1
+
+    # Se eliminan del almacén las entradas de imágenes que ya no existen (o cuyo contenido cambió).
+    live_hashes = set()
+    for image_name in image_names:
+        try:
+            live_hashes.add(image_index.content_hash(image_name))
+        except FileNotFoundError:
+            pass
+    with _lock:
+        _load_store()
+        for content_hash in list(_captions):
+            if content_hash not in live_hashes:
+                del _captions[content_hash]
+        _save_store()
+
+    logger.info("Precálculo de descripciones terminado: %s", stats, extra=stats)
+    return stats
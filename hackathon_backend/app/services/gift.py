@@ -0,0 +1,170 @@
+# app/services/gift.py
+
+# --- Utilidades para el Formato GIFT de Moodle ---
+# En GIFT cada pregunta termina con su bloque de respuestas entre llaves, por ejemplo:
+#
+#     ::Pregunta 1:: Quelle est la couleur de la voiture ? {
+#     ~Bleu
+#     =Rouge
+#     }
+#
+# Las llaves precedidas de una barra invertida (\{ y \}) son literales y no abren ni cierran bloques.
+
+import re # Para separar las respuestas de un bloque.
+
+
+class GiftStreamParser:
+    """
+    Separa en preguntas un texto GIFT que llega por partes (ej: tokens de un LLM).
+    Una pregunta se considera completa cuando se cierra su bloque de respuestas
+    y termina la línea.
+    """
+
+    def __init__(self):
+        self._buffer = []
+        self._depth = 0        # Nivel de llaves abiertas.
+        self._closed = False   # Si la pregunta actual ya cerró su bloque de respuestas.
+        self._escape = False   # Si el carácter anterior fue una barra invertida.
+
+    def feed(self, text: str) -> list:
+        """
+        Añade un fragmento de texto.
+
+        Args:
+            text (str): El nuevo fragmento recibido.
+
+        Returns:
+            list: Las preguntas que se completaron con este fragmento.
+        """
+        completed = []
+        for char in text:
+            self._buffer.append(char)
+            if self._escape:
+                self._escape = False
+            elif char == "\\":
+                self._escape = True
+            elif char == "{":
+                self._depth += 1
+            elif char == "}" and self._depth > 0:
+                self._depth -= 1
+                if self._depth == 0:
+                    self._closed = True
+            elif char == "\n" and self._closed and self._depth == 0:
+                question = self._take()
+                if question:
+                    completed.append(question)
+        return completed
+
+    def flush(self) -> list:
+        """
+        Devuelve lo que quede en el buffer al terminar el texto.
+
+        Returns:
+            list: La última pregunta (si la hay).
+        """
+        question = self._take()
+        self._depth = 0
+        self._escape = False
+        return [question] if question else []
+
+    def _take(self) -> str:
+        question = "".join(self._buffer).strip()
+        self._buffer = []
+        self._closed = False
+        return question
+
+
+def split_questions(gift_text: str) -> list:
+    """
+    Separa un texto GIFT completo en sus preguntas.
+
+    Args:
+        gift_text (str): El texto en formato GIFT.
+
+    Returns:
+        list: Una lista con el texto de cada pregunta.
+    """
+    parser = GiftStreamParser()
+    return parser.feed(gift_text) + parser.flush()
+
+
+class GiftFormatError(ValueError):
+    """
+    El texto no es un cuestionario GIFT válido.
+    """
+
+
+def _answer_block(question: str) -> str:
+    """
+    Devuelve el contenido del bloque de respuestas de una pregunta (sin las llaves).
+    """
+    start = end = None
+    depth = 0
+    escape = False
+    for i, char in enumerate(question):
+        if escape:
+            escape = False
+        elif char == "\\":
+            escape = True
+        elif char == "{":
+            if depth == 0 and start is None:
+                start = i + 1
+            depth += 1
+        elif char == "}":
+            depth -= 1
+            if depth < 0:
+                raise GiftFormatError("Llave de cierre sin abrir.")
+            if depth == 0 and end is None:
+                end = i
+    if depth != 0:
+        raise GiftFormatError("Bloque de respuestas sin cerrar.")
+    if start is None:
+        raise GiftFormatError("La pregunta no tiene bloque de respuestas.")
+    return question[start:end]
+
+
+def _check_answers(block: str) -> None:
+    """
+    Comprueba que el bloque de respuestas corresponde a un tipo de pregunta GIFT:
+    verdadero/falso, opción múltiple, respuesta corta o emparejamiento.
+    """
+    answers = block.strip()
+    if answers.upper() in ("TRUE", "FALSE", "T", "F"):
+        return
+    # Las respuestas empiezan por '=' (correcta) o '~' (incorrecta); los comentarios ('#') van detrás.
+    options = [option.strip() for option in re.split(r"(?<!\\)(?=[=~])", answers) if option.strip()]
+    if not options or any(option[0] not in "=~" for option in options):
+        raise GiftFormatError(f"Respuestas no válidas: '{answers[:40]}'.")
+    if any(len(option[1:].split("#")[0].strip()) == 0 for option in options):
+        raise GiftFormatError("Hay una respuesta vacía.")
+    correct = [option for option in options if option[0] == "="]
+    if not correct and not any(re.match(r"~%[0-9]", option) for option in options):
+        raise GiftFormatError("Ninguna respuesta está marcada como correcta.")
+    matching = [option for option in correct if "->" in option]
+    if matching and (len(matching) != len(options) or len(matching) < 3):
+        raise GiftFormatError("Un emparejamiento necesita al menos tres pares '=a -> b'.")
+
+
+def parse_gift(gift_text: str, min_questions: int = 1) -> list:
+    """
+    Valida un cuestionario GIFT completo y lo separa en preguntas.
+
+    Args:
+        gift_text (str): El texto en formato GIFT.
+        min_questions (int): El número mínimo de preguntas exigido.
+
+    Returns:
+        list: El texto de cada pregunta.
+
+    Raises:
+        GiftFormatError: Si alguna pregunta no es válida o faltan preguntas.
+    """
+    questions = split_questions(gift_text)
+    if len(questions) < min_questions:
+        raise GiftFormatError(f"Se esperaban al menos {min_questions} preguntas y hay {len(questions)}.")
+    for number, question in enumerate(questions, start=1):
+        try:
+            _check_answers(_answer_block(question))
+        except GiftFormatError as e:
+            raise GiftFormatError(f"Pregunta {number}: {e}") from None
+    return questions
@@ -0,0 +1,61 @@
+# app/services/http_client.py
+
+# --- Importaciones Necesarias ---
+import os     # Para leer la configuración desde variables de entorno.
+import httpx  # Cliente HTTP asíncrono con pool de conexiones.
+
+# --- Configuración del Pool de Conexiones ---
+# Número máximo de conexiones simultáneas hacia las APIs externas.
+MAX_CONNECTIONS = int(os.getenv("HTTP_MAX_CONNECTIONS", "100"))
+# Número de conexiones inactivas que se mantienen abiertas (keep-alive) para reutilizarlas.
+MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("HTTP_MAX_KEEPALIVE_CONNECTIONS", "20"))
+# Segundos que una conexión inactiva se mantiene abierta antes de cerrarla.
+KEEPALIVE_EXPIRY = float(os.getenv("HTTP_KEEPALIVE_EXPIRY", "30"))
+# Segundos máximos para establecer una conexión nueva.
+CONNECT_TIMEOUT = float(os.getenv("HTTP_CONNECT_TIMEOUT", "10"))
+
+# Cliente único compartido por todo el proceso. Reutilizar el mismo cliente evita
+# repetir el handshake TCP+TLS en cada petición a OpenAI.
+_client = None
+
+
+def get_client() -> httpx.AsyncClient:
+    """
+    Devuelve el cliente HTTP compartido, creándolo la primera vez que se usa.
+
+    Returns:
+        httpx.AsyncClient: El cliente con pool de conexiones y keep-alive.
+    """
+    global _client
+    if _client is None or _client.is_closed:
+        _client = httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=MAX_CONNECTIONS,
+                max_keepalive_connections=MAX_KEEPALIVE_CONNECTIONS,
+                keepalive_expiry=KEEPALIVE_EXPIRY,
+            ),
+            # Las respuestas de los LLM pueden tardar; solo la conexión inicial tiene un límite corto.
+            timeout=timeout_for(60.0),
+        )
+    return _client
+
+
+def timeout_for(seconds: float) -> httpx.Timeout:
+    """
+    Timeout de una petición: `seconds` para cada operación (ej: esperar la respuesta),
+    con una conexión inicial que nunca tarda más que CONNECT_TIMEOUT.
+
+    Args:
+        seconds (float): El timeout de la llamada (ver app/services/resilience.py).
+    """
+    return httpx.Timeout(seconds, connect=min(CONNECT_TIMEOUT, seconds))
+
+
+async def close_client() -> None:
+    """
+    Cierra el cliente compartido y sus conexiones. Se llama al apagar la aplicación.
+    """
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
@@ -0,0 +1,162 @@
+# app/services/image_index.py
+
+# --- Importaciones Necesarias ---
+import hashlib    # Para calcular el hash del contenido de cada imagen.
+import os         # Para listar el directorio de imágenes y consultar su fecha de modificación.
+import random     # Para barajar las imágenes de cada estudiante.
+import threading  # Para proteger el índice cuando varias peticiones lo usan a la vez.
+import time       # Para limitar la frecuencia con la que se revisa el directorio.
+from collections import OrderedDict # Para desalojar los mazos de los clientes inactivos.
+
+# --- Configuración ---
+# Carpeta con el corpus de imágenes de los ejercicios.
+IMAGES_DIR = "images"
+# Extensiones que se consideran imágenes válidas (evita archivos como '.DS_Store').
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".webp")
+# Cada cuántos segundos, como mucho, se comprueba si el directorio cambió.
+REFRESH_INTERVAL = float(os.getenv("IMAGE_INDEX_REFRESH_SECONDS", "5"))
+# Número máximo de mazos (uno por sesión o estudiante) que se mantienen en memoria.
+MAX_DECKS = int(os.getenv("IMAGE_INDEX_MAX_DECKS", "10000"))
+
+
+def file_sha256(path: str) -> str:
+    """
+    Calcula el hash SHA-256 del contenido de un archivo.
+
+    Args:
+        path (str): La ruta del archivo.
+
+    Returns:
+        str: El hash en formato hexadecimal.
+    """
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        # Se lee por bloques para no cargar archivos grandes completos en memoria.
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class ImageIndex:
+    """
+    Índice en memoria de las imágenes de los ejercicios. Se reconstruye solo
+    cuando cambia la fecha de modificación del directorio, y reparte las
+    imágenes a cada cliente como un mazo barajado: un estudiante no vuelve a
+    ver una imagen hasta haber visto todas las demás.
+    """
+
+    def __init__(self, directory: str = IMAGES_DIR):
+        self.directory = directory
+        self._lock = threading.Lock()
+        self._images = []
+        self._mtime_ns = None
+        self._version = 0           # Aumenta cada vez que cambia el contenido del directorio.
+        self._next_check = 0.0
+        self._decks = OrderedDict() # id del cliente -> mazo
+        self._hashes = {}           # nombre -> (mtime_ns, tamaño, hash del contenido)
+
+    def refresh(self, force: bool = False) -> None:
+        """
+        Vuelve a listar el directorio si su fecha de modificación cambió.
+
+        Args:
+            force (bool): Si es True, lo lista aunque no haya cambiado.
+        """
+        with self._lock:
+            self._refresh_locked(force)
+
+    def _refresh_locked(self, force: bool = False) -> None:
+        now = time.monotonic()
+        if not force and now < self._next_check:
+            return
+        self._next_check = now + REFRESH_INTERVAL
+        mtime_ns = os.stat(self.directory).st_mtime_ns
+        if not force and mtime_ns == self._mtime_ns:
+            return
+        self._images = sorted(
+            name for name in os.listdir(self.directory)
+            if name.lower().endswith(IMAGE_EXTENSIONS)
+        )
+        self._mtime_ns = mtime_ns
+        self._version += 1
+
+    def images(self) -> list:
+        """
+        Devuelve la lista (ordenada) de imágenes válidas.
+        """
+        with self._lock:
+            self._refresh_locked()
+            return list(self._images)
+
+    def content_hash(self, image_name: str) -> str:
+        """
+        Devuelve el hash del contenido de una imagen. Solo se vuelve a leer el
+        archivo si cambió su fecha de modificación o su tamaño.
+
+        Args:
+            image_name (str): El nombre del archivo de la imagen.
+
+        Returns:
+            str: El hash SHA-256 del contenido.
+
+        Raises:
+            FileNotFoundError: Si la imagen no existe.
+        """
+        path = os.path.join(self.directory, image_name)
+        stat = os.stat(path)
+        with self._lock:
+            entry = self._hashes.get(image_name)
+        if entry and entry[0] == stat.st_mtime_ns and entry[1] == stat.st_size:
+            return entry[2]
+        content_hash = file_sha256(path)
+        with self._lock:
+            self._hashes[image_name] = (stat.st_mtime_ns, stat.st_size, content_hash)
+        return content_hash
+
+    def draw(self, client_id: str = None) -> str:
+        """
+        Elige la siguiente imagen para un cliente.
+
+        Args:
+            client_id (str): El identificador de la sesión o del estudiante. Si no
+                             se indica, la imagen se elige al azar.
+
+        Returns:
+            str: El nombre del archivo de la imagen.
+
+        Raises:
+            LookupError: Si no hay ninguna imagen válida en el directorio.
+        """
+        with self._lock:
+            self._refresh_locked()
+            if not self._images:
+                raise LookupError(f"No hay imágenes en '{self.directory}'.")
+            if client_id is None:
+                return random.choice(self._images)
+
+            deck = self._decks.get(client_id)
+            if deck is None or deck["version"] != self._version or not deck["cards"]:
+                deck = self._new_deck(deck["last"] if deck else None)
+                self._decks[client_id] = deck
+            self._decks.move_to_end(client_id)
+            while len(self._decks) > MAX_DECKS:
+                self._decks.popitem(last=False)
+
+            # Sacar la carta del final de la lista es O(1).
+            deck["last"] = deck["cards"].pop()
+            return deck["last"]
+
+    def _new_deck(self, last: str = None) -> dict:
+        """
+        Baraja todas las imágenes en un mazo nuevo. Si la primera carta coincide
+        con la última que vio el cliente, se intercambia para no repetirla.
+        """
+        cards = list(self._images)
+        random.shuffle(cards)
+        if len(cards) > 1 and cards[-1] == last:
+            cards[0], cards[-1] = cards[-1], cards[0]
+        return {"version": self._version, "cards": cards, "last": last}
+
+
+# Instancia única compartida por todas las peticiones del proceso.
+index = ImageIndex()
@@ -0,0 +1,198 @@
+# app/services/image_variants.py
+
+# --- Variantes Optimizadas de las Imágenes ---
+# Los originales pesan hasta ~700 KB. Al incorporar las imágenes (al arrancar o con
+# el script offline) se generan versiones redimensionadas en WebP y JPEG para
+# varios anchos, incluida una miniatura. Cada variante se nombra con el hash del
+# contenido de la imagen original, así que su URL nunca cambia de contenido y se
+# puede servir con caché de larga duración ('immutable').
+
+# --- Importaciones Necesarias ---
+import json       # Para guardar el manifiesto de variantes.
+import logging    # Para registrar las variantes generadas.
+import os         # Para gestionar los archivos generados.
+import re         # Para validar los nombres de archivo pedidos.
+import threading  # Para proteger el manifiesto cuando varias peticiones lo usan a la vez.
+from PIL import Image, ImageOps # Pillow, para redimensionar y recodificar las imágenes.
+
+# Índice en memoria de las imágenes y hash del contenido de cada una.
+from app.services.image_index import IMAGES_DIR, index as image_index
+
+logger = logging.getLogger(__name__)
+
+# --- Configuración ---
+# Carpeta donde se guardan las variantes generadas y su manifiesto.
+VARIANTS_DIR = os.getenv("IMAGE_VARIANTS_DIR", "cache/variants")
+MANIFEST_PATH = os.path.join(VARIANTS_DIR, "manifest.json")
+# Anchos generados (en píxeles). El más pequeño sirve como miniatura.
+VARIANT_WIDTHS = tuple(
+    int(width) for width in os.getenv("IMAGE_VARIANT_WIDTHS", "160,320,640,1024").split(",")
+)
+# Formatos generados, con su calidad de compresión.
+FORMATS = {"webp": {"format": "WEBP", "quality": 80, "method": 4},
+           "jpeg": {"format": "JPEG", "quality": 82, "optimize": True, "progressive": True}}
+# Prefijo de las URLs de las variantes (ver app/routers/media.py).
+URL_PREFIX = "/media"
+# Formato de los nombres de las variantes: 16 caracteres del hash, el ancho y la extensión.
+_VARIANT_NAME = re.compile(r"[0-9a-f]{16}-[0-9]+\.(webp|jpeg)")
+
+# --- Estado en Memoria ---
+# El manifiesto indica, por hash del original, qué variantes existen:
+# {hash: {"webp": {ancho: nombre_de_archivo}, "jpeg": {...}}}
+_lock = threading.Lock()
+_manifest = None
+_manifest_mtime_ns = None  # Fecha de modificación del archivo cuando se leyó.
+
+
+def _load_manifest() -> dict:
+    """
+    Devuelve el manifiesto, volviendo a leerlo de disco si el archivo cambió (ej: otro
+    proceso terminó de generar variantes después de que este lo leyera).
+    Debe llamarse con `_lock` adquirido.
+    """
+    global _manifest, _manifest_mtime_ns
+    try:
+        mtime_ns = os.stat(MANIFEST_PATH).st_mtime_ns
+    except OSError:
+        mtime_ns = None
+    if _manifest is None or (mtime_ns is not None and mtime_ns != _manifest_mtime_ns):
+        try:
+            with open(MANIFEST_PATH, "r", encoding="utf-8") as f:
+                _manifest = json.load(f)
+        except (OSError, ValueError):
+            _manifest = {}
+        _manifest_mtime_ns = mtime_ns
+    return _manifest
+
+
+def _save_manifest() -> None:
+    """
+    Escribe el manifiesto de forma atómica. Debe llamarse con `_lock` adquirido.
+    """
+    global _manifest_mtime_ns
+    os.makedirs(VARIANTS_DIR, exist_ok=True)
+    # El temporal lleva el pid: varios procesos pueden guardar el manifiesto a la vez.
+    tmp_path = f"{MANIFEST_PATH}.tmp-{os.getpid()}"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(_manifest, f, indent=2)
+    os.replace(tmp_path, MANIFEST_PATH)
+    _manifest_mtime_ns = os.stat(MANIFEST_PATH).st_mtime_ns
+
+
+def _generate(image_name: str, content_hash: str) -> dict:
+    """
+    Genera todas las variantes de una imagen.
+
+    Returns:
+        dict: {formato: {ancho: nombre_de_archivo}}
+    """
+    with Image.open(os.path.join(IMAGES_DIR, image_name)) as source:
+        # Respeta la orientación EXIF y elimina el canal alfa (JPEG no lo admite).
+        image = ImageOps.exif_transpose(source).convert("RGB")
+
+    # Los anchos mayores que el original se limitan al ancho original (nunca se amplía).
+    widths = sorted({min(width, image.width) for width in VARIANT_WIDTHS})
+    variants = {fmt: {} for fmt in FORMATS}
+    os.makedirs(VARIANTS_DIR, exist_ok=True)
+    for width in widths:
+        height = max(1, round(image.height * width / image.width))
+        resized = image if width == image.width else image.resize((width, height), Image.LANCZOS)
+        for fmt, options in FORMATS.items():
+            filename = f"{content_hash[:16]}-{width}.{fmt}"
+            path = os.path.join(VARIANTS_DIR, filename)
+            if not os.path.exists(path):
+                # Se escribe en un temporal y se renombra: un archivo a medio escribir (por un
+                # fallo o por otro proceso generando la misma variante) nunca llega a servirse,
+                # y estas URLs se cachean como 'immutable' durante un año.
+                tmp_path = f"{path}.tmp-{os.getpid()}"
+                resized.save(tmp_path, **options)
+                os.replace(tmp_path, path)
+            variants[fmt][str(width)] = filename
+    return variants
+
+
+def build_all() -> dict:
+    """
+    Genera las variantes de todas las imágenes del corpus que aún no las tengan
+    y elimina las de imágenes que ya no existen.
+
+    Returns:
+        dict: El número de imágenes ya procesadas, procesadas ahora y fallidas.
+    """
+    stats = {"cached": 0, "generated": 0, "failed": 0}
+    image_index.refresh(force=True)
+    live_hashes = set()
+    for image_name in image_index.images():
+        try:
+            content_hash = image_index.content_hash(image_name)
+            live_hashes.add(content_hash)
+            with _lock:
+                if content_hash in _load_manifest():
+                    stats["cached"] += 1
+                    continue
+            variants = _generate(image_name, content_hash)
+            with _lock:
+                _load_manifest()[content_hash] = variants
+                _save_manifest()
+            stats["generated"] += 1
+        except Exception as e:
+            logger.warning("No se pudieron generar las variantes de %s: %s", image_name, e)
+            stats["failed"] += 1
+
+    # Limpieza de las variantes de imágenes eliminadas o modificadas.
+    with _lock:
+        manifest = _load_manifest()
+        for content_hash in [h for h in manifest if h not in live_hashes]:
+            for files in manifest.pop(content_hash).values():
+                for filename in files.values():
+                    try:
+                        os.remove(os.path.join(VARIANTS_DIR, filename))
+                    except FileNotFoundError:
+                        pass
+        _save_manifest()
+
+    logger.info("Variantes de imágenes listas: %s", stats, extra=stats)
+    return stats
+
+
+def variant_url(image_name: str, width: int, fmt: str = "webp"):
+    """
+    Elige la variante más pequeña cuyo ancho cubre el ancho pedido.
+
+    Args:
+        image_name (str): El nombre del archivo original.
+        width (int): El ancho (en píxeles) en que se mostrará la imagen.
+        fmt (str): "webp" o "jpeg".
+
+    Returns:
+        str | None: La URL de la variante, o None si la imagen aún no tiene variantes.
+    """
+    try:
+        content_hash = image_index.content_hash(image_name)
+    except FileNotFoundError:
+        return None
+    with _lock:
+        files = _load_manifest().get(content_hash, {}).get(fmt)
+    if not files:
+        return None
+    widths = sorted(int(w) for w in files)
+    # Si ninguna variante es suficientemente ancha, se usa la mayor.
+    chosen = next((w for w in widths if w >= width), widths[-1])
+    return f"{URL_PREFIX}/{files[str(chosen)]}"
+
+
+def resolve(filename: str):
+    """
+    Comprueba que un nombre de archivo corresponde a una variante generada.
+
+    Args:
+        filename (str): El nombre pedido en la URL.
+
+    Returns:
+        str | None: La ruta del archivo en disco, o None si no es una variante válida.
+    """
+    # Solo se aceptan nombres con el formato exacto de una variante (evita rutas como '../').
+    if not _VARIANT_NAME.fullmatch(filename):
+        return None
+    path = os.path.join(VARIANTS_DIR, filename)
+    return path if os.path.isfile(path) else None
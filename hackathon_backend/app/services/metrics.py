@@ -0,0 +1,171 @@
+# app/services/metrics.py
+
+# --- Métricas de Prometheus ---
+# Se exponen en /metrics (formato de texto de Prometheus). Si la API se ejecuta con
+# varios workers de uvicorn, hay que definir PROMETHEUS_MULTIPROC_DIR (una carpeta
+# vacía y escribible) para que /metrics agregue los valores de todos los procesos.
+
+import os
+import time
+from contextlib import contextmanager
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST, CollectorRegistry, Counter, Gauge, Histogram, generate_latest, multiprocess
+)
+
+# Cubetas (en segundos) pensadas para latencias de milisegundos a decenas de segundos.
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 40, 80)
+
+# --- Peticiones HTTP a la API ---
+HTTP_REQUEST_SECONDS = Histogram(
+    "http_request_duration_seconds", "Duración de las peticiones a la API.",
+    ["method", "route", "status"], buckets=LATENCY_BUCKETS,
+)
+HTTP_IN_FLIGHT = Gauge(
+    "http_requests_in_flight", "Peticiones a la API en curso.",
+    ["method", "route"], multiprocess_mode="livesum",
+)
+
+# --- Inferencia de BLIP ---
+BLIP_PREPROCESS_SECONDS = Histogram(
+    "blip_preprocess_duration_seconds", "Tiempo de preprocesado de las imágenes de un lote.",
+    buckets=LATENCY_BUCKETS,
+)
+BLIP_GENERATE_SECONDS = Histogram(
+    "blip_generate_duration_seconds", "Tiempo de model.generate para un lote.",
+    buckets=LATENCY_BUCKETS,
+)
+BLIP_REJECTED = Counter(
+    "blip_queue_rejected_total", "Peticiones rechazadas (503) porque la cola de BLIP estaba llena.",
+)
+BLIP_BATCH_SIZE = Histogram(
+    "blip_batch_size", "Número de imágenes por lote de inferencia.",
+    buckets=(1, 2, 4, 8, 16, 32),
+)
+
+# --- Servicios externos (OpenAI, Gemini, YouTube) ---
+UPSTREAM_SECONDS = Histogram(
+    "upstream_request_duration_seconds", "Duración de las llamadas a servicios externos.",
+    ["provider", "operation"], buckets=LATENCY_BUCKETS,
+)
+UPSTREAM_RESPONSES = Counter(
+    "upstream_responses_total", "Respuestas de los servicios externos por código de estado.",
+    ["provider", "operation", "status"],
+)
+LLM_TOKENS = Counter(
+    "llm_tokens_total", "Tokens consumidos en las llamadas a los LLM.",
+    ["provider", "model", "kind"],
+)
+UPSTREAM_QUEUE_SECONDS = Histogram(
+    "upstream_queue_wait_seconds", "Espera en el planificador antes de llamar al servicio externo.",
+    ["provider", "priority"], buckets=LATENCY_BUCKETS,
+)
+UPSTREAM_CONCURRENCY_LIMIT = Gauge(
+    "upstream_concurrency_limit", "Límite adaptativo (AIMD) de llamadas simultáneas por proveedor.",
+    ["provider"], multiprocess_mode="max",
+)
+UPSTREAM_THROTTLED = Counter(
+    "upstream_throttled_total", "Respuestas 429 o con Retry-After recibidas de los servicios externos.",
+    ["provider"],
+)
+UPSTREAM_RETRIES = Counter(
+    "upstream_retries_total", "Reintentos de llamadas a servicios externos tras un error transitorio.",
+    ["provider"],
+)
+UPSTREAM_CIRCUIT_STATE = Gauge(
+    "upstream_circuit_state", "Estado del circuit breaker por proveedor (0 cerrado, 1 semiabierto, 2 abierto).",
+    ["provider"], multiprocess_mode="max",
+)
+
+# --- Pre-evaluación local ---
+PREGRADE_DECISIONS = Counter(
+    "pregrade_decisions_total", "Evaluaciones resueltas localmente (por motivo) o enviadas al LLM ('llm').",
+    ["outcome"],
+)
+
+# --- Cachés ---
+CACHE_REQUESTS = Counter(
+    "cache_requests_total", "Consultas a las cachés, por resultado (hit o miss).",
+    ["cache", "result"],
+)
+
+
+class UpstreamCall:
+    """
+    Resultado de una llamada a un servicio externo, que el código que la hace
+    completa con el código de estado (por defecto "ok", o "error" si hay una excepción).
+    """
+
+    def __init__(self):
+        self.status = "ok"
+
+
+@contextmanager
+def observe_upstream(provider: str, operation: str):
+    """
+    Mide la duración de una llamada a un servicio externo y cuenta su código de estado.
+
+    Uso:
+        with observe_upstream("openai", "feedback") as call:
+            response = await client.post(...)
+            call.status = response.status_code
+    """
+    call = UpstreamCall()
+    started = time.perf_counter()
+    try:
+        yield call
+    except Exception as e:
+        if call.status == "ok":
+            call.status = getattr(e, "code", None) or type(e).__name__
+        raise
+    finally:
+        UPSTREAM_SECONDS.labels(provider, operation).observe(time.perf_counter() - started)
+        UPSTREAM_RESPONSES.labels(provider, operation, str(call.status)).inc()
+
+
+def record_tokens(provider: str, model: str, prompt_tokens, completion_tokens) -> None:
+    """
+    Suma los tokens de entrada y de salida de una llamada a un LLM.
+    """
+    if prompt_tokens:
+        LLM_TOKENS.labels(provider, model, "prompt").inc(prompt_tokens)
+    if completion_tokens:
+        LLM_TOKENS.labels(provider, model, "completion").inc(completion_tokens)
+
+
+def record_cache(cache: str, hit: bool) -> None:
+    """
+    Cuenta un acierto o un fallo de una caché.
+    """
+    CACHE_REQUESTS.labels(cache, "hit" if hit else "miss").inc()
+
+
+def record_blip_batch(timings: dict) -> None:
+    """
+    Registra los tiempos de un lote de BLIP y los aciertos de la caché de tensores, tal
+    como los mide `blip_service._generate_batch` (en este proceso o en uno de inferencia).
+    """
+    if "preprocess_seconds" in timings:
+        BLIP_PREPROCESS_SECONDS.observe(timings["preprocess_seconds"])
+    if "batch_size" in timings:
+        BLIP_BATCH_SIZE.observe(timings["batch_size"])
+    if "generate_seconds" in timings:
+        BLIP_GENERATE_SECONDS.observe(timings["generate_seconds"])
+    if timings.get("pixel_cache_hits"):
+        CACHE_REQUESTS.labels("pixels", "hit").inc(timings["pixel_cache_hits"])
+    if timings.get("pixel_cache_misses"):
+        CACHE_REQUESTS.labels("pixels", "miss").inc(timings["pixel_cache_misses"])
+
+
+def render() -> tuple:
+    """
+    Genera el texto de /metrics.
+
+    Returns:
+        tuple: (contenido, tipo de contenido)
+    """
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry), CONTENT_TYPE_LATEST
+    return generate_latest(), CONTENT_TYPE_LATEST
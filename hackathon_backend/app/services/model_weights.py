@@ -0,0 +1,188 @@
+# app/services/model_weights.py
+
+# --- Pesos del Modelo en Memoria Mapeada (safetensors) ---
+# Con varios workers de uvicorn (o varios procesos de inferencia) cada proceso
+# cargaba su propia copia de los pesos de BLIP. Aquí los pesos se guardan una sola
+# vez en formato safetensors y cada proceso los abre con memoria mapeada
+# (copy-on-write, igual que la caché de tensores de pixel_cache.py): los tensores
+# apuntan directamente a las páginas del archivo, que el sistema operativo comparte
+# entre todos los procesos. La carga es casi instantánea y la memoria no crece con
+# el número de procesos.
+#
+# Formato de un archivo .safetensors: 8 bytes con la longitud de la cabecera, una
+# cabecera JSON ({nombre: {"dtype", "shape", "data_offsets"}}) y los datos.
+#
+# torch y transformers se importan dentro de las funciones (importarlos tarda segundos).
+
+# --- Importaciones Necesarias ---
+import json       # Para leer la cabecera de los archivos safetensors.
+import logging    # Para registrar la conversión y la memoria de cada proceso.
+import os         # Para gestionar los archivos convertidos.
+import shutil     # Para descartar una conversión a medias.
+import struct     # Para leer la longitud de la cabecera.
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# --- Configuración ---
+# Carpeta con el modelo convertido a safetensors (si el original no lo está ya).
+SAFETENSORS_DIR = os.getenv("BLIP_SAFETENSORS_DIR", "cache/blip-safetensors")
+# Nombre del archivo de pesos que usa transformers.
+WEIGHTS_NAME = "model.safetensors"
+
+# Tipos de safetensors -> tipos de numpy. BF16 no existe en numpy: se lee como
+# uint16 y se reinterpreta en torch (ver `_to_torch`).
+_DTYPES = {
+    "F64": np.float64, "F32": np.float32, "F16": np.float16, "BF16": np.uint16,
+    "I64": np.int64, "I32": np.int32, "I16": np.int16, "I8": np.int8, "U8": np.uint8, "BOOL": np.bool_,
+}
+
+
+def ensure_safetensors(model_path: str) -> str:
+    """
+    Devuelve una carpeta con el modelo en formato safetensors (un único archivo),
+    convirtiendo el checkpoint original la primera vez si hace falta.
+
+    Args:
+        model_path (str): La carpeta del modelo original.
+
+    Returns:
+        str: La carpeta del modelo a cargar (la original o la convertida).
+    """
+    if os.path.exists(os.path.join(model_path, WEIGHTS_NAME)):
+        return model_path
+    if os.path.exists(os.path.join(SAFETENSORS_DIR, WEIGHTS_NAME)):
+        return SAFETENSORS_DIR
+
+    from transformers import BlipForConditionalGeneration, BlipProcessor
+
+    logger.info("Convirtiendo el modelo de %s a safetensors en %s (solo la primera vez)...", model_path, SAFETENSORS_DIR)
+    # Se escribe en una carpeta temporal y se renombra al final, para que otro
+    # proceso nunca abra una conversión a medias.
+    tmp_dir = f"{SAFETENSORS_DIR}.tmp-{os.getpid()}"
+    try:
+        model = BlipForConditionalGeneration.from_pretrained(model_path)
+        # Un único archivo (sin fragmentos), para mapearlo de una vez.
+        model.save_pretrained(tmp_dir, safe_serialization=True, max_shard_size="100GB")
+        BlipProcessor.from_pretrained(model_path).save_pretrained(tmp_dir)
+        del model
+        os.replace(tmp_dir, SAFETENSORS_DIR)
+    except OSError:
+        # Otro proceso terminó la conversión antes: se usa la suya.
+        if not os.path.exists(os.path.join(SAFETENSORS_DIR, WEIGHTS_NAME)):
+            raise
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+    return SAFETENSORS_DIR
+
+
+def read_header(path: str) -> tuple:
+    """
+    Lee la cabecera de un archivo safetensors.
+
+    Returns:
+        tuple: (cabecera sin la entrada '__metadata__', posición donde empiezan los datos)
+    """
+    with open(path, "rb") as f:
+        (header_size,) = struct.unpack("<Q", f.read(8))
+        header = json.loads(f.read(header_size))
+    header.pop("__metadata__", None)
+    return header, 8 + header_size
+
+
+def _to_torch(array: np.ndarray, dtype: str):
+    import torch
+    tensor = torch.from_numpy(array)
+    return tensor.view(torch.bfloat16) if dtype == "BF16" else tensor
+
+
+def load_state_dict_mmap(path: str) -> dict:
+    """
+    Abre un archivo safetensors con memoria mapeada y devuelve sus tensores sin
+    copiarlos: cada tensor es una vista de las páginas del archivo.
+
+    Args:
+        path (str): La ruta del archivo .safetensors.
+
+    Returns:
+        dict: nombre del parámetro -> torch.Tensor
+    """
+    header, data_start = read_header(path)
+    # 'c' (copy-on-write): las páginas se comparten entre procesos mientras nadie las
+    # modifique, y torch puede usarlas como memoria escribible.
+    data = np.memmap(path, dtype=np.uint8, mode="c", offset=data_start)
+    state_dict = {}
+    for name, info in header.items():
+        start, end = info["data_offsets"]
+        array = data[start:end].view(_DTYPES[info["dtype"]]).reshape(info["shape"])
+        state_dict[name] = _to_torch(array, info["dtype"])
+    return state_dict
+
+
+def load_model_mmap(model_class, directory: str):
+    """
+    Construye el modelo sin inicializar sus pesos y le asigna los tensores mapeados
+    en memoria (sin copia).
+
+    Args:
+        model_class: La clase de transformers (ej: BlipForConditionalGeneration).
+        directory (str): La carpeta con config.json y model.safetensors.
+
+    Returns:
+        El modelo, en modo evaluación.
+    """
+    from transformers import AutoConfig, GenerationConfig
+    from transformers.modeling_utils import no_init_weights
+
+    config = AutoConfig.from_pretrained(directory)
+    # Sin inicializar: los pesos aleatorios se sustituirían de todos modos.
+    with no_init_weights():
+        model = model_class(config)
+    state_dict = load_state_dict_mmap(os.path.join(directory, WEIGHTS_NAME))
+    # assign=True sustituye los parámetros por los tensores mapeados en vez de copiarlos.
+    missing, unexpected = model.load_state_dict(state_dict, strict=False, assign=True)
+    # Los pesos compartidos (ej. la capa de salida y los embeddings) no se guardan dos veces.
+    model.tie_weights()
+    missing = [name for name in missing if name not in _tied_parameters(model)]
+    if missing:
+        raise ValueError(f"Faltan {len(missing)} pesos en {directory} (ej: {missing[0]}).")
+    if unexpected:
+        logger.warning("Se ignoraron %d pesos desconocidos (ej: %s).", len(unexpected), unexpected[0])
+    # Los valores por defecto de generación (max_length, num_beams...) están en su propio
+    # archivo: sin él, generate() no se comportaría igual que con from_pretrained.
+    if os.path.exists(os.path.join(directory, "generation_config.json")):
+        model.generation_config = GenerationConfig.from_pretrained(directory)
+    model.eval()
+    return model
+
+
+def _tied_parameters(model) -> set:
+    """
+    Devuelve los nombres de los parámetros que comparten memoria con otro ya cargado.
+    """
+    seen = {}
+    tied = set()
+    for name, parameter in model.named_parameters(remove_duplicate=False):
+        if parameter.data_ptr() in seen:
+            tied.add(name)
+        else:
+            seen[parameter.data_ptr()] = name
+    return tied
+
+
+def memory_usage() -> dict:
+    """
+    Devuelve la memoria del proceso actual, en MB: la residente (rss), la propia,
+    no compartida con otros procesos (uss), y la proporcional (pss, donde las
+    páginas compartidas se reparten entre los procesos que las usan).
+    """
+    import psutil
+    process = psutil.Process()
+    try:
+        info = process.memory_full_info()
+    except (psutil.AccessDenied, AttributeError):
+        info = process.memory_info()
+    return {
+        key: round(getattr(info, key) / (1024 * 1024), 1)
+        for key in ("rss", "uss", "pss") if hasattr(info, key)
+    }
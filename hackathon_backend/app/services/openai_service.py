@@ -1,9 +1,23 @@
 # --- Importaciones de Módulos ---
 import os           # Para acceder a variables de entorno (claves de API).
 import json         # Para trabajar con datos en formato JSON.
-import requests     # Para realizar peticiones HTTP a la API.
+import logging      # Para registrar los errores de las llamadas a la API.
+import httpx        # Para capturar los errores de las peticiones HTTP.
 from dotenv import load_dotenv # Para cargar variables desde un archivo .env
 
+# Cliente HTTP asíncrono compartido, con pool de conexiones y keep-alive.
+from app.services.http_client import get_client, timeout_for
+# Caché de resultados para no repetir llamadas idénticas a OpenAI.
+from app.services.response_cache import ResponseCache, normalize_text
+# Métricas de Prometheus (latencia, códigos de estado y tokens consumidos).
+from app.services.metrics import observe_upstream, record_tokens
+# Planificador compartido: límites por minuto, prioridades y concurrencia adaptativa.
+from app.services.upstream_scheduler import INTERACTIVE, NORMAL, openai_scheduler
+# Plazos de las peticiones, reintentos y circuit breaker del proveedor.
+from app.services import resilience
+
+logger = logging.getLogger(__name__)
+
 # Carga las variables de entorno definidas en el archivo .env.
 # Esto permite mantener las claves secretas fuera del código fuente.
 load_dotenv()
@@ -14,8 +28,33 @@ OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 # Define la URL del endpoint para los modelos de chat de OpenAI.
 API_URL = "https://api.openai.com/v1/chat/completions"
 
+# Modelos utilizados por cada funcionalidad.
+FEEDBACK_MODEL = "gpt-4.1-nano" # Modelo pequeño y rápido, ideal para tareas de evaluación simples.
+GIFT_MODEL = "gpt-4o-mini"      # Modelo más reciente y capaz, bueno para generar contenido creativo.
+
+# Versión de cada prompt. Forma parte de la clave de la caché: al modificar un prompt
+# hay que incrementar su versión para que no se sirvan respuestas generadas con el anterior.
+FEEDBACK_PROMPT_VERSION = "1"
+GIFT_PROMPT_VERSION = "1"
+
+# Tokens de respuesta que se esperan de cada llamada (para reservar presupuesto en el planificador).
+FEEDBACK_EXPECTED_COMPLETION_TOKENS = 250
+GIFT_EXPECTED_COMPLETION_TOKENS = 600
+
+# Timeout (en segundos) de cada intento; se recorta al plazo de la petición en curso.
+REQUEST_TIMEOUT = float(os.getenv("OPENAI_TIMEOUT_SECONDS", "60"))
+
+# --- Cachés de Resultados ---
+# Cada endpoint tiene su propio TTL (en segundos). Las evaluaciones de una misma
+# respuesta no cambian, así que duran más; los cuestionarios se renuevan antes para dar variedad.
+feedback_cache = ResponseCache("feedback", ttl=float(os.getenv("FEEDBACK_CACHE_TTL", "86400")))
+gift_cache = ResponseCache("gift", ttl=float(os.getenv("GIFT_CACHE_TTL", "3600")))
+
+# Pregunta GIFT que se devuelve cuando falla la generación, para que Moodle pueda procesarla.
+GIFT_ERROR = "::Error:: No se pudieron generar las preguntas. {{=OK}}"
+
 
-def get_ai_feedback(student_text: str, reference_text: str) -> dict:
+async def get_ai_feedback(student_text: str, reference_text: str) -> dict:
     """
     Envía el texto de un estudiante y un texto de referencia a la API de OpenAI
     para obtener una evaluación estructurada en formato JSON.
@@ -27,6 +66,15 @@ def get_ai_feedback(student_text: str, reference_text: str) -> dict:
     Returns:
         dict: Un diccionario con la evaluación, feedback y texto corregido.
     """
+    # Antes de llamar a la API se busca un resultado previo para las mismas entradas.
+    cache_key = feedback_cache.make_key(
+        FEEDBACK_MODEL, FEEDBACK_PROMPT_VERSION,
+        normalize_text(student_text), normalize_text(reference_text)
+    )
+    cached = await feedback_cache.aget(cache_key)
+    if cached is not None:
+        return cached
+
     # Se crea un 'prompt' detallado que instruye a la IA sobre su rol, la tarea,
     # los criterios de evaluación y, muy importante, el formato de salida.
     prompt_template = f"""
@@ -52,24 +100,27 @@ def get_ai_feedback(student_text: str, reference_text: str) -> dict:
 
     # El cuerpo (payload) de la petición a la API.
     data = {
-        "model": "gpt-4.1-nano", # Modelo pequeño y rápido, ideal para tareas de evaluación simples.
+        "model": FEEDBACK_MODEL,
         "messages": [{"role": "user", "content": prompt_template}],
         "response_format": {"type": "json_object"}, # Forza a la API a devolver un JSON válido.
         "temperature": 0.3 # Baja temperatura para respuestas más predecibles y menos creativas.
     }
 
     try:
-        # Se envía la petición POST a la API de OpenAI.
-        response = requests.post(API_URL, headers=headers, json=data)
-        response.raise_for_status() # Lanza un error si la respuesta HTTP no es exitosa (ej. 401, 500).
-        
+        # Se envía la petición POST a la API de OpenAI reutilizando una conexión del pool.
+        # `await` libera el bucle de eventos mientras se espera la respuesta del LLM.
+        # La evaluación es interactiva: pasa por delante de los cuestionarios y los resúmenes.
+        body = await _post_completion("feedback", headers, data, INTERACTIVE, FEEDBACK_EXPECTED_COMPLETION_TOKENS)
+
         # El resultado de la IA es un string con formato JSON.
         # `json.loads` lo convierte a un diccionario de Python.
-        ai_response_dict = json.loads(response.json()['choices'][0]['message']['content'])
+        ai_response_dict = json.loads(body['choices'][0]['message']['content'])
+        # Solo se guardan las respuestas válidas; los errores nunca se cachean.
+        await feedback_cache.aset(cache_key, ai_response_dict)
         return ai_response_dict
-    except requests.exceptions.RequestException as e:
-        # Captura errores de red y devuelve un diccionario de error estándar.
-        print(f"Error llamando a la API de OpenAI: {e}")
+    except (httpx.HTTPError, resilience.UpstreamUnavailable) as e:
+        # Captura errores de red, timeouts y el circuito abierto, y devuelve un diccionario de error estándar.
+        logger.warning("Error llamando a la API de OpenAI: %s", e)
         return {
             "evaluation": "Error",
             "feedback": "No se pudo conectar con el servicio de evaluación.",
@@ -77,16 +128,71 @@ def get_ai_feedback(student_text: str, reference_text: str) -> dict:
         }
 
 
-def generate_gift_questions(image_description: str) -> str:
+def _estimate_tokens(data: dict, expected_completion_tokens: int) -> int:
     """
-    Usa la descripción de una imagen para generar un conjunto de preguntas
-    en formato GIFT, compatible con Moodle.
+    Estima los tokens de una llamada (aproximadamente 4 caracteres por token del prompt
+    más la respuesta esperada), para reservarlos en el planificador.
+    """
+    prompt_chars = sum(len(message["content"]) for message in data["messages"])
+    return prompt_chars // 4 + expected_completion_tokens
+
+
+async def _post_completion(operation: str, headers: dict, data: dict, priority: int,
+                           expected_completion_tokens: int) -> dict:
+    """
+    Hace una llamada (sin streaming) a la API de chat de OpenAI a través del
+    planificador, con timeout, reintentos y circuit breaker (ver resilience.py).
+
+    Args:
+        operation (str): El nombre de la operación en las métricas.
+        headers (dict): Las cabeceras de la petición.
+        data (dict): El cuerpo de la petición.
+        priority (int): La prioridad de la llamada en el planificador.
+        expected_completion_tokens (int): Los tokens de respuesta esperados.
+
+    Returns:
+        dict: El cuerpo JSON de la respuesta.
+    """
+    estimated_tokens = _estimate_tokens(data, expected_completion_tokens)
+
+    async def attempt(timeout: float, ticket) -> dict:
+        with observe_upstream("openai", operation) as call:
+            response = await get_client().post(API_URL, headers=headers, json=data, timeout=timeout_for(timeout))
+            call.status = response.status_code
+        ticket.report(response.status_code, response.headers.get("Retry-After"))
+        response.raise_for_status() # Lanza un error si la respuesta HTTP no es exitosa (ej. 401, 500).
+        body = response.json()
+        _record_usage(data["model"], body.get("usage"), ticket)
+        return body
+
+    # Cada intento vuelve a pedir turno (tras un 429 el planificador lo retrasa); el
+    # timeout del intento empieza a contar cuando lo consigue.
+    return await resilience.call(
+        resilience.openai_breaker, attempt, timeout=REQUEST_TIMEOUT,
+        slot=lambda: openai_scheduler.slot(priority, estimated_tokens),
+    )
+
+
+def _record_usage(model: str, usage, ticket=None) -> None:
+    """
+    Suma a las métricas (y al permiso del planificador) los tokens que informa
+    OpenAI en el campo 'usage'.
+    """
+    if usage:
+        record_tokens("openai", model, usage.get("prompt_tokens"), usage.get("completion_tokens"))
+        if ticket is not None:
+            ticket.record_tokens(usage.get("total_tokens"))
+
+
+def _build_gift_request(image_description: str) -> tuple:
+    """
+    Construye las cabeceras y el cuerpo de la petición de preguntas GIFT.
 
     Args:
         image_description (str): El texto que describe la imagen.
 
     Returns:
-        str: Un string que contiene las preguntas en formato GIFT.
+        tuple: (cabeceras, cuerpo) de la petición a OpenAI.
     """
     # En los f-strings de Python, las llaves dobles {{ y }} se usan para
     # representar llaves literales { y } en el texto final.
@@ -117,19 +223,111 @@ def generate_gift_questions(image_description: str) -> str:
     }
 
     data = {
-        "model": "gpt-4o-mini",  # Modelo más reciente y capaz, bueno para generar contenido creativo.
+        "model": GIFT_MODEL,
         "messages": [{"role": "user", "content": prompt_template}],
         "temperature": 0.6 # Temperatura media para obtener variedad en las preguntas sin ser demasiado aleatorio.
     }
+    return headers, data
+
+
+async def generate_gift_questions(image_description: str, use_cache: bool = True) -> str:
+    """
+    Usa la descripción de una imagen para generar un conjunto de preguntas
+    en formato GIFT, compatible con Moodle.
+
+    Args:
+        image_description (str): El texto que describe la imagen.
+        use_cache (bool): Si es False, siempre se pide un cuestionario nuevo a OpenAI
+                          (ej: para generar variantes distintas de una misma imagen).
+
+    Returns:
+        str: Un string que contiene las preguntas en formato GIFT.
+    """
+    cache_key = gift_cache.make_key(GIFT_MODEL, GIFT_PROMPT_VERSION, normalize_text(image_description))
+    cached = await gift_cache.aget(cache_key) if use_cache else None
+    if cached is not None:
+        return cached
+
+    headers, data = _build_gift_request(image_description)
 
     try:
-        response = requests.post(API_URL, headers=headers, json=data)
-        response.raise_for_status()
-        
+        body = await _post_completion("gift", headers, data, NORMAL, GIFT_EXPECTED_COMPLETION_TOKENS)
+
         # Aquí se extrae directamente el texto de la respuesta, que ya viene en formato GIFT.
-        gift_text = response.json()['choices'][0]['message']['content']
+        gift_text = body['choices'][0]['message']['content']
+        await gift_cache.aset(cache_key, gift_text)
         return gift_text
-    except requests.exceptions.RequestException as e:
-        print(f"Error generando preguntas GIFT: {e}")
+    except (httpx.HTTPError, resilience.UpstreamUnavailable) as e:
+        logger.warning("Error generando preguntas GIFT: %s", e)
         # Devuelve una pregunta GIFT de error para que Moodle pueda procesarla.
-        return "::Error:: No se pudieron generar las preguntas. {{=OK}}"
\ No newline at end of file
+        return GIFT_ERROR
+
+
+async def stream_gift_questions(image_description: str):
+    """
+    Versión en streaming de `generate_gift_questions`: pide a OpenAI que envíe
+    la respuesta token a token y la va entregando a medida que llega.
+
+    Args:
+        image_description (str): El texto que describe la imagen.
+
+    Yields:
+        str: Fragmentos consecutivos del texto GIFT (o la pregunta de error, si la
+             llamada falla antes de recibir ningún fragmento).
+
+    Raises:
+        httpx.HTTPError, UpstreamUnavailable: Si la llamada falla con el stream ya
+                                              empezado (el texto enviado está incompleto).
+    """
+    cache_key = gift_cache.make_key(GIFT_MODEL, GIFT_PROMPT_VERSION, normalize_text(image_description))
+    cached = await gift_cache.aget(cache_key)
+    if cached is not None:
+        yield cached
+        return
+
+    headers, data = _build_gift_request(image_description)
+    data["stream"] = True
+    # Pide que el último evento incluya el consumo de tokens (sin 'choices').
+    data["stream_options"] = {"include_usage": True}
+
+    parts = []
+    try:
+        # Un stream ya empezado no se reintenta (el cliente ya recibió parte del texto):
+        # solo se comprueba el circuito y se limita cada espera al plazo de la petición.
+        # La latencia medida es la del stream completo, hasta el último token; el permiso
+        # del planificador también se mantiene hasta entonces. La espera de turno no
+        # cuenta en el circuito ni en el timeout de la llamada.
+        estimated_tokens = _estimate_tokens(data, GIFT_EXPECTED_COMPLETION_TOKENS)
+        async with resilience.acquire(openai_scheduler.slot(NORMAL, estimated_tokens)) as ticket:
+            timeout = resilience.attempt_timeout(REQUEST_TIMEOUT)
+            with resilience.openai_breaker.guard():
+                with observe_upstream("openai", "gift_stream") as call:
+                    async with get_client().stream("POST", API_URL, headers=headers, json=data,
+                                                   timeout=timeout_for(timeout)) as response:
+                        call.status = response.status_code
+                        ticket.report(response.status_code, response.headers.get("Retry-After"))
+                        response.raise_for_status()
+                        # OpenAI responde con Server-Sent Events: líneas "data: {...}" y un "data: [DONE]" final.
+                        async for line in resilience.within_deadline(response.aiter_lines(), REQUEST_TIMEOUT):
+                            if not line.startswith("data: "):
+                                continue
+                            payload = line[len("data: "):]
+                            if payload.strip() == "[DONE]":
+                                break
+                            event = json.loads(payload)
+                            _record_usage(GIFT_MODEL, event.get("usage"), ticket)
+                            choices = event.get("choices") or [{}]
+                            delta = choices[0].get("delta", {}).get("content")
+                            if delta:
+                                parts.append(delta)
+                                yield delta
+    except (httpx.HTTPError, resilience.UpstreamUnavailable) as e:
+        logger.warning("Error generando preguntas GIFT: %s", e)
+        if parts:
+            # El cliente ya recibió parte del cuestionario: debe saber que está incompleto.
+            raise
+        yield GIFT_ERROR
+        return
+
+    # Solo se guarda en la caché un cuestionario recibido completo.
+    await gift_cache.aset(cache_key, "".join(parts))
@@ -0,0 +1,195 @@
+# app/services/pixel_cache.py
+
+# --- Caché de Tensores Preprocesados (memory-mapped) ---
+# Antes de llegar al modelo, cada imagen se decodifica (JPEG), se convierte a RGB,
+# se redimensiona y se normaliza. Como el corpus es fijo, este trabajo se hace una
+# sola vez: todos los tensores se guardan en un único archivo .npy que se abre con
+# memoria mapeada. En la ruta caliente basta con leer una fila del archivo (sin
+# copia), y los distintos procesos que lo abren comparten las mismas páginas de memoria.
+
+# --- Importaciones Necesarias ---
+import hashlib    # Para nombrar cada versión del archivo de tensores según su contenido.
+import json       # Para guardar el índice hash -> fila.
+import logging    # Para registrar la construcción de la caché.
+import os         # Para gestionar los archivos de la caché.
+import threading  # Para proteger el estado cuando varias peticiones lo usan a la vez.
+import numpy as np
+from PIL import Image # Python Imaging Library (Pillow) para abrir las imágenes.
+
+# Índice en memoria de las imágenes y hash del contenido de cada una.
+from app.services.image_index import IMAGES_DIR, index as image_index
+# Métricas de Prometheus (aciertos de la caché).
+from app.services.metrics import record_cache
+
+logger = logging.getLogger(__name__)
+
+# --- Configuración ---
+# Archivo con los tensores: un array float32 de forma (imágenes, 3, alto, ancho).
+# Cada construcción escribe una versión nueva junto a esta ruta ('pixel_values.<versión>.npy').
+DATA_PATH = os.getenv("PIXEL_CACHE_PATH", "cache/pixel_values.npy")
+# Archivo con el índice: hash del contenido de la imagen -> fila del array, y el
+# nombre de la versión del archivo de tensores a la que corresponde.
+INDEX_PATH = os.getenv("PIXEL_CACHE_INDEX_PATH", "cache/pixel_values.json")
+
+# --- Estado en Memoria ---
+_lock = threading.Lock()
+_data = None  # El array mapeado en memoria (o None si la caché no existe).
+_rows = {}    # hash del contenido -> fila de `_data`
+
+
+def _preprocess(processor, image_name: str) -> np.ndarray:
+    """
+    Decodifica, redimensiona y normaliza una imagen con el procesador de BLIP.
+
+    Returns:
+        np.ndarray: El tensor de la imagen, de forma (3, alto, ancho).
+    """
+    # Abre la imagen usando Pillow y la convierte al formato RGB, que es el estándar para el modelo.
+    raw_image = Image.open(os.path.join(IMAGES_DIR, image_name)).convert("RGB")
+    return processor.image_processor(images=raw_image, return_tensors="np")["pixel_values"][0]
+
+
+def load() -> bool:
+    """
+    Abre la caché desde disco con memoria mapeada (copy-on-write: las páginas se
+    comparten entre procesos mientras nadie las modifique).
+
+    Returns:
+        bool: True si la caché existe y se pudo abrir.
+    """
+    global _data, _rows
+    with _lock:
+        try:
+            # Primero el índice y después el archivo de tensores que nombra: así las filas
+            # siempre corresponden al archivo abierto, aunque otro proceso esté reconstruyendo.
+            with open(INDEX_PATH, "r", encoding="utf-8") as f:
+                index = json.load(f)
+            rows = index["rows"]
+            data_name = index.get("data")
+            data_path = os.path.join(os.path.dirname(DATA_PATH), data_name) if data_name else DATA_PATH
+            data = np.load(data_path, mmap_mode="c")
+        except FileNotFoundError:
+            return False
+        except (OSError, ValueError, KeyError) as e:
+            logger.warning("No se pudo abrir la caché de tensores (%s).", e)
+            return False
+        _data, _rows = data, rows
+        return True
+
+
+def lookup(image_name: str):
+    """
+    Busca el tensor preprocesado de una imagen.
+
+    Args:
+        image_name (str): El nombre del archivo de la imagen.
+
+    Returns:
+        np.ndarray | None: Una vista (sin copia) de forma (3, alto, ancho), o None
+                           si la imagen no está en la caché o cambió.
+    """
+    if _data is None:
+        return None
+    row = _rows.get(image_index.content_hash(image_name))
+    if row is None:
+        return None
+    return _data[row]
+
+
+def pixel_values_for(processor, image_name: str, stats: dict = None) -> np.ndarray:
+    """
+    Devuelve el tensor de una imagen desde la caché o, si no está, lo calcula.
+
+    Args:
+        processor: El procesador de BLIP.
+        image_name (str): El nombre del archivo de la imagen.
+        stats (dict): Si se indica, los aciertos y fallos de la caché se cuentan ahí
+                      ('pixel_cache_hits' y 'pixel_cache_misses') en vez de en las métricas.
+
+    Returns:
+        np.ndarray: El tensor de forma (3, alto, ancho).
+    """
+    cached = lookup(image_name)
+    if stats is None:
+        record_cache("pixels", cached is not None)
+    else:
+        key = "pixel_cache_hits" if cached is not None else "pixel_cache_misses"
+        stats[key] = stats.get(key, 0) + 1
+    if cached is not None:
+        return cached
+    return _preprocess(processor, image_name)
+
+
+def build(processor) -> dict:
+    """
+    Preprocesa todas las imágenes del corpus y escribe la caché en disco. Si ya
+    existe una caché con exactamente las mismas imágenes, no se hace nada.
+
+    Args:
+        processor: El procesador de BLIP (define el tamaño y la normalización).
+
+    Returns:
+        dict: El número de imágenes en la caché y si hubo que reconstruirla.
+    """
+    image_index.refresh(force=True)
+    hashes = {}
+    for image_name in image_index.images():
+        # Las imágenes con contenido idéntico comparten fila.
+        hashes.setdefault(image_index.content_hash(image_name), image_name)
+
+    size = processor.image_processor.size
+    shape = (len(hashes), 3, size["height"], size["width"])
+
+    if load() and set(_rows) == set(hashes) and _data.shape == shape:
+        return {"images": len(hashes), "rebuilt": False}
+
+    logger.info("Preprocesando %d imágenes en la caché de tensores...", len(hashes))
+    directory = os.path.dirname(DATA_PATH)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+
+    # Los tensores se escriben en un archivo versionado (el nombre depende de las imágenes
+    # y de la forma) y el índice, que apunta a él, se reemplaza al final: un lector nunca
+    # combina tensores nuevos con un índice viejo. Los temporales llevan el pid para que
+    # varios procesos que arrancan a la vez no escriban en el mismo archivo.
+    version = hashlib.sha256(json.dumps([sorted(hashes), shape]).encode("utf-8")).hexdigest()[:16]
+    data_name = f"{os.path.splitext(os.path.basename(DATA_PATH))[0]}.{version}.npy"
+    data_path = os.path.join(directory, data_name)
+    pid = os.getpid()
+
+    if not os.path.exists(data_path):
+        tmp_data_path = f"{data_path}.tmp-{pid}.npy"
+        array = np.lib.format.open_memmap(tmp_data_path, mode="w+", dtype=np.float32, shape=shape)
+        for row, (content_hash, image_name) in enumerate(sorted(hashes.items(), key=lambda item: item[1])):
+            array[row] = _preprocess(processor, image_name)
+        array.flush()
+        del array
+        os.replace(tmp_data_path, data_path)
+    rows = {
+        content_hash: row
+        for row, (content_hash, _) in enumerate(sorted(hashes.items(), key=lambda item: item[1]))
+    }
+
+    tmp_index_path = f"{INDEX_PATH}.tmp-{pid}"
+    with open(tmp_index_path, "w", encoding="utf-8") as f:
+        json.dump({"shape": shape, "rows": rows, "data": data_name}, f)
+    os.replace(tmp_index_path, INDEX_PATH)
+
+    load()
+    _remove_old_versions(data_name)
+    return {"images": len(hashes), "rebuilt": True}
+
+
+def _remove_old_versions(current: str) -> None:
+    """
+    Borra las versiones anteriores del archivo de tensores. Los procesos que aún
+    las tengan abiertas siguen leyéndolas (el sistema libera el espacio al cerrarlas).
+    """
+    directory = os.path.dirname(DATA_PATH) or "."
+    prefix = os.path.splitext(os.path.basename(DATA_PATH))[0] + "."
+    for name in os.listdir(directory):
+        if name.startswith(prefix) and name.endswith(".npy") and name != current and ".tmp-" not in name:
+            try:
+                os.remove(os.path.join(directory, name))
+            except OSError:
+                pass
@@ -0,0 +1,152 @@
+# app/services/pregrader.py
+
+# --- Pre-evaluación Local ---
+# Antes de llamar a OpenAI se calculan señales baratas sobre la respuesta del
+# estudiante (longitud, idioma, coincidencia con la referencia). Los casos obvios
+# (respuesta vacía, demasiado corta, escrita en otro idioma o idéntica a la
+# referencia) se resuelven aquí con una respuesta fija, sin coste ni latencia de
+# la API. Todo lo demás es ambiguo y se sigue enviando al LLM.
+
+# --- Importaciones Necesarias ---
+import os           # Para leer la configuración desde variables de entorno.
+import re           # Para separar el texto en palabras.
+import unicodedata  # Para normalizar las palabras (con o sin acentos).
+
+# --- Configuración ---
+# Se puede desactivar con PREGRADER_ENABLED=0 (todas las respuestas irán a OpenAI).
+PREGRADER_ENABLED = os.getenv("PREGRADER_ENABLED", "1") == "1"
+# Número mínimo de palabras para considerar que la respuesta es una frase.
+MIN_WORDS = int(os.getenv("PREGRADER_MIN_WORDS", "3"))
+# Número mínimo de palabras para que la detección del idioma sea fiable.
+LANGUAGE_MIN_WORDS = int(os.getenv("PREGRADER_LANGUAGE_MIN_WORDS", "4"))
+
+# Palabras funcionales muy frecuentes de cada idioma. Contar cuántas aparecen basta
+# para distinguir el francés del español y del inglés en frases cortas.
+STOPWORDS = {
+    "fr": {"le", "la", "les", "un", "une", "des", "du", "est", "et", "sur", "dans", "avec", "il", "elle",
+           "ils", "elles", "sont", "au", "aux", "ce", "cette", "ces", "qui", "pour", "pas", "son", "sa",
+           "ses", "devant", "derriere", "sous", "je", "vois", "deux", "trois", "tres", "y", "a"},
+    "es": {"el", "los", "las", "una", "unos", "unas", "es", "sobre", "con", "hay", "esta", "estan",
+           "al", "del", "este", "esto", "que", "para", "su", "sus", "delante", "detras", "debajo",
+           "yo", "veo", "dos", "tres", "muy"},
+    "en": {"the", "an", "is", "are", "and", "on", "in", "with", "there", "this", "that", "of", "to",
+           "his", "her", "its", "front", "behind", "under", "see", "two", "three", "very"},
+}
+
+# Respuestas fijas (en francés, como las que genera el LLM) para cada caso resuelto localmente.
+TEMPLATES = {
+    "empty": {
+        "evaluation": "Incorrecto",
+        "feedback": "Tu n'as rien écrit. Décris l'image avec une phrase complète en français.",
+    },
+    "too_short": {
+        "evaluation": "Incorrecto",
+        "feedback": "Ta réponse est trop courte. Essaie d'écrire une phrase complète pour décrire l'image.",
+    },
+    "wrong_language": {
+        "evaluation": "Incorrecto",
+        "feedback": "Ta réponse doit être écrite en français. Essaie de décrire l'image en français !",
+    },
+    "match": {
+        "evaluation": "Correcto",
+        "feedback": "Très bien ! Ta description est correcte et correspond parfaitement à l'image.",
+    },
+}
+
+
+def _fold(text: str) -> str:
+    """
+    Pasa un texto a minúsculas y le quita los acentos ('Éléphant' -> 'elephant').
+    """
+    decomposed = unicodedata.normalize("NFD", text.casefold())
+    return "".join(ch for ch in decomposed if not unicodedata.combining(ch))
+
+
+# Una palabra: letras y dígitos de cualquier alfabeto, incluidas ligaduras como 'œ'.
+WORD_RE = re.compile(r"[^\W_]+")
+
+
+def tokenize(text: str) -> list:
+    """
+    Separa un texto en palabras normalizadas (sin acentos, mayúsculas ni puntuación),
+    para detectar el idioma. Las elisiones del francés ("l'homme") se separan en dos palabras.
+    """
+    return WORD_RE.findall(_fold(text))
+
+
+def exact_words(text: str) -> list:
+    """
+    Separa un texto en palabras sin mayúsculas ni puntuación, pero conservando los
+    acentos ('Un homme à cheval' -> ['un', 'homme', 'à', 'cheval']). Es la forma con la
+    que se compara con la referencia: un acento que falta es una falta de ortografía.
+    """
+    return WORD_RE.findall(unicodedata.normalize("NFC", text).casefold())
+
+
+def detect_language(words: list) -> str:
+    """
+    Estima el idioma de un texto contando sus palabras funcionales.
+
+    Args:
+        words (list): Las palabras normalizadas del texto.
+
+    Returns:
+        str: "fr", "es", "en" o None si no hay señal suficiente.
+    """
+    scores = {language: sum(word in stopwords for word in words) for language, stopwords in STOPWORDS.items()}
+    best = max(scores, key=scores.get)
+    # Hacen falta al menos dos palabras funcionales para afirmar que NO es francés;
+    # en caso de empate (palabras compartidas como 'tres') se da prioridad al francés.
+    if scores[best] < 2 or scores["fr"] == scores[best]:
+        return "fr" if scores["fr"] else None
+    return best
+
+
+def compute_signals(student_text: str, reference_text: str) -> dict:
+    """
+    Calcula las señales baratas que usa la pre-evaluación.
+
+    Returns:
+        dict: El número de palabras, el idioma detectado y si la respuesta es idéntica
+              a la referencia (salvo mayúsculas, puntuación y espacios).
+    """
+    student_words = tokenize(student_text)
+    exact = exact_words(student_text)
+    return {
+        "words": len(student_words),
+        "language": detect_language(student_words),
+        "matches_reference": bool(exact) and exact == exact_words(reference_text),
+    }
+
+
+def pregrade(student_text: str, reference_text: str):
+    """
+    Intenta resolver la evaluación localmente.
+
+    Args:
+        student_text (str): La descripción escrita por el estudiante.
+        reference_text (str): La descripción de referencia de la imagen.
+
+    Returns:
+        tuple: (resultado, motivo). El resultado es un diccionario con la misma forma
+               que el de `openai_service.get_ai_feedback`, o None si el caso es
+               ambiguo y debe evaluarlo el LLM (en ese caso el motivo es "llm").
+    """
+    if not PREGRADER_ENABLED:
+        return None, "llm"
+
+    signals = compute_signals(student_text, reference_text)
+    if signals["words"] == 0:
+        reason = "empty"
+    elif signals["matches_reference"]:
+        reason = "match"
+    elif signals["words"] < MIN_WORDS:
+        reason = "too_short"
+    elif signals["words"] >= LANGUAGE_MIN_WORDS and signals["language"] not in (None, "fr"):
+        reason = "wrong_language"
+    else:
+        return None, "llm"
+
+    # El texto corregido de una respuesta vacía o en otro idioma no tiene sentido: se devuelve tal cual.
+    result = dict(TEMPLATES[reason], corrected_text=student_text.strip())
+    return result, reason
@@ -0,0 +1,272 @@
+# app/services/quiz_bank.py
+
+# --- Banco de Cuestionarios GIFT Pregenerados ---
+# Los cuestionarios se generan a partir de las descripciones de un corpus de imágenes
+# fijo, así que no hace falta llamar a OpenAI en cada petición. En segundo plano se
+# generan varias variantes por descripción, se validan con el parser GIFT y se
+# guardan en disco indexadas por el hash de la descripción. /quiz/generate sirve
+# una variante al azar al instante y solo llama a OpenAI para descripciones nuevas.
+#
+# Con varios workers de uvicorn, solo genera variantes el proceso que consigue el
+# cerrojo del banco (un archivo '.lock' junto a él); los demás vuelven a leer el
+# archivo cuando cambia. Así las variantes que faltan se piden a OpenAI una sola vez.
+
+# --- Importaciones Necesarias ---
+import asyncio    # Para generar varias variantes a la vez.
+import hashlib    # Para indexar el banco por el hash de la descripción.
+import json       # Para guardar el banco en disco en formato JSON.
+import logging    # Para registrar el progreso de la generación.
+import os         # Para leer la configuración y gestionar el archivo del banco.
+import random     # Para elegir una variante al azar.
+import threading  # Para proteger el banco cuando varias peticiones lo usan a la vez.
+from contextlib import contextmanager
+
+# Cerrojos de archivo entre procesos: fcntl en Linux/macOS, msvcrt en Windows.
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+    import msvcrt
+
+from app.services import caption_store, openai_service, upstream_scheduler
+from app.services.gift import GiftFormatError, parse_gift
+from app.services.metrics import record_cache
+from app.services.response_cache import normalize_text
+
+logger = logging.getLogger(__name__)
+
+# --- Configuración ---
+# Archivo donde se guarda el banco, y cerrojo que elige al único proceso que lo genera.
+BANK_PATH = os.getenv("QUIZ_BANK_PATH", "cache/quiz_bank.json")
+LOCK_PATH = f"{BANK_PATH}.lock"
+# Número de variantes distintas que se generan por descripción.
+VARIANTS_PER_CAPTION = int(os.getenv("QUIZ_BANK_VARIANTS", "3"))
+# Número de preguntas que debe tener una variante para aceptarla (el prompt pide 4).
+MIN_QUESTIONS = int(os.getenv("QUIZ_BANK_MIN_QUESTIONS", "4"))
+# Llamadas a OpenAI simultáneas durante la generación (para no competir con las peticiones en vivo).
+BUILD_CONCURRENCY = int(os.getenv("QUIZ_BANK_CONCURRENCY", "2"))
+# Cada cuántos segundos se revisa si hay descripciones nuevas sin variantes.
+REFRESH_INTERVAL = float(os.getenv("QUIZ_BANK_REFRESH_SECONDS", "300"))
+
+# --- Estado en Memoria ---
+# hash de la descripción -> lista de cuestionarios GIFT validados.
+_lock = threading.Lock()
+_variants: dict = {}
+_loaded_mtime_ns = None  # Fecha de modificación del archivo cuando se leyó.
+
+
+def caption_key(image_description: str) -> str:
+    """
+    Devuelve la clave de una descripción en el banco: el hash SHA-256 del texto
+    normalizado. Si cambia la descripción de una imagen, cambia su clave.
+    """
+    return hashlib.sha256(normalize_text(image_description).encode("utf-8")).hexdigest()
+
+
+def _load_bank() -> None:
+    """
+    Carga el banco desde disco la primera vez que se necesita y cada vez que el archivo
+    cambia (ej: lo actualizó el proceso que genera las variantes). Las variantes
+    generadas con otro modelo u otra versión del prompt se descartan.
+    Debe llamarse con `_lock` adquirido.
+    """
+    global _loaded_mtime_ns
+    try:
+        mtime_ns = os.stat(BANK_PATH).st_mtime_ns
+    except OSError:
+        mtime_ns = None
+    if mtime_ns is None or mtime_ns == _loaded_mtime_ns:
+        return
+    try:
+        with open(BANK_PATH, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        _variants.clear()
+        if data.get("model") == openai_service.GIFT_MODEL and data.get("prompt_version") == openai_service.GIFT_PROMPT_VERSION:
+            _variants.update(data.get("variants", {}))
+    except FileNotFoundError:
+        pass
+    except (OSError, ValueError) as e:
+        logger.warning("No se pudo leer el banco de cuestionarios (%s), se reconstruirá.", e)
+    _loaded_mtime_ns = mtime_ns
+
+
+def _save_bank() -> None:
+    """
+    Escribe el banco en disco de forma atómica. Debe llamarse con `_lock` adquirido.
+    """
+    global _loaded_mtime_ns
+    directory = os.path.dirname(BANK_PATH)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    # El temporal lleva el pid: nunca se mezcla con el de otro proceso.
+    tmp_path = f"{BANK_PATH}.tmp-{os.getpid()}"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump({
+            "model": openai_service.GIFT_MODEL,
+            "prompt_version": openai_service.GIFT_PROMPT_VERSION,
+            "variants": _variants,
+        }, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, BANK_PATH)
+    _loaded_mtime_ns = os.stat(BANK_PATH).st_mtime_ns
+
+
+@contextmanager
+def _builder_lock(blocking: bool):
+    """
+    Cerrojo entre procesos (sobre LOCK_PATH) para que solo uno genere variantes a la vez.
+    El sistema lo libera si el proceso termina, así que nunca queda bloqueado.
+
+    Yields:
+        bool: True si se obtuvo el cerrojo.
+    """
+    directory = os.path.dirname(LOCK_PATH)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(LOCK_PATH, "a+b") as f:
+        try:
+            if fcntl is not None:
+                fcntl.flock(f.fileno(), fcntl.LOCK_EX | (0 if blocking else fcntl.LOCK_NB))
+            else:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_LOCK if blocking else msvcrt.LK_NBLCK, 1)
+        except OSError:
+            yield False
+            return
+        yield True
+        # El cerrojo se libera al cerrar el archivo.
+
+
+def get_variant(image_description: str):
+    """
+    Elige al azar una de las variantes pregeneradas para una descripción.
+
+    Args:
+        image_description (str): La descripción de la imagen.
+
+    Returns:
+        str | None: Un cuestionario GIFT validado, o None si la descripción no está en el banco.
+    """
+    with _lock:
+        _load_bank()
+        variants = _variants.get(caption_key(image_description))
+        choice = random.choice(variants) if variants else None
+    record_cache("quiz_bank", choice is not None)
+    return choice
+
+
+def add_variant(image_description: str, gift_text: str) -> bool:
+    """
+    Valida un cuestionario y, si es correcto y no está repetido, lo añade al banco.
+
+    Returns:
+        bool: True si la variante se añadió.
+    """
+    if gift_text == openai_service.GIFT_ERROR:
+        return False
+    try:
+        parse_gift(gift_text, MIN_QUESTIONS)
+    except GiftFormatError as e:
+        logger.info("Variante GIFT descartada: %s", e)
+        return False
+    with _lock:
+        _load_bank()
+        variants = _variants.setdefault(caption_key(image_description), [])
+        if gift_text.strip() in (variant.strip() for variant in variants):
+            return False
+        variants.append(gift_text)
+        _save_bank()
+    return True
+
+
+def _missing(image_description: str) -> int:
+    with _lock:
+        _load_bank()
+        return max(0, VARIANTS_PER_CAPTION - len(_variants.get(caption_key(image_description), [])))
+
+
+async def _fill(image_description: str, semaphore: asyncio.Semaphore) -> int:
+    """
+    Genera variantes para una descripción hasta completar VARIANTS_PER_CAPTION.
+    Se hacen como máximo el doble de intentos, porque algunas respuestas no
+    pasan la validación o repiten una variante anterior.
+    """
+    added = 0
+    attempts = 2 * _missing(image_description)
+    while attempts > 0 and _missing(image_description) > 0:
+        attempts -= 1
+        # Es trabajo en segundo plano: las peticiones en vivo pasan por delante en el planificador.
+        async with semaphore:
+            with upstream_scheduler.bulk():
+                gift_text = await openai_service.generate_gift_questions(image_description, use_cache=False)
+        if add_variant(image_description, gift_text):
+            added += 1
+    return added
+
+
+async def build_all(blocking: bool = True):
+    """
+    Completa el banco para todas las descripciones del almacén de descripciones
+    y elimina las variantes de descripciones que ya no existen.
+
+    Args:
+        blocking (bool): Si otro proceso está generando el banco, esperar a que termine
+                         (True) o no hacer nada (False).
+
+    Returns:
+        dict | None: El número de descripciones ya completas, completadas ahora e
+                     incompletas, o None si otro proceso lo está generando.
+    """
+    if blocking:
+        # La espera del cerrojo no debe bloquear el bucle de eventos.
+        lock = _builder_lock(blocking=True)
+        acquired = await asyncio.to_thread(lock.__enter__)
+    else:
+        lock = _builder_lock(blocking=False)
+        acquired = lock.__enter__()
+    try:
+        if not acquired:
+            return None
+        return await _build_locked()
+    finally:
+        lock.__exit__(None, None, None)
+
+
+async def _build_locked() -> dict:
+    """
+    Cuerpo de `build_all`, con el cerrojo del banco ya obtenido.
+    """
+    captions = [caption for caption in set(caption_store.all_captions()) if caption]
+    stats = {"complete": 0, "filled": 0, "incomplete": 0}
+    semaphore = asyncio.Semaphore(BUILD_CONCURRENCY)
+    pending = [caption for caption in captions if _missing(caption) > 0]
+    stats["complete"] = len(captions) - len(pending)
+    await asyncio.gather(*(_fill(caption, semaphore) for caption in pending))
+    for caption in pending:
+        stats["filled" if _missing(caption) == 0 else "incomplete"] += 1
+
+    live_keys = {caption_key(caption) for caption in captions}
+    with _lock:
+        stale = [key for key in _variants if key not in live_keys]
+        for key in stale:
+            del _variants[key]
+        if stale:
+            _save_bank()
+
+    if pending or stale:
+        logger.info("Banco de cuestionarios actualizado: %s", stats, extra=stats)
+    return stats
+
+
+async def run_forever() -> None:
+    """
+    Tarea en segundo plano: completa el banco y vuelve a revisarlo cada
+    REFRESH_INTERVAL segundos (las descripciones se precalculan mientras tanto).
+    Si otro proceso tiene el cerrojo, esta vuelta se omite: ese proceso ya lo completa.
+    """
+    while True:
+        try:
+            if await build_all(blocking=False) is None:
+                logger.debug("Otro proceso está generando el banco de cuestionarios.")
+        except Exception as e:
+            logger.exception("Error generando el banco de cuestionarios: %s", e)
+        await asyncio.sleep(REFRESH_INTERVAL)
@@ -0,0 +1,406 @@
+# app/services/resilience.py
+
+# --- Plazos, Reintentos y Circuit Breakers de los Servicios Externos ---
+# Una llamada colgada a OpenAI, Gemini o YouTube no debe retener la petición (ni el
+# permiso del planificador) indefinidamente. Este módulo aporta:
+#
+# - Un plazo (deadline) por petición: cada endpoint fija cuánto puede tardar en total
+#   con `deadline(segundos)`, y todas las llamadas externas que se hagan dentro (incluidas
+#   las de las tareas de asyncio creadas en el bloque) limitan su timeout a lo que queda.
+# - Reintentos con espera exponencial y jitter ante errores transitorios (timeouts,
+#   errores de red, 429 y 5xx), solo mientras quede plazo para un nuevo intento.
+# - Un circuit breaker por proveedor: tras varios fallos seguidos el circuito se abre y
+#   las llamadas fallan al instante (los servicios devuelven su respuesta de error
+#   habitual) hasta que, pasado un tiempo, una llamada de prueba confirma que el
+#   proveedor se recuperó.
+#
+# La espera de turno en el planificador (upstream_scheduler) no forma parte del intento:
+# solo la limita el plazo de la petición (DeadlineExceeded), no cuenta como timeout del
+# proveedor y nunca se registra en su circuito.
+#
+# Uso:
+#     async def attempt(timeout, ticket):
+#         return await client.post(..., timeout=timeout)
+#
+#     with deadline(20):
+#         response = await call(openai_breaker, attempt, timeout=60,
+#                               slot=lambda: openai_scheduler.slot(priority, tokens))
+
+# --- Importaciones Necesarias ---
+import asyncio      # Para limitar la duración de cada intento y esperar entre reintentos.
+import contextvars  # Para propagar el plazo de la petición a todas las llamadas que hace.
+import logging      # Para registrar los reintentos y los cambios de estado de los circuitos.
+import os           # Para leer la configuración desde variables de entorno.
+import random       # Para el jitter de las esperas entre reintentos.
+import threading    # Para proteger el estado de los circuitos.
+import time         # Para medir los plazos y el tiempo que un circuito lleva abierto.
+from contextlib import AsyncExitStack, asynccontextmanager, contextmanager
+
+import httpx        # Para reconocer los errores de red de las llamadas a OpenAI.
+import requests     # Para reconocer los errores de red de las llamadas a YouTube (youtube_transcript_api usa requests).
+from youtube_transcript_api import TooManyRequests, YouTubeRequestFailed
+
+from app.services.metrics import UPSTREAM_CIRCUIT_STATE, UPSTREAM_RETRIES
+from app.services.upstream_scheduler import parse_retry_after
+
+logger = logging.getLogger(__name__)
+
+# --- Configuración ---
+# Número máximo de intentos por llamada (el primero incluido).
+MAX_ATTEMPTS = int(os.getenv("UPSTREAM_MAX_ATTEMPTS", "3"))
+# Espera base y máxima (en segundos) entre reintentos; se duplica en cada intento.
+RETRY_BASE_SECONDS = float(os.getenv("UPSTREAM_RETRY_BASE_SECONDS", "0.5"))
+RETRY_MAX_SECONDS = float(os.getenv("UPSTREAM_RETRY_MAX_SECONDS", "8"))
+# No se reintenta si, tras la espera, quedarían menos de estos segundos de plazo.
+MIN_ATTEMPT_SECONDS = float(os.getenv("UPSTREAM_MIN_ATTEMPT_SECONDS", "1"))
+# Fallos seguidos que abren el circuito de un proveedor.
+CIRCUIT_FAILURE_THRESHOLD = int(os.getenv("CIRCUIT_FAILURE_THRESHOLD", "5"))
+# Segundos que el circuito permanece abierto antes de dejar pasar una llamada de prueba.
+CIRCUIT_RESET_SECONDS = float(os.getenv("CIRCUIT_RESET_SECONDS", "30"))
+
+# Códigos HTTP que indican un problema pasajero del proveedor.
+TRANSIENT_STATUS = {408, 429, 500, 502, 503, 504}
+
+# Estados de un circuito (y su valor en la métrica upstream_circuit_state).
+CLOSED, HALF_OPEN, OPEN = "closed", "half_open", "open"
+STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+# Instante (time.monotonic) en que vence el plazo de la petición en curso, o None.
+_deadline = contextvars.ContextVar("upstream_deadline", default=None)
+
+
+# --- Excepciones ---
+class UpstreamUnavailable(Exception):
+    """El servicio externo no respondió a tiempo o está marcado como no disponible."""
+
+
+class DeadlineExceeded(UpstreamUnavailable):
+    """Se agotó el plazo de la petición antes de poder hacer la llamada."""
+
+
+class UpstreamTimeout(UpstreamUnavailable):
+    """Un intento superó su timeout."""
+
+
+class CircuitOpenError(UpstreamUnavailable):
+    """El circuito del proveedor está abierto: la llamada falla sin intentarse."""
+
+
+# --- Plazos ---
+@contextmanager
+def deadline(seconds: float):
+    """
+    Fija el plazo de todas las llamadas externas hechas dentro del bloque. Si ya
+    había un plazo más corto (ej: el de la petición que lo contiene), se mantiene ese.
+
+    Args:
+        seconds (float): Segundos disponibles desde ahora.
+    """
+    previous = _deadline.get()
+    expires = time.monotonic() + seconds
+    _deadline.set(expires if previous is None else min(previous, expires))
+    try:
+        yield
+    finally:
+        # Se restaura con set() y no con reset(): los generadores de las respuestas en
+        # streaming pueden cerrarse desde otro contexto distinto del que los abrió.
+        _deadline.set(previous)
+
+
+def remaining():
+    """
+    Devuelve los segundos que quedan del plazo actual (0 si ya venció), o None si no hay plazo.
+    """
+    expires = _deadline.get()
+    return None if expires is None else max(0.0, expires - time.monotonic())
+
+
+def attempt_timeout(default: float) -> float:
+    """
+    Timeout de la próxima llamada: el del proveedor, recortado a lo que queda del plazo.
+
+    Raises:
+        DeadlineExceeded: Si el plazo ya venció.
+    """
+    left = remaining()
+    if left is None:
+        return default
+    if left <= 0:
+        raise DeadlineExceeded("Se agotó el plazo de la petición.")
+    return min(default, left)
+
+
+async def wait(awaitable, timeout: float):
+    """
+    Espera un resultado como máximo `timeout` segundos (cancelando la espera si se supera).
+
+    Raises:
+        UpstreamTimeout: Si no terminó a tiempo.
+    """
+    try:
+        return await asyncio.wait_for(awaitable, timeout)
+    except asyncio.TimeoutError as e:
+        raise UpstreamTimeout(f"Sin respuesta en {timeout:.1f} s.") from e
+
+
+@asynccontextmanager
+async def acquire(slot):
+    """
+    Espera el turno de un planificador (ej: `openai_scheduler.slot(...)`) como máximo
+    lo que queda del plazo de la petición, y lo mantiene durante el bloque.
+
+    Yields:
+        Ticket: El permiso concedido por el planificador.
+
+    Raises:
+        DeadlineExceeded: Si el plazo vence antes de conseguir el turno.
+    """
+    try:
+        ticket = await asyncio.wait_for(slot.__aenter__(), remaining())
+    except asyncio.TimeoutError as e:
+        raise DeadlineExceeded("Se agotó el plazo esperando turno en el planificador.") from e
+    try:
+        yield ticket
+    except BaseException as e:
+        if not await slot.__aexit__(type(e), e, e.__traceback__):
+            raise
+    else:
+        await slot.__aexit__(None, None, None)
+
+
+async def within_deadline(iterator, timeout: float):
+    """
+    Recorre un iterador asíncrono (ej: las líneas de un stream) limitando la espera de
+    cada elemento a `timeout` segundos y al plazo de la petición.
+    """
+    iterator = iterator.__aiter__()
+    while True:
+        try:
+            item = await wait(iterator.__anext__(), attempt_timeout(timeout))
+        except StopAsyncIteration:
+            return
+        yield item
+
+
+# --- Clasificación de Errores ---
+# Errores pasajeros: timeouts y errores de red de cada cliente (httpx para OpenAI,
+# requests y youtube_transcript_api para YouTube) además de los de Python.
+TRANSIENT_ERRORS = (
+    UpstreamTimeout,
+    httpx.TransportError,
+    requests.exceptions.ConnectionError,
+    requests.exceptions.Timeout,
+    TooManyRequests,
+    YouTubeRequestFailed,
+    ConnectionError,
+    TimeoutError,
+)
+
+
+def _status_of(error: Exception):
+    """Código HTTP de un error de httpx (response.status_code) o de Google (code), si lo tiene."""
+    status = getattr(getattr(error, "response", None), "status_code", None)
+    if status is None:
+        status = getattr(error, "code", None)
+    return status if isinstance(status, int) else None
+
+
+def is_transient(error: Exception) -> bool:
+    """
+    Indica si un error es pasajero (merece un reintento y cuenta como fallo del proveedor).
+    Los demás (ej: 400, 401, un video sin subtítulos) significan que el proveedor respondió.
+    """
+    if isinstance(error, TRANSIENT_ERRORS):
+        return True
+    return _status_of(error) in TRANSIENT_STATUS
+
+
+def _retry_after(error: Exception):
+    """Segundos indicados por la cabecera Retry-After de la respuesta de error, si la hay."""
+    headers = getattr(getattr(error, "response", None), "headers", None)
+    return parse_retry_after(headers.get("Retry-After")) if headers is not None else None
+
+
+def backoff(attempt: int, retry_after=None) -> float:
+    """
+    Espera antes del reintento número `attempt` (1 = primer reintento): exponencial con
+    jitter completo, y nunca menos de lo que pide el proveedor en Retry-After.
+    """
+    delay = random.uniform(0, min(RETRY_MAX_SECONDS, RETRY_BASE_SECONDS * 2 ** (attempt - 1)))
+    return max(delay, retry_after) if retry_after is not None else delay
+
+
+# --- Circuit Breaker ---
+class CircuitBreaker:
+    """
+    Circuito de un proveedor (ver el comentario del módulo). Cerrado: las llamadas pasan.
+    Abierto: fallan al instante. Semiabierto: pasa una única llamada de prueba, que
+    cierra el circuito si va bien o lo vuelve a abrir si falla.
+    """
+
+    def __init__(self, name: str, failure_threshold: int = CIRCUIT_FAILURE_THRESHOLD,
+                 reset_timeout: float = CIRCUIT_RESET_SECONDS):
+        self.name = name
+        self.failure_threshold = max(1, failure_threshold)
+        self.reset_timeout = reset_timeout
+        self.state = CLOSED
+        self.failures = 0
+        self._opened_at = 0.0
+        self._probe_started = None
+        self._lock = threading.Lock()
+        UPSTREAM_CIRCUIT_STATE.labels(name).set(STATE_VALUES[CLOSED])
+
+    def _set_state(self, state: str) -> None:
+        if state != self.state:
+            log = logger.warning if state == OPEN else logger.info
+            log("Circuito de %s: %s -> %s.", self.name, self.state, state,
+                extra={"provider": self.name, "circuit_state": state})
+        self.state = state
+        UPSTREAM_CIRCUIT_STATE.labels(self.name).set(STATE_VALUES[state])
+
+    def allow(self) -> bool:
+        """
+        Indica si una llamada puede intentarse ahora.
+        """
+        with self._lock:
+            now = time.monotonic()
+            if self.state == OPEN and now - self._opened_at >= self.reset_timeout:
+                self._set_state(HALF_OPEN)
+                self._probe_started = None
+            if self.state == HALF_OPEN:
+                # Una sola llamada de prueba a la vez. Si la prueba se cancela sin resultado,
+                # pasado `reset_timeout` se permite otra.
+                if self._probe_started is not None and now - self._probe_started < self.reset_timeout:
+                    return False
+                self._probe_started = now
+                return True
+            return self.state == CLOSED
+
+    def check(self) -> None:
+        """
+        Raises:
+            CircuitOpenError: Si el circuito no deja pasar la llamada.
+        """
+        if not self.allow():
+            raise CircuitOpenError(f"{self.name} no está disponible (circuito abierto).")
+
+    def record(self, error: Exception = None) -> None:
+        """
+        Registra el resultado de una llamada: None si fue bien, o el error que produjo.
+        Solo los errores transitorios cuentan como fallos del proveedor.
+        """
+        with self._lock:
+            if error is None or not is_transient(error):
+                self.failures = 0
+                self._set_state(CLOSED)
+                return
+            self.failures += 1
+            if self.state == HALF_OPEN or self.failures >= self.failure_threshold:
+                self._opened_at = time.monotonic()
+                self._set_state(OPEN)
+
+    @contextmanager
+    def guard(self):
+        """
+        Para llamadas que no se pueden reintentar (ej: un stream ya empezado): falla al
+        instante si el circuito está abierto y registra el resultado del bloque.
+        """
+        self.check()
+        try:
+            yield
+        except Exception as e:
+            self.record(e)
+            raise
+        self.record()
+
+    def stats(self) -> dict:
+        """Devuelve el estado del circuito y los fallos seguidos."""
+        with self._lock:
+            return {"state": self.state, "consecutive_failures": self.failures}
+
+
+class _SlotDeadline(Exception):
+    """El plazo venció antes del intento (esperando turno); la causa es el DeadlineExceeded."""
+
+
+async def call(breaker: CircuitBreaker, attempt, timeout: float, max_attempts: int = MAX_ATTEMPTS, slot=None):
+    """
+    Hace una llamada a un proveedor con circuit breaker, plazo y reintentos.
+
+    Args:
+        breaker (CircuitBreaker): El circuito del proveedor.
+        attempt: Función asíncrona que recibe el timeout (en segundos) de un intento
+                 (y el permiso del planificador, si se indica `slot`) y hace la llamada.
+                 Se vuelve a invocar en cada reintento.
+        timeout (float): Timeout de cada intento sin plazo (se recorta al plazo de la petición).
+        max_attempts (int): Número máximo de intentos.
+        slot: Función que devuelve el turno del planificador (ej: `lambda: scheduler.slot(...)`).
+              Cada intento lo pide de nuevo antes de empezar a contar su timeout.
+
+    Returns:
+        El resultado de `attempt`.
+
+    Raises:
+        CircuitOpenError: Si el circuito está abierto.
+        DeadlineExceeded: Si el plazo ya había vencido (o venció esperando turno).
+        Exception: El error del último intento.
+    """
+    # El plazo se comprueba antes que el circuito: una petición sin tiempo no consume
+    # la llamada de prueba de un circuito semiabierto.
+    attempt_timeout(timeout)
+    breaker.check()
+    number = 0
+    error = None
+    while True:
+        number += 1
+        try:
+            result = await _attempt_in_slot(attempt, timeout, slot)
+        except _SlotDeadline as e:
+            # Sin tiempo para esperar turno: no es un fallo del proveedor. Si un intento
+            # anterior falló, se registra y se lanza ese error.
+            if error is None:
+                raise e.__cause__
+            breaker.record(error)
+            raise error
+        except Exception as e:
+            error = e
+        else:
+            breaker.record()
+            return result
+
+        delay = backoff(number, _retry_after(error)) if is_transient(error) else None
+        left = remaining()
+        if delay is None or number >= max_attempts or (left is not None and left < delay + MIN_ATTEMPT_SECONDS):
+            breaker.record(error)
+            raise error
+        UPSTREAM_RETRIES.labels(breaker.name).inc()
+        logger.info(
+            "Error transitorio de %s (%s); reintento %d en %.2f s.", breaker.name, error, number, delay,
+            extra={"provider": breaker.name, "attempt": number},
+        )
+        await asyncio.sleep(delay)
+
+
+async def _attempt_in_slot(attempt, timeout: float, slot):
+    """
+    Un intento de `call`: espera turno (si hay planificador) y después hace la llamada
+    limitada al timeout, que empieza a contar solo cuando se consigue el turno.
+
+    Raises:
+        _SlotDeadline: Si el plazo vence antes de poder empezar la llamada.
+    """
+    async with AsyncExitStack() as stack:
+        try:
+            ticket = await stack.enter_async_context(acquire(slot())) if slot is not None else None
+            seconds = attempt_timeout(timeout)
+        except DeadlineExceeded as e:
+            raise _SlotDeadline() from e
+        if slot is None:
+            return await wait(attempt(seconds), seconds)
+        return await wait(attempt(seconds, ticket), seconds)
+
+
+# --- Circuitos de cada proveedor ---
+openai_breaker = CircuitBreaker("openai")
+gemini_breaker = CircuitBreaker("gemini")
+youtube_breaker = CircuitBreaker("youtube")
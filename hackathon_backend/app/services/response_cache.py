@@ -0,0 +1,261 @@
+# app/services/response_cache.py
+
+# --- Importaciones Necesarias ---
+import asyncio      # Para consultar el backend SQLite sin bloquear el bucle de eventos.
+import hashlib      # Para construir claves compactas a partir de las entradas.
+import json         # Para serializar las claves y los valores guardados.
+import logging      # Para registrar los errores del backend.
+import os           # Para leer la configuración desde variables de entorno.
+import sqlite3      # Backend compartido entre varios procesos (workers de uvicorn).
+import threading    # Para proteger los backends cuando varias peticiones los usan a la vez.
+import time         # Para calcular la caducidad (TTL) de las entradas.
+import unicodedata  # Para normalizar el texto antes de construir la clave.
+from collections import OrderedDict # Mantiene el orden de uso para el desalojo LRU.
+
+# Métricas de Prometheus (aciertos y fallos de cada caché).
+from app.services.metrics import record_cache
+
+logger = logging.getLogger(__name__)
+
+# --- Configuración ---
+# Backend a utilizar: "memory" (por proceso), "sqlite" (compartido entre workers) o "none" (desactivado).
+CACHE_BACKEND = os.getenv("RESPONSE_CACHE_BACKEND", "memory")
+# Archivo de la base de datos cuando se usa el backend "sqlite".
+CACHE_PATH = os.getenv("RESPONSE_CACHE_PATH", "cache/responses.sqlite3")
+# Número máximo de entradas por caché; al superarlo se desaloja la menos usada recientemente.
+CACHE_MAX_ENTRIES = int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "1000"))
+
+
+def normalize_text(text: str) -> str:
+    """
+    Normaliza un texto para que variaciones triviales (espacios repetidos,
+    formas Unicode distintas de un mismo acento) compartan la misma entrada.
+    Las mayúsculas se conservan, porque forman parte de lo que se evalúa.
+
+    Args:
+        text (str): El texto original.
+
+    Returns:
+        str: El texto normalizado.
+    """
+    return " ".join(unicodedata.normalize("NFC", text).split())
+
+
+class MemoryBackend:
+    """
+    Backend en memoria del proceso: un diccionario ordenado con desalojo LRU
+    y caducidad por entrada.
+    """
+
+    def __init__(self, max_entries: int = CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()  # clave -> (instante de caducidad, valor)
+        self._lock = threading.Lock()
+
+    def get(self, key: str):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at < time.time():
+                del self._entries[key]
+                return None
+            # Se marca como usada recientemente.
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key: str, value, ttl: float) -> None:
+        with self._lock:
+            self._entries[key] = (time.time() + ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class SQLiteBackend:
+    """
+    Backend en un archivo SQLite, compartido por todos los procesos de la máquina.
+    Cada caché usa su propio espacio de nombres dentro de la misma tabla.
+    """
+
+    def __init__(self, namespace: str, path: str = CACHE_PATH, max_entries: int = CACHE_MAX_ENTRIES):
+        self.namespace = namespace
+        self.max_entries = max_entries
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=5)
+        # El modo WAL permite que varios procesos lean mientras otro escribe.
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS response_cache (
+                namespace TEXT NOT NULL,
+                key TEXT NOT NULL,
+                value TEXT NOT NULL,
+                expires_at REAL NOT NULL,
+                last_access REAL NOT NULL,
+                PRIMARY KEY (namespace, key)
+            )
+            """
+        )
+        self._conn.commit()
+
+    def get(self, key: str):
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, expires_at FROM response_cache WHERE namespace = ? AND key = ?",
+                (self.namespace, key),
+            ).fetchone()
+            if row is None:
+                return None
+            if row[1] < now:
+                self._conn.execute(
+                    "DELETE FROM response_cache WHERE namespace = ? AND key = ?",
+                    (self.namespace, key),
+                )
+                self._conn.commit()
+                return None
+            self._conn.execute(
+                "UPDATE response_cache SET last_access = ? WHERE namespace = ? AND key = ?",
+                (now, self.namespace, key),
+            )
+            self._conn.commit()
+            return json.loads(row[0])
+
+    def set(self, key: str, value, ttl: float) -> None:
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO response_cache VALUES (?, ?, ?, ?, ?)",
+                (self.namespace, key, json.dumps(value, ensure_ascii=False), now + ttl, now),
+            )
+            # Desalojo LRU: se borran las entradas menos usadas por encima del límite.
+            self._conn.execute(
+                """
+                DELETE FROM response_cache WHERE namespace = ? AND key IN (
+                    SELECT key FROM response_cache WHERE namespace = ?
+                    ORDER BY last_access DESC LIMIT -1 OFFSET ?
+                )
+                """,
+                (self.namespace, self.namespace, self.max_entries),
+            )
+            self._conn.commit()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute(
+                "SELECT COUNT(*) FROM response_cache WHERE namespace = ?", (self.namespace,)
+            ).fetchone()[0]
+
+
+def _create_backend(namespace: str):
+    """
+    Crea el backend configurado en RESPONSE_CACHE_BACKEND para una caché.
+    Devuelve None si la caché está desactivada.
+    """
+    if CACHE_BACKEND == "none":
+        return None
+    if CACHE_BACKEND == "sqlite":
+        return SQLiteBackend(namespace)
+    return MemoryBackend()
+
+
+class ResponseCache:
+    """
+    Caché de resultados con tamaño acotado (LRU), caducidad (TTL) y contadores
+    de aciertos y fallos. El backend se elige con RESPONSE_CACHE_BACKEND.
+    """
+
+    def __init__(self, name: str, ttl: float, backend=None):
+        self.name = name
+        self.ttl = ttl
+        self.backend = backend if backend is not None else _create_backend(name)
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def make_key(*parts) -> str:
+        """
+        Construye una clave a partir de las entradas ya normalizadas, el modelo
+        y la versión del prompt.
+
+        Returns:
+            str: El hash SHA-256 de las partes.
+        """
+        raw = json.dumps(parts, ensure_ascii=False)
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def get(self, key: str):
+        """
+        Busca un resultado guardado.
+
+        Returns:
+            El valor guardado, o None si no existe, caducó o la caché está desactivada.
+        """
+        if self.backend is None:
+            return None
+        try:
+            value = self.backend.get(key)
+        except sqlite3.Error as e:
+            # Un problema con la caché nunca debe impedir atender la petición.
+            logger.warning("Error leyendo la caché '%s': %s", self.name, e)
+            value = None
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        record_cache(self.name, value is not None)
+        return value
+
+    def set(self, key: str, value) -> None:
+        """
+        Guarda un resultado con el TTL de esta caché.
+        """
+        if self.backend is None:
+            return
+        try:
+            self.backend.set(key, value, self.ttl)
+        except sqlite3.Error as e:
+            logger.warning("Error escribiendo en la caché '%s': %s", self.name, e)
+
+    async def aget(self, key: str):
+        """
+        Como `get`, para el código asíncrono: con el backend SQLite la consulta (que
+        puede esperar el cerrojo de escritura de otro proceso) se hace en un hilo aparte.
+        """
+        if isinstance(self.backend, SQLiteBackend):
+            return await asyncio.to_thread(self.get, key)
+        return self.get(key)
+
+    async def aset(self, key: str, value) -> None:
+        """
+        Como `set`, para el código asíncrono (ver `aget`).
+        """
+        if isinstance(self.backend, SQLiteBackend):
+            await asyncio.to_thread(self.set, key, value)
+        else:
+            self.set(key, value)
+
+    def stats(self) -> dict:
+        """
+        Devuelve los contadores de uso de la caché.
+
+        Returns:
+            dict: Aciertos, fallos, tasa de aciertos y número de entradas.
+        """
+        total = self.hits + self.misses
+        return {
+            "backend": CACHE_BACKEND,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0,
+            "entries": len(self.backend) if self.backend is not None else 0,
+            "ttl_seconds": self.ttl,
+        }
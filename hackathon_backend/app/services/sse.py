@@ -0,0 +1,37 @@
+# app/services/sse.py
+
+# --- Utilidades para Server-Sent Events (SSE) ---
+import json # Los datos de cada evento se envían como JSON.
+
+# Cabeceras de las respuestas en streaming: evitan que un proxy (ej: nginx)
+# acumule la respuesta en un buffer antes de enviarla al navegador.
+SSE_HEADERS = {
+    "Cache-Control": "no-cache",
+    "X-Accel-Buffering": "no",
+}
+
+
+def format_event(event: str, data) -> str:
+    """
+    Construye un evento SSE con un nombre y un contenido JSON.
+
+    Args:
+        event (str): El nombre del evento (ej: "token", "question", "done").
+        data: Cualquier valor serializable a JSON.
+
+    Returns:
+        str: El evento listo para escribirse en la respuesta.
+    """
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+# Mensaje del evento "error" cuando el proveedor falla con el stream ya empezado.
+STREAM_INTERRUPTED = "La generación se interrumpió; el texto recibido está incompleto."
+
+
+def format_error(detail: str = STREAM_INTERRUPTED) -> str:
+    """
+    Construye el evento "error" que sustituye al evento "done" cuando el stream
+    no pudo completarse: el cliente no debe tomar lo recibido como resultado.
+    """
+    return format_event("error", {"detail": detail})
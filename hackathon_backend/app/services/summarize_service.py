@@ -1,15 +1,286 @@
 # --- Importaciones de librerías necesarias ---
+import asyncio # Para resumir los fragmentos de la transcripción en paralelo.
+import logging # Para registrar los errores de YouTube y de Gemini.
 import os # Para acceder a variables de entorno (como claves de API)
 import google.generativeai as genai # La librería oficial de Google para usar la API de Gemini
 from youtube_transcript_api import YouTubeTranscriptApi # Para descargar transcripciones de YouTube
 
+# Caché para no volver a descargar la transcripción de un video ya procesado.
+from app.services.response_cache import ResponseCache
+# Métricas de Prometheus (latencia de los servicios externos y tokens consumidos).
+from app.services.metrics import observe_upstream, record_tokens
+# Planificador compartido: límites por minuto, prioridades y concurrencia adaptativa.
+from app.services.upstream_scheduler import NORMAL, gemini_scheduler
+# Plazos de las peticiones, reintentos y circuit breakers de Gemini y YouTube.
+from app.services import resilience
+
+logger = logging.getLogger(__name__)
+
 # --- Configuración de la API de Gemini ---
 # Carga la clave de la API desde las variables de entorno del sistema.
 # Es una buena práctica para no exponer claves secretas en el código.
 GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY")
 genai.configure(api_key=GOOGLE_API_KEY)
 
-def summarize_youtube_video(url: str) -> str:
+# Modelo de Gemini a utilizar. 'gemini-1.5-flash' es ideal para tareas rápidas y eficientes como esta.
+GEMINI_MODEL = "gemini-1.5-flash"
+
+# --- Configuración del Resumen por Fragmentos (map-reduce) ---
+# Tamaño máximo aproximado (en tokens) de cada fragmento de la transcripción.
+CHUNK_MAX_TOKENS = int(os.getenv("SUMMARY_CHUNK_MAX_TOKENS", "4000"))
+# Número máximo de fragmentos que se resumen a la vez.
+MAX_PARALLEL_CHUNKS = int(os.getenv("SUMMARY_MAX_PARALLEL_CHUNKS", "4"))
+
+# Las transcripciones no cambian, así que se guardan un día por defecto.
+transcript_cache = ResponseCache("transcript", ttl=float(os.getenv("TRANSCRIPT_CACHE_TTL", "86400")))
+
+# Prompt final: resume el texto completo (o los resúmenes parciales) en tres puntos clave.
+FINAL_PROMPT = "Resume el siguiente texto en tres puntos clave y en un francés claro y conciso:\n\n---\n\n{text}"
+# Prompt de cada fragmento: conserva las ideas principales para el resumen final.
+CHUNK_PROMPT = (
+    "El siguiente texto es un fragmento de la transcripción de un video (empieza en {start}). "
+    "Resume sus ideas principales en francés, en pocas frases:\n\n---\n\n{text}"
+)
+# Mensajes que se devuelven en lugar del resumen cuando algo falla.
+TRANSCRIPT_ERROR = "No se pudo obtener la transcripción del video. Asegúrate de que el video tenga subtítulos activados."
+SUMMARY_ERROR = "Hubo un error al generar el resumen."
+
+# Tokens de respuesta que se esperan de cada llamada (para reservar presupuesto en el planificador).
+EXPECTED_COMPLETION_TOKENS = 400
+
+# Timeout (en segundos) de cada intento; se recorta al plazo de la petición en curso.
+GEMINI_TIMEOUT = float(os.getenv("GEMINI_TIMEOUT_SECONDS", "120"))
+TRANSCRIPT_TIMEOUT = float(os.getenv("YOUTUBE_TIMEOUT_SECONDS", "30"))
+
+
+def extract_video_id(url: str) -> str:
+    """
+    Extrae el ID único del video de la URL. Funciona para URLs como
+    '.../watch?v=VIDEO_ID' y '.../watch?v=VIDEO_ID&list=...'
+    """
+    return url.split("v=")[1].split("&")[0]
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Estima el número de tokens de un texto (aproximadamente 4 caracteres por token).
+    """
+    return len(text) // 4 + 1
+
+
+def _format_timestamp(seconds: float) -> str:
+    """Convierte segundos en un texto 'mm:ss' (o 'hh:mm:ss')."""
+    minutes, secs = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours:d}:{minutes:02d}:{secs:02d}" if hours else f"{minutes:02d}:{secs:02d}"
+
+
+def chunk_transcript(segments: list, max_tokens: int = CHUNK_MAX_TOKENS) -> list:
+    """
+    Agrupa los segmentos de la transcripción (que vienen con marca de tiempo) en
+    fragmentos consecutivos de como máximo `max_tokens` tokens aproximados.
+    Un segmento nunca se corta por la mitad.
+
+    Args:
+        segments (list): Los segmentos devueltos por YouTubeTranscriptApi
+                         (diccionarios con 'text' y 'start').
+        max_tokens (int): El tamaño máximo de cada fragmento.
+
+    Returns:
+        list: Una lista de diccionarios con 'start' (segundo de inicio) y 'text'.
+    """
+    chunks = []
+    current_texts = []
+    current_tokens = 0
+    current_start = 0.0
+    for segment in segments:
+        text = segment["text"]
+        tokens = estimate_tokens(text)
+        if current_texts and current_tokens + tokens > max_tokens:
+            chunks.append({"start": current_start, "text": " ".join(current_texts)})
+            current_texts, current_tokens = [], 0
+        if not current_texts:
+            current_start = segment.get("start", 0.0)
+        current_texts.append(text)
+        current_tokens += tokens
+    if current_texts:
+        chunks.append({"start": current_start, "text": " ".join(current_texts)})
+    return chunks
+
+
+async def fetch_transcript(video_id: str) -> list:
+    """
+    Devuelve los segmentos de la transcripción de un video, usando la caché si
+    el video ya se había descargado antes.
+
+    Args:
+        video_id (str): El ID del video de YouTube.
+
+    Returns:
+        list: Los segmentos de la transcripción.
+    """
+    cached = await transcript_cache.aget(video_id)
+    if cached is not None:
+        return cached
+
+    # Pide la transcripción a la API de YouTube. Intenta obtenerla en español,
+    # inglés o francés, en ese orden de preferencia. La librería es bloqueante,
+    # así que se ejecuta en un hilo para no detener el bucle de eventos.
+    # La librería no acepta un timeout: al superarlo se deja de esperar al hilo
+    # (que termina por su cuenta) y, si se repite, el circuito de YouTube se abre.
+    async def attempt(timeout: float) -> list:
+        with observe_upstream("youtube", "transcript"):
+            return await asyncio.to_thread(
+                YouTubeTranscriptApi.get_transcript, video_id, languages=['es', 'en', 'fr']
+            )
+
+    transcript_list = await resilience.call(resilience.youtube_breaker, attempt, timeout=TRANSCRIPT_TIMEOUT)
+    segments = [{"text": item["text"], "start": item.get("start", 0.0)} for item in transcript_list]
+    await transcript_cache.aset(video_id, segments)
+    return segments
+
+
+def _record_usage(response, ticket=None) -> None:
+    """
+    Suma a las métricas (y al permiso del planificador) los tokens que informa
+    Gemini en 'usage_metadata'.
+    """
+    usage = getattr(response, "usage_metadata", None)
+    if usage:
+        record_tokens(
+            "gemini", GEMINI_MODEL,
+            getattr(usage, "prompt_token_count", 0), getattr(usage, "candidates_token_count", 0),
+        )
+        if ticket is not None:
+            ticket.record_tokens(getattr(usage, "total_token_count", 0))
+
+
+def _report_error(ticket, error: Exception) -> None:
+    """
+    Informa al planificador del código de un error de Gemini (ej: 429 ResourceExhausted).
+    """
+    code = getattr(error, "code", None)
+    if isinstance(code, int):
+        ticket.report(code)
+
+
+async def _generate(prompt: str, operation: str = "summary") -> str:
+    """
+    Envía un prompt a Gemini y devuelve el texto generado, con timeout, reintentos
+    y circuit breaker (ver resilience.py).
+    """
+    model = genai.GenerativeModel(GEMINI_MODEL)
+
+    async def attempt(timeout: float, ticket) -> str:
+        try:
+            with observe_upstream("gemini", operation):
+                response = await model.generate_content_async(prompt, request_options={"timeout": timeout})
+        except Exception as e:
+            _report_error(ticket, e)
+            raise
+        ticket.report(200)
+        _record_usage(response, ticket)
+        return response.text
+
+    return await resilience.call(
+        resilience.gemini_breaker, attempt, timeout=GEMINI_TIMEOUT,
+        slot=lambda: gemini_scheduler.slot(NORMAL, estimate_tokens(prompt) + EXPECTED_COMPLETION_TOKENS),
+    )
+
+
+async def _generate_stream(prompt: str):
+    """
+    Envía un prompt a Gemini y entrega el texto a medida que se genera.
+    """
+    model = genai.GenerativeModel(GEMINI_MODEL)
+    # Un stream ya empezado no se reintenta: solo se comprueba el circuito y se limita
+    # cada espera al plazo de la petición.
+    # La latencia medida es la del stream completo, hasta el último fragmento; el
+    # permiso del planificador también se mantiene hasta entonces. La espera de turno
+    # no cuenta en el circuito ni en el timeout de la llamada.
+    slot = gemini_scheduler.slot(NORMAL, estimate_tokens(prompt) + EXPECTED_COMPLETION_TOKENS)
+    async with resilience.acquire(slot) as ticket:
+        timeout = resilience.attempt_timeout(GEMINI_TIMEOUT)
+        with resilience.gemini_breaker.guard():
+            try:
+                with observe_upstream("gemini", "summary_stream"):
+                    response = await resilience.wait(
+                        model.generate_content_async(prompt, stream=True, request_options={"timeout": timeout}),
+                        timeout,
+                    )
+                    last_chunk = None
+                    async for chunk in resilience.within_deadline(response, GEMINI_TIMEOUT):
+                        last_chunk = chunk
+                        if chunk.text:
+                            yield chunk.text
+            except Exception as e:
+                _report_error(ticket, e)
+                raise
+            ticket.report(200)
+            # El consumo total de tokens llega con el último fragmento.
+            _record_usage(last_chunk, ticket)
+
+
+async def _map_chunks(chunks: list) -> list:
+    """
+    Resume cada fragmento por separado, con como máximo MAX_PARALLEL_CHUNKS
+    llamadas a Gemini a la vez. Devuelve los resúmenes en el orden del video.
+    """
+    semaphore = asyncio.Semaphore(MAX_PARALLEL_CHUNKS)
+
+    async def summarize_chunk(chunk: dict) -> str:
+        timestamp = _format_timestamp(chunk["start"])
+        async with semaphore:
+            summary = await _generate(CHUNK_PROMPT.format(start=timestamp, text=chunk["text"]), "chunk")
+            return f"[{timestamp}] {summary}"
+
+    return await asyncio.gather(*(summarize_chunk(chunk) for chunk in chunks))
+
+
+async def _condense(segments: list) -> str:
+    """
+    Fase "map" del resumen: si la transcripción no cabe en un único fragmento,
+    resume cada fragmento en paralelo (y vuelve a resumir los resúmenes
+    parciales mientras sigan sin caber).
+
+    Args:
+        segments (list): Los segmentos de la transcripción.
+
+    Returns:
+        str: El texto que se envía al paso final de resumen.
+    """
+    chunks = chunk_transcript(segments)
+    # Mientras los resúmenes parciales no quepan en un fragmento, se vuelven a resumir.
+    while len(chunks) > 1:
+        partial_summaries = await _map_chunks(chunks)
+        reduced = chunk_transcript([
+            {"text": summary, "start": chunk["start"]}
+            for chunk, summary in zip(chunks, partial_summaries)
+        ])
+        if len(reduced) >= len(chunks):
+            # Los resúmenes ya no se acortan más: se envían todos juntos al paso final.
+            return "\n".join(partial_summaries)
+        chunks = reduced
+    return chunks[0]["text"] if chunks else ""
+
+
+async def summarize_segments(segments: list) -> str:
+    """
+    Resume una transcripción con un esquema map-reduce: si cabe en un único
+    fragmento se resume directamente; si no, se resume cada fragmento en
+    paralelo y después se resumen los resúmenes parciales en tres puntos clave.
+
+    Args:
+        segments (list): Los segmentos de la transcripción.
+
+    Returns:
+        str: El resumen final en francés.
+    """
+    text = await _condense(segments)
+    return await _generate(FINAL_PROMPT.format(text=text))
+
+
+async def summarize_youtube_video(url: str) -> str:
     """
     Función que toma una URL de YouTube, extrae su transcripción y
     utiliza la IA de Gemini para generar un resumen en francés.
@@ -22,41 +293,60 @@ def summarize_youtube_video(url: str) -> str:
     """
     # --- Paso 1: Extraer la transcripción del video ---
     try:
-        # Extrae el ID único del video de la URL. Funciona para URLs como
-        # '.../watch?v=VIDEO_ID' y '.../watch?v=VIDEO_ID&list=...'
-        video_id = url.split("v=")[1].split("&")[0]
-        
-        # Pide la transcripción a la API de YouTube. Intenta obtenerla en español,
-        # inglés o francés, en ese orden de preferencia.
-        transcript_list = YouTubeTranscriptApi.get_transcript(video_id, languages=['es', 'en', 'fr'])
-        
-        # Une todas las líneas de la transcripción en un solo bloque de texto.
-        transcript_text = " ".join([item['text'] for item in transcript_list])
+        video_id = extract_video_id(url)
+        segments = await fetch_transcript(video_id)
 
     except Exception as e:
         # Si algo falla (ej: el video no existe, no tiene subtítulos, etc.),
         # se captura el error y se devuelve un mensaje informativo.
-        print(f"Error al obtener la transcripción: {e}")
-        return "No se pudo obtener la transcripción del video. Asegúrate de que el video tenga subtítulos activados."
+        logger.warning("Error al obtener la transcripción: %s", e)
+        return TRANSCRIPT_ERROR
 
     # --- Paso 2: Resumir el texto con la IA de Gemini ---
     try:
-        # Selecciona el modelo de Gemini a utilizar. 'gemini-1.5-flash' es
-        # ideal para tareas rápidas y eficientes como esta.
-        model = genai.GenerativeModel('gemini-1.5-flash')
-        
-        # Crea el 'prompt' o la instrucción para la IA. Se le pide que resuma
-        # el texto extraído en tres puntos clave y en un francés claro.
-        prompt = f"Resume el siguiente texto en tres puntos clave y en un francés claro y conciso:\n\n---\n\n{transcript_text}"
-        
-        # Envía la petición a la API de Gemini y espera la respuesta.
-        response = model.generate_content(prompt)
-        
-        # Devuelve el texto generado por el modelo.
-        return response.text
+        # Los videos largos se dividen en fragmentos que se resumen en paralelo.
+        return await summarize_segments(segments)
 
     except Exception as e:
         # Si hay un problema con la API de Gemini (ej: clave incorrecta, error del servidor),
         # se captura y se devuelve un mensaje genérico.
-        print(f"Error al llamar a la API de Gemini: {e}")
-        return "Hubo un error al generar el resumen."
\ No newline at end of file
+        logger.warning("Error al llamar a la API de Gemini: %s", e)
+        return SUMMARY_ERROR
+
+
+async def stream_youtube_summary(url: str):
+    """
+    Versión en streaming de `summarize_youtube_video`. La transcripción y los
+    resúmenes parciales se calculan igual; el paso final se envía a medida que
+    Gemini lo genera.
+
+    Args:
+        url (str): La URL completa del video de YouTube.
+
+    Yields:
+        str: Fragmentos consecutivos del resumen (o un único mensaje de error, si
+             falla antes de enviar ningún fragmento).
+
+    Raises:
+        Exception: El error de Gemini, si falla con el stream ya empezado (el
+                   resumen enviado está incompleto).
+    """
+    try:
+        segments = await fetch_transcript(extract_video_id(url))
+    except Exception as e:
+        logger.warning("Error al obtener la transcripción: %s", e)
+        yield TRANSCRIPT_ERROR
+        return
+
+    sent_any = False
+    try:
+        text = await _condense(segments)
+        async for piece in _generate_stream(FINAL_PROMPT.format(text=text)):
+            sent_any = True
+            yield piece
+    except Exception as e:
+        logger.warning("Error al llamar a la API de Gemini: %s", e)
+        if sent_any:
+            # El cliente ya recibió parte del resumen: debe saber que está incompleto.
+            raise
+        yield SUMMARY_ERROR
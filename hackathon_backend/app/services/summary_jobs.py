@@ -0,0 +1,433 @@
+# app/services/summary_jobs.py
+
+# --- Trabajos de Resumen en Segundo Plano ---
+# Resumir un video largo puede tardar decenas de segundos (transcripción y varias
+# llamadas a Gemini). Con POST /summarize/jobs el cliente recibe al instante un id
+# de trabajo y consulta después su estado con GET /summarize/jobs/{id}.
+#
+# - Los trabajos los ejecuta un número fijo de tareas (SUMMARY_JOB_WORKERS), así que
+#   nunca hay más de N resúmenes en curso, y la cola de espera está acotada.
+# - Si ya hay un trabajo en cola o en curso para el mismo video, se devuelve ese
+#   mismo trabajo en vez de crear otro.
+# - Los trabajos terminados se conservan SUMMARY_JOB_TTL_SECONDS para poder consultarlos.
+# - El estado de los trabajos se guarda en SQLite (SUMMARY_JOB_BACKEND=sqlite, por
+#   defecto), compartido por todos los workers de uvicorn: cualquier proceso responde
+#   a GET /summarize/jobs/{id} y la deduplicación por video vale entre procesos. Cada
+#   trabajo lo ejecuta el proceso que lo recibió; si ese proceso muere, el trabajo deja
+#   de renovar su latido y se marca como fallido. Con SUMMARY_JOB_BACKEND=memory el
+#   estado vive en el proceso y la API de trabajos requiere un único worker.
+
+# --- Importaciones Necesarias ---
+import asyncio   # Cola de trabajos y tareas que los ejecutan, en el bucle de eventos.
+import logging   # Para registrar los trabajos fallidos.
+import os        # Para leer la configuración desde variables de entorno.
+import sqlite3   # Almacén de trabajos compartido entre varios procesos (workers de uvicorn).
+import threading # Para proteger la conexión de SQLite, que se usa desde hilos aparte.
+import time      # Para las marcas de tiempo y la caducidad de los trabajos.
+import uuid      # Para los identificadores de los trabajos.
+
+from app.services import resilience, summarize_service, upstream_scheduler
+
+logger = logging.getLogger(__name__)
+
+# --- Configuración ---
+# Número de resúmenes que se ejecutan a la vez.
+JOB_WORKERS = int(os.getenv("SUMMARY_JOB_WORKERS", "2"))
+# Número máximo de trabajos en cola (sin contar los que están en curso).
+MAX_QUEUED = int(os.getenv("SUMMARY_JOB_MAX_QUEUED", "100"))
+# Segundos que se conserva un trabajo terminado.
+JOB_TTL = float(os.getenv("SUMMARY_JOB_TTL_SECONDS", "3600"))
+# Segundos que puede tardar un trabajo en curso; al superarlos se marca como fallido.
+JOB_DEADLINE = float(os.getenv("SUMMARY_JOB_DEADLINE_SECONDS", "900"))
+# Almacén de los trabajos: "sqlite" (compartido entre workers) o "memory" (por proceso).
+JOB_BACKEND = os.getenv("SUMMARY_JOB_BACKEND", "sqlite")
+# Archivo de la base de datos cuando se usa el almacén "sqlite".
+JOB_STORE_PATH = os.getenv("SUMMARY_JOB_STORE_PATH", "cache/summary_jobs.sqlite3")
+# Cada cuántos segundos un proceso renueva el latido de sus trabajos pendientes; un
+# trabajo sin latido durante HEARTBEAT_TIMEOUT segundos es de un proceso que ya no existe.
+HEARTBEAT_INTERVAL = 10.0
+HEARTBEAT_TIMEOUT = 6 * HEARTBEAT_INTERVAL
+
+# Estados de un trabajo.
+QUEUED, RUNNING, DONE, FAILED = "queued", "running", "done", "failed"
+
+
+class JobQueueFullError(RuntimeError):
+    """
+    La cola de trabajos está llena: el cliente debe reintentar más tarde.
+    """
+
+
+class SummaryJob:
+    """
+    Un resumen pedido por un cliente, con su estado y su resultado.
+    """
+
+    def __init__(self, video_url: str, video_key: str):
+        self.id = uuid.uuid4().hex
+        self.video_url = video_url
+        self.video_key = video_key
+        self.status = QUEUED
+        self.summary_text = None
+        self.error = None
+        self.created_at = time.time()
+        self.finished_at = None
+
+    @classmethod
+    def from_row(cls, row) -> "SummaryJob":
+        """
+        Reconstruye un trabajo a partir de una fila de SQLiteJobStore.
+        """
+        job = cls(row[1], row[2])
+        job.id, job.status, job.summary_text, job.error, job.created_at, job.finished_at = (
+            row[0], row[3], row[4], row[5], row[6], row[7]
+        )
+        return job
+
+    def to_dict(self) -> dict:
+        return {
+            "job_id": self.id,
+            "status": self.status,
+            "video_url": self.video_url,
+            "summary_text": self.summary_text,
+            "error": self.error,
+            "created_at": self.created_at,
+            "finished_at": self.finished_at,
+        }
+
+
+class MemoryJobStore:
+    """
+    Almacén de trabajos en memoria del proceso. Solo sirve con un único worker de
+    uvicorn: los demás procesos no ven estos trabajos.
+    """
+
+    # Sus operaciones no esperan a nada: se ejecutan directamente en el bucle de eventos.
+    blocking = False
+
+    def __init__(self):
+        self._jobs = {}       # id -> SummaryJob
+        self._in_flight = {}  # video -> id del trabajo en cola o en curso
+
+    def add(self, job: SummaryJob) -> tuple:
+        """
+        Guarda un trabajo nuevo, salvo que ya haya uno en cola o en curso para el mismo video.
+
+        Returns:
+            tuple: (trabajo guardado o existente, True si se guardó `job`)
+        """
+        existing = self.find_in_flight(job.video_key)
+        if existing is not None:
+            return existing, False
+        self._jobs[job.id] = job
+        self._in_flight[job.video_key] = job.id
+        return job, True
+
+    def find_in_flight(self, video_key: str):
+        """
+        Devuelve el trabajo en cola o en curso para un video, o None si no hay ninguno.
+        """
+        job_id = self._in_flight.get(video_key)
+        return self._jobs[job_id] if job_id is not None else None
+
+    def get(self, job_id: str):
+        return self._jobs.get(job_id)
+
+    def update(self, job: SummaryJob) -> None:
+        # El trabajo es el mismo objeto guardado; solo hay que liberar su video al terminar.
+        if job.finished_at is not None and self._in_flight.get(job.video_key) == job.id:
+            del self._in_flight[job.video_key]
+
+    def heartbeat(self, job_ids) -> None:
+        pass
+
+    def evict(self, ttl: float) -> None:
+        now = time.time()
+        expired = [
+            job_id for job_id, job in self._jobs.items()
+            if job.finished_at is not None and now - job.finished_at > ttl
+        ]
+        for job_id in expired:
+            del self._jobs[job_id]
+
+
+class SQLiteJobStore:
+    """
+    Almacén de trabajos en un archivo SQLite, compartido por todos los procesos de la
+    máquina. Un índice único parcial garantiza un solo trabajo en cola o en curso por
+    video, aunque dos procesos lo pidan a la vez.
+
+    Con otro proceso escribiendo, cada operación puede esperar hasta 5 s el cerrojo del
+    archivo: el gestor las ejecuta en un hilo aparte para no detener el bucle de eventos.
+    """
+
+    blocking = True
+
+    COLUMNS = "id, video_url, video_key, status, summary_text, error, created_at, finished_at"
+
+    def __init__(self, path: str = JOB_STORE_PATH):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=5)
+        # El modo WAL permite que varios procesos lean mientras otro escribe.
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS summary_jobs (
+                id TEXT PRIMARY KEY,
+                video_url TEXT NOT NULL,
+                video_key TEXT NOT NULL,
+                status TEXT NOT NULL,
+                summary_text TEXT,
+                error TEXT,
+                created_at REAL NOT NULL,
+                finished_at REAL,
+                heartbeat_at REAL NOT NULL
+            )
+            """
+        )
+        self._conn.execute(
+            f"""
+            CREATE UNIQUE INDEX IF NOT EXISTS summary_jobs_in_flight ON summary_jobs (video_key)
+            WHERE status IN ('{QUEUED}', '{RUNNING}')
+            """
+        )
+        self._conn.commit()
+
+    def _fail_abandoned(self) -> None:
+        # Los trabajos cuyo proceso dejó de renovar el latido ya no terminarán nunca.
+        now = time.time()
+        self._conn.execute(
+            "UPDATE summary_jobs SET status = ?, error = ?, finished_at = ? "
+            "WHERE status IN (?, ?) AND heartbeat_at < ?",
+            (FAILED, summarize_service.SUMMARY_ERROR, now, QUEUED, RUNNING, now - HEARTBEAT_TIMEOUT),
+        )
+
+    def _select_in_flight(self, video_key: str):
+        return self._conn.execute(
+            f"SELECT {self.COLUMNS} FROM summary_jobs WHERE video_key = ? AND status IN (?, ?)",
+            (video_key, QUEUED, RUNNING),
+        ).fetchone()
+
+    def add(self, job: SummaryJob) -> tuple:
+        """
+        Guarda un trabajo nuevo, salvo que ya haya uno en cola o en curso para el mismo video.
+
+        Returns:
+            tuple: (trabajo guardado o existente, True si se guardó `job`)
+        """
+        with self._lock:
+            while True:
+                with self._conn:
+                    self._fail_abandoned()
+                    try:
+                        self._conn.execute(
+                            f"INSERT INTO summary_jobs ({self.COLUMNS}, heartbeat_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                            (job.id, job.video_url, job.video_key, job.status, job.summary_text,
+                             job.error, job.created_at, job.finished_at, time.time()),
+                        )
+                        return job, True
+                    except sqlite3.IntegrityError:
+                        row = self._select_in_flight(job.video_key)
+                # Si es None, el otro trabajo terminó justo entre la inserción y la consulta.
+                if row is not None:
+                    return SummaryJob.from_row(row), False
+
+    def find_in_flight(self, video_key: str):
+        """
+        Devuelve el trabajo en cola o en curso para un video, o None si no hay ninguno.
+        """
+        with self._lock, self._conn:
+            self._fail_abandoned()
+            row = self._select_in_flight(video_key)
+        return SummaryJob.from_row(row) if row is not None else None
+
+    def get(self, job_id: str):
+        with self._lock, self._conn:
+            self._fail_abandoned()
+            row = self._conn.execute(
+                f"SELECT {self.COLUMNS} FROM summary_jobs WHERE id = ?", (job_id,)
+            ).fetchone()
+        return SummaryJob.from_row(row) if row is not None else None
+
+    def update(self, job: SummaryJob) -> None:
+        with self._lock, self._conn:
+            self._conn.execute(
+                "UPDATE summary_jobs SET status = ?, summary_text = ?, error = ?, finished_at = ?, "
+                "heartbeat_at = ? WHERE id = ?",
+                (job.status, job.summary_text, job.error, job.finished_at, time.time(), job.id),
+            )
+
+    def heartbeat(self, job_ids) -> None:
+        """
+        Renueva el latido de los trabajos pendientes de este proceso.
+        """
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "UPDATE summary_jobs SET heartbeat_at = ? WHERE id = ? AND status IN (?, ?)",
+                [(now, job_id, QUEUED, RUNNING) for job_id in job_ids],
+            )
+
+    def evict(self, ttl: float) -> None:
+        with self._lock, self._conn:
+            self._conn.execute(
+                "DELETE FROM summary_jobs WHERE finished_at IS NOT NULL AND finished_at < ?",
+                (time.time() - ttl,),
+            )
+
+
+def _create_store():
+    """
+    Crea el almacén configurado en SUMMARY_JOB_BACKEND.
+    """
+    if JOB_BACKEND == "memory":
+        return MemoryJobStore()
+    return SQLiteJobStore()
+
+
+class SummaryJobManager:
+    """
+    Cola acotada de trabajos de resumen atendida por JOB_WORKERS tareas de asyncio.
+    Las llamadas a YouTube y Gemini son asíncronas (la transcripción se descarga en
+    un hilo), así que los trabajos no bloquean el bucle de eventos. El estado de los
+    trabajos se guarda en el almacén (`store`); la cola es la de este proceso.
+    """
+
+    def __init__(self, workers: int = JOB_WORKERS, max_queued: int = MAX_QUEUED, ttl: float = JOB_TTL, store=None):
+        self.workers = max(1, workers)
+        self.max_queued = max(1, max_queued)
+        self.ttl = ttl
+        self._store = store
+        self._store_lock = threading.Lock()
+        self._local = {}            # id -> SummaryJob en cola o en curso en este proceso
+        self._adding = 0            # trabajos nuevos que se están guardando (aún no en la cola)
+        self._queue = None
+        self._tasks = []
+
+    @property
+    def store(self):
+        # El almacén se crea al usarlo por primera vez (no al importar el módulo).
+        with self._store_lock:
+            if self._store is None:
+                self._store = _create_store()
+            return self._store
+
+    async def _call_store(self, method: str, *args):
+        """
+        Llama a un método del almacén. Los de SQLite pueden esperar el cerrojo del
+        archivo, así que se ejecutan en un hilo aparte.
+        """
+        store = self._store if self._store is not None else await asyncio.to_thread(lambda: self.store)
+        if store.blocking:
+            return await asyncio.to_thread(getattr(store, method), *args)
+        return getattr(store, method)(*args)
+
+    def _ensure_started(self) -> None:
+        # Las tareas se crean la primera vez que se usa el gestor (dentro del bucle de eventos).
+        if not self._tasks:
+            self._queue = asyncio.Queue()
+            self._tasks = [
+                asyncio.create_task(self._run(), name=f"summary-job-{i}") for i in range(self.workers)
+            ]
+            self._tasks.append(asyncio.create_task(self._heartbeat(), name="summary-job-heartbeat"))
+
+    async def stop(self) -> None:
+        """
+        Cancela las tareas de los trabajos. Se llama al apagar la aplicación.
+        """
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def submit(self, video_url: str) -> tuple:
+        """
+        Crea un trabajo de resumen o devuelve el que ya está en marcha para el mismo video.
+
+        Args:
+            video_url (str): La URL del video de YouTube.
+
+        Returns:
+            tuple: (trabajo, True si se creó ahora o False si ya existía)
+
+        Raises:
+            JobQueueFullError: Si ya hay MAX_QUEUED trabajos esperando.
+        """
+        self._ensure_started()
+        await self._evict()
+        try:
+            video_key = summarize_service.extract_video_id(video_url)
+        except IndexError:
+            # URL sin 'v=': el trabajo fallará con el mensaje habitual; se agrupa por la URL.
+            video_key = video_url
+
+        # Una petición para un video que ya está en marcha se une a ese trabajo, aunque
+        # la cola esté llena: el límite solo se aplica a los trabajos nuevos.
+        existing = await self._call_store("find_in_flight", video_key)
+        if existing is not None:
+            return existing, False
+        if self._queue.qsize() + self._adding >= self.max_queued:
+            raise JobQueueFullError(f"Hay {self.max_queued} resúmenes en cola.")
+
+        self._adding += 1
+        try:
+            job, created = await self._call_store("add", SummaryJob(video_url, video_key))
+        finally:
+            self._adding -= 1
+        if created:
+            self._local[job.id] = job
+            self._queue.put_nowait(job)
+        return job, created
+
+    async def get(self, job_id: str):
+        """
+        Devuelve un trabajo por su id, o None si no existe (o ya caducó).
+        """
+        await self._evict()
+        return await self._call_store("get", job_id)
+
+    async def _evict(self) -> None:
+        # Se eliminan los trabajos terminados hace más de `ttl` segundos.
+        await self._call_store("evict", self.ttl)
+
+    async def _heartbeat(self) -> None:
+        # Mientras el proceso vive, sus trabajos pendientes no se consideran abandonados.
+        while True:
+            await asyncio.sleep(HEARTBEAT_INTERVAL)
+            try:
+                await self._call_store("heartbeat", list(self._local))
+            except sqlite3.Error as e:
+                logger.warning("No se pudo renovar el latido de los trabajos de resumen: %s", e)
+
+    async def _run(self) -> None:
+        while True:
+            job = await self._queue.get()
+            job.status = RUNNING
+            try:
+                await self._call_store("update", job)
+                # Es trabajo en segundo plano: en el planificador de Gemini las
+                # peticiones interactivas pasan por delante.
+                with upstream_scheduler.bulk(), resilience.deadline(JOB_DEADLINE):
+                    summary = await summarize_service.summarize_youtube_video(job.video_url)
+                if summary in (summarize_service.TRANSCRIPT_ERROR, summarize_service.SUMMARY_ERROR):
+                    job.status, job.error = FAILED, summary
+                else:
+                    job.status, job.summary_text = DONE, summary
+            except Exception as e:
+                logger.exception("Error en el trabajo de resumen %s: %s", job.id, e)
+                job.status, job.error = FAILED, summarize_service.SUMMARY_ERROR
+            finally:
+                job.finished_at = time.time()
+                self._local.pop(job.id, None)
+                try:
+                    await self._call_store("update", job)
+                except sqlite3.Error as e:
+                    logger.error("No se pudo guardar el trabajo de resumen %s: %s", job.id, e)
+                self._queue.task_done()
+
+
+# Instancia única compartida por todas las peticiones del proceso.
+manager = SummaryJobManager()
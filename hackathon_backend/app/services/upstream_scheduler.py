@@ -0,0 +1,277 @@
+# app/services/upstream_scheduler.py
+
+# --- Planificador de Llamadas a los Servicios Externos ---
+# OpenAI y Gemini limitan las peticiones y los tokens por minuto. Lanzar todas las
+# llamadas a la vez provoca errores 429 que afectan a todos los usuarios por igual.
+# Cada proveedor tiene aquí su propio planificador que:
+#
+# - Aplica un límite de peticiones y otro de tokens por minuto (token buckets).
+# - Atiende primero las llamadas interactivas (/evaluate), después las normales
+#   (/quiz/generate, /summarize) y al final el trabajo por lotes (banco de
+#   cuestionarios, evaluación por lotes).
+# - Adapta el número de llamadas simultáneas con AIMD: sube de forma aditiva con
+#   cada respuesta correcta y se reduce a la mitad ante un 429 o un Retry-After,
+#   pausando además al proveedor el tiempo indicado.
+#
+# Uso:
+#     async with openai_scheduler.slot(INTERACTIVE, estimated_tokens) as ticket:
+#         response = await client.post(...)
+#         ticket.report(response.status_code, response.headers.get("Retry-After"))
+#         ticket.record_tokens(usage["total_tokens"])
+
+# --- Importaciones Necesarias ---
+import asyncio      # Las esperas del planificador no bloquean el bucle de eventos.
+import contextvars  # Para marcar como "por lotes" todo el trabajo lanzado desde un bloque.
+import heapq        # Cola de espera ordenada por prioridad.
+import itertools    # Para desempatar por orden de llegada dentro de una prioridad.
+import logging      # Para registrar las reducciones por 429.
+import os           # Para leer la configuración desde variables de entorno.
+import time         # Para recargar los token buckets y las pausas.
+from contextlib import asynccontextmanager, contextmanager
+
+from app.services.metrics import UPSTREAM_CONCURRENCY_LIMIT, UPSTREAM_QUEUE_SECONDS, UPSTREAM_THROTTLED
+
+logger = logging.getLogger(__name__)
+
+# --- Clases de Prioridad (menor valor = se atiende antes) ---
+INTERACTIVE = 0  # Un estudiante espera la respuesta (ej: /evaluate).
+NORMAL = 1       # Peticiones en vivo más largas (ej: /quiz/generate, /summarize).
+BULK = 2         # Trabajo en segundo plano o por lotes.
+PRIORITY_NAMES = {INTERACTIVE: "interactive", NORMAL: "normal", BULK: "bulk"}
+
+# --- Parámetros del AIMD ---
+# Aumento del límite por cada respuesta correcta (dividido por el límite actual:
+# aproximadamente +1 por cada "ventana" completa de llamadas).
+AIMD_INCREASE = float(os.getenv("UPSTREAM_AIMD_INCREASE", "1"))
+# Factor por el que se multiplica el límite ante un 429.
+AIMD_DECREASE = float(os.getenv("UPSTREAM_AIMD_DECREASE", "0.5"))
+# Pausa (en segundos) tras un 429 que no indica Retry-After.
+DEFAULT_BACKOFF = float(os.getenv("UPSTREAM_DEFAULT_BACKOFF_SECONDS", "1"))
+
+# Prioridad forzada por `bulk()` para las llamadas lanzadas dentro del bloque.
+_priority_override = contextvars.ContextVar("upstream_priority", default=None)
+
+
+@contextmanager
+def bulk():
+    """
+    Marca como BULK todas las llamadas hechas dentro del bloque, incluidas las de las
+    tareas de asyncio creadas en él (heredan el contexto).
+    """
+    token = _priority_override.set(BULK)
+    try:
+        yield
+    finally:
+        _priority_override.reset(token)
+
+
+def parse_retry_after(value):
+    """
+    Convierte la cabecera Retry-After (en segundos) en un número, o None si no hay.
+    """
+    try:
+        return max(0.0, float(value)) if value is not None else None
+    except ValueError:
+        # El formato de fecha HTTP no se interpreta: se usa la pausa por defecto.
+        return DEFAULT_BACKOFF
+
+
+class TokenBucket:
+    """
+    Cubo de fichas: se recarga a `per_minute / 60` fichas por segundo hasta `per_minute`.
+    Con `per_minute <= 0` no hay límite.
+    """
+
+    def __init__(self, per_minute: float):
+        self.capacity = per_minute
+        self.rate = per_minute / 60
+        self.level = per_minute
+        self._updated = time.monotonic()
+
+    def _refill(self, now: float) -> None:
+        self.level = min(self.capacity, self.level + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def wait_time(self, amount: float, now: float) -> float:
+        """Segundos que faltan para disponer de `amount` fichas."""
+        if self.rate <= 0:
+            return 0.0
+        self._refill(now)
+        amount = min(amount, self.capacity)
+        return max(0.0, (amount - self.level) / self.rate)
+
+    def consume(self, amount: float) -> None:
+        """Descuenta fichas (el nivel puede quedar negativo si el consumo real supera lo estimado)."""
+        if self.rate > 0:
+            self.level -= amount
+
+
+class Ticket:
+    """
+    Permiso para una llamada. El código que la hace informa del resultado para
+    que el planificador ajuste la concurrencia y el consumo de tokens.
+    """
+
+    def __init__(self, estimated_tokens: int):
+        self.estimated_tokens = estimated_tokens
+        self.actual_tokens = None
+        self.status = None
+        self.retry_after = None
+
+    def report(self, status, retry_after=None) -> None:
+        """
+        Args:
+            status: El código HTTP de la respuesta.
+            retry_after: El valor de la cabecera Retry-After, si la hay.
+        """
+        self.status = status
+        self.retry_after = parse_retry_after(retry_after)
+
+    def record_tokens(self, total_tokens) -> None:
+        """Registra los tokens realmente consumidos (los informa el proveedor)."""
+        if total_tokens:
+            self.actual_tokens = total_tokens
+
+    @property
+    def throttled(self) -> bool:
+        return self.status == 429 or self.retry_after is not None
+
+
+class ProviderScheduler:
+    """
+    Planificador de las llamadas a un proveedor (ver el comentario del módulo).
+    """
+
+    def __init__(self, name: str, requests_per_minute: float, tokens_per_minute: float, max_concurrency: int):
+        self.name = name
+        self.max_concurrency = max(1, max_concurrency)
+        # Se empieza con el máximo (como antes, sin límite adaptativo) y se reduce solo ante un 429.
+        self.limit = float(self.max_concurrency)
+        self._requests = TokenBucket(requests_per_minute)
+        self._tokens = TokenBucket(tokens_per_minute)
+        self._waiters = []            # heap de (prioridad, orden de llegada, tokens, future)
+        self._order = itertools.count()
+        self._active = 0
+        self._paused_until = 0.0
+        self._timer = None            # Reintento programado del despacho (espera de fichas o pausa).
+        UPSTREAM_CONCURRENCY_LIMIT.labels(name).set(self.limit)
+
+    @asynccontextmanager
+    async def slot(self, priority: int = NORMAL, estimated_tokens: int = 0):
+        """
+        Espera su turno para hacer una llamada al proveedor.
+
+        Args:
+            priority (int): INTERACTIVE, NORMAL o BULK. Dentro de `bulk()` siempre es BULK.
+            estimated_tokens (int): Tokens que se espera consumir (prompt y respuesta).
+
+        Yields:
+            Ticket: Donde informar del código de estado y de los tokens consumidos.
+        """
+        priority = _priority_override.get() if _priority_override.get() is not None else priority
+        started = time.monotonic()
+        await self._acquire(priority, estimated_tokens)
+        UPSTREAM_QUEUE_SECONDS.labels(self.name, PRIORITY_NAMES.get(priority, str(priority))).observe(
+            time.monotonic() - started
+        )
+        ticket = Ticket(estimated_tokens)
+        try:
+            yield ticket
+        finally:
+            self._release(ticket)
+
+    async def _acquire(self, priority: int, tokens: int) -> None:
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._order), tokens, future))
+        self._dispatch()
+        try:
+            await future
+        except asyncio.CancelledError:
+            # Si el permiso ya se había concedido, se devuelve; si no, el despacho lo ignorará.
+            if future.done() and not future.cancelled():
+                self._active -= 1
+                self._dispatch()
+            raise
+
+    def _release(self, ticket: Ticket) -> None:
+        self._active -= 1
+        if ticket.actual_tokens is not None:
+            # Se corrige la estimación con el consumo real.
+            self._tokens.consume(ticket.actual_tokens - ticket.estimated_tokens)
+        if ticket.throttled:
+            # Disminución multiplicativa y pausa del proveedor.
+            self.limit = max(1.0, self.limit * AIMD_DECREASE)
+            pause = ticket.retry_after if ticket.retry_after is not None else DEFAULT_BACKOFF
+            self._paused_until = max(self._paused_until, time.monotonic() + pause)
+            UPSTREAM_THROTTLED.labels(self.name).inc()
+            logger.warning(
+                "%s limitó las peticiones (estado %s); concurrencia reducida a %d y pausa de %.1f s.",
+                self.name, ticket.status, int(self.limit), pause,
+                extra={"provider": self.name, "concurrency_limit": int(self.limit)},
+            )
+        elif ticket.status is not None and ticket.status < 400:
+            # Aumento aditivo.
+            self.limit = min(float(self.max_concurrency), self.limit + AIMD_INCREASE / self.limit)
+        UPSTREAM_CONCURRENCY_LIMIT.labels(self.name).set(self.limit)
+        self._dispatch()
+
+    def _dispatch(self) -> None:
+        """
+        Concede permisos a las llamadas en espera, por orden de prioridad, mientras
+        haya concurrencia disponible, fichas en los cubos y el proveedor no esté en pausa.
+        """
+        while self._waiters:
+            priority, _, tokens, future = self._waiters[0]
+            if future.done():
+                heapq.heappop(self._waiters)
+                continue
+            if self._active >= int(self.limit):
+                return  # Se vuelve a despachar al terminar una llamada.
+            now = time.monotonic()
+            wait = max(
+                self._paused_until - now,
+                self._requests.wait_time(1, now),
+                self._tokens.wait_time(tokens, now),
+            )
+            if wait > 0:
+                self._schedule(wait)
+                return
+            heapq.heappop(self._waiters)
+            self._requests.consume(1)
+            self._tokens.consume(tokens)
+            self._active += 1
+            future.set_result(None)
+
+    def _schedule(self, delay: float) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+        self._timer = asyncio.get_running_loop().call_later(delay, self._on_timer)
+
+    def _on_timer(self) -> None:
+        self._timer = None
+        self._dispatch()
+
+    def stats(self) -> dict:
+        """Devuelve el límite de concurrencia actual y las llamadas en curso y en espera."""
+        return {
+            "concurrency_limit": round(self.limit, 2),
+            "active": self._active,
+            "waiting": sum(1 for *_, future in self._waiters if not future.done()),
+            "paused_seconds": round(max(0.0, self._paused_until - time.monotonic()), 2),
+        }
+
+
+# --- Planificadores de cada proveedor ---
+# Los límites por minuto deben ajustarse al nivel de la cuenta (0 = sin límite).
+openai_scheduler = ProviderScheduler(
+    "openai",
+    requests_per_minute=float(os.getenv("OPENAI_RPM", "500")),
+    tokens_per_minute=float(os.getenv("OPENAI_TPM", "200000")),
+    max_concurrency=int(os.getenv("OPENAI_MAX_CONCURRENCY", "32")),
+)
+gemini_scheduler = ProviderScheduler(
+    "gemini",
+    requests_per_minute=float(os.getenv("GEMINI_RPM", "1000")),
+    tokens_per_minute=float(os.getenv("GEMINI_TPM", "1000000")),
+    max_concurrency=int(os.getenv("GEMINI_MAX_CONCURRENCY", "16")),
+)
@@ -0,0 +1,106 @@
+# benchmarks/blip_backends.py
+#
+# Compara los backends de inferencia de BLIP (eager, quantized, onnx) sobre las
+# imágenes de la carpeta 'images': tiempo de carga, latencia por imagen,
+# memoria residente (RSS) y coincidencia de las descripciones con el backend eager.
+#
+# Cada backend se ejecuta en un proceso nuevo para que la memoria medida sea solo la suya.
+#
+# Uso (desde la carpeta hackathon_backend):
+#     python -m benchmarks.blip_backends --limit 20 --threads 4
+#     python -m benchmarks.blip_backends --backends eager onnx
+
+import argparse
+import difflib
+import multiprocessing
+import statistics
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from PIL import Image
+
+from app.services import blip_backends
+from app.services.blip_service import MODEL_PATH, _caption_images
+from app.services.image_index import ImageIndex
+
+
+def _rss_mb() -> float:
+    """Memoria residente actual del proceso, en MB."""
+    import psutil
+    return psutil.Process().memory_info().rss / (1024 * 1024)
+
+
+def _percentile(values: list, fraction: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+
+def run_backend(backend: str, image_names: list, threads) -> dict:
+    """
+    Carga un backend y describe todas las imágenes, una por una.
+    Se ejecuta en un proceso hijo.
+    """
+    rss_before = _rss_mb()
+    started = time.perf_counter()
+    processor, model = blip_backends.load_backend(backend, MODEL_PATH, threads)
+    # Calentamiento, igual que en blip_service.load_model.
+    _caption_images(processor, model, [Image.new("RGB", (384, 384))])
+    load_seconds = time.perf_counter() - started
+
+    captions = {}
+    latencies = []
+    for image_name in image_names:
+        raw_image = Image.open(f"images/{image_name}").convert("RGB")
+        started = time.perf_counter()
+        captions[image_name] = _caption_images(processor, model, [raw_image])[0]
+        latencies.append(time.perf_counter() - started)
+
+    return {
+        "backend": backend,
+        "load_seconds": load_seconds,
+        "rss_mb": _rss_mb() - rss_before,
+        "latencies": latencies,
+        "captions": captions,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark de los backends de BLIP en CPU.")
+    parser.add_argument("--backends", nargs="+", default=list(blip_backends.BACKENDS),
+                        choices=blip_backends.BACKENDS)
+    parser.add_argument("--limit", type=int, default=None, help="Número máximo de imágenes.")
+    parser.add_argument("--threads", type=int, default=None, help="Hilos intra-op de PyTorch.")
+    args = parser.parse_args()
+
+    image_names = ImageIndex().images()[:args.limit]
+    print(f"Imágenes: {len(image_names)} | hilos: {args.threads or 'por defecto'}")
+
+    results = {}
+    context = multiprocessing.get_context("spawn")
+    for backend in args.backends:
+        print(f"Ejecutando backend '{backend}'...")
+        with ProcessPoolExecutor(max_workers=1, mp_context=context) as pool:
+            results[backend] = pool.submit(run_backend, backend, image_names, args.threads).result()
+
+    reference = results.get("eager")
+    header = f"{'backend':<10} {'carga s':>8} {'RSS MB':>8} {'media ms':>9} {'p50 ms':>8} {'p95 ms':>8} {'iguales':>8} {'similitud':>9}"
+    print("\n" + header)
+    print("-" * len(header))
+    for backend, result in results.items():
+        latencies = [value * 1000 for value in result["latencies"]]
+        if reference is not None:
+            pairs = [(reference["captions"][name], result["captions"][name]) for name in image_names]
+            exact = sum(a == b for a, b in pairs) / len(pairs)
+            similarity = statistics.mean(difflib.SequenceMatcher(None, a, b).ratio() for a, b in pairs)
+            agreement = f"{exact:>8.0%} {similarity:>9.3f}"
+        else:
+            agreement = f"{'-':>8} {'-':>9}"
+        print(
+            f"{backend:<10} {result['load_seconds']:>8.1f} {result['rss_mb']:>8.0f} "
+            f"{statistics.mean(latencies):>9.0f} {_percentile(latencies, 0.5):>8.0f} "
+            f"{_percentile(latencies, 0.95):>8.0f} {agreement}"
+        )
+
+
+if __name__ == "__main__":
+    main()
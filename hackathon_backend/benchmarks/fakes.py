@@ -0,0 +1,166 @@
+# benchmarks/fakes.py
+#
+# Sustitutos en proceso de los servicios externos, con latencia configurable, para
+# medir el rendimiento de la API sin gastar en OpenAI/Gemini ni depender de la red:
+#
+# - OpenAI: un transporte httpx falso instalado en el cliente HTTP compartido.
+# - Gemini: un GenerativeModel falso (con y sin streaming).
+# - YouTube: un YouTubeTranscriptApi falso que devuelve una transcripción sintética.
+# - BLIP (opcional): un generador de descripciones falso que no carga el modelo.
+
+import asyncio
+import json
+import random
+import time
+import types
+
+import httpx
+
+# URL ficticia a la que se redirigen las llamadas a OpenAI.
+FAKE_OPENAI_URL = "http://fake-openai.local/v1/chat/completions"
+
+FAKE_FEEDBACK = {
+    "evaluation": "Correcto",
+    "feedback": "Très bien ! Ta description est claire.",
+    "corrected_text": "Un chat est assis sur une chaise.",
+}
+
+FAKE_GIFT = (
+    "::Pregunta 1:: Quel animal est sur la chaise ? {\n~Un chien\n=Un chat\n~Un oiseau\n}\n\n"
+    "::Pregunta 2:: Le chat est sur une chaise. {TRUE}\n\n"
+    "::Pregunta 3:: De quelle couleur est le chat ? {=noir}\n\n"
+    "::Pregunta 4:: Le chat dort. {FALSE}\n"
+)
+
+
+class Latency:
+    """
+    Latencia simulada: un valor base con variación aleatoria (jitter).
+    """
+
+    def __init__(self, base_ms: float, jitter_ms: float = 0.0):
+        self.base_ms = base_ms
+        self.jitter_ms = jitter_ms
+
+    def seconds(self) -> float:
+        return max(0.0, self.base_ms + random.uniform(-self.jitter_ms, self.jitter_ms)) / 1000
+
+
+# --- OpenAI ---
+def install_fake_openai(latency: Latency) -> None:
+    """
+    Redirige las llamadas de openai_service a un transporte httpx en proceso.
+    """
+    from app.services import http_client, openai_service
+
+    async def handler(request: httpx.Request) -> httpx.Response:
+        await asyncio.sleep(latency.seconds())
+        body = json.loads(request.content)
+        is_feedback = body.get("response_format", {}).get("type") == "json_object"
+        content = json.dumps(FAKE_FEEDBACK, ensure_ascii=False) if is_feedback else FAKE_GIFT
+        usage = {"prompt_tokens": 250, "completion_tokens": 80, "total_tokens": 330}
+
+        if body.get("stream"):
+            # Respuesta en Server-Sent Events, troceada como la de OpenAI.
+            pieces = [content[i:i + 12] for i in range(0, len(content), 12)]
+            lines = [
+                "data: " + json.dumps({"choices": [{"delta": {"content": piece}}]}, ensure_ascii=False)
+                for piece in pieces
+            ]
+            # Con stream_options.include_usage, el último evento trae el consumo sin 'choices'.
+            lines.append("data: " + json.dumps({"choices": [], "usage": usage}))
+            lines.append("data: [DONE]")
+            return httpx.Response(
+                200, text="\n\n".join(lines) + "\n\n", headers={"Content-Type": "text/event-stream"}
+            )
+
+        return httpx.Response(200, json={
+            "choices": [{"message": {"role": "assistant", "content": content}}],
+            "usage": usage,
+        })
+
+    openai_service.API_URL = FAKE_OPENAI_URL
+    http_client._client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+
+
+# --- Gemini ---
+class _FakeChunk:
+    def __init__(self, text: str):
+        self.text = text
+
+
+class _FakeStream:
+    def __init__(self, text: str, latency: Latency):
+        self._pieces = [text[i:i + 20] for i in range(0, len(text), 20)]
+        self._latency = latency
+
+    def __aiter__(self):
+        return self._iterate()
+
+    async def _iterate(self):
+        for piece in self._pieces:
+            await asyncio.sleep(self._latency.seconds() / max(1, len(self._pieces)))
+            yield _FakeChunk(piece)
+
+
+def install_fake_gemini(latency: Latency) -> None:
+    """
+    Sustituye el GenerativeModel de Gemini que usa summarize_service.
+    """
+    from app.services import summarize_service
+
+    summary = "1. Idée principale.\n2. Deuxième point clé.\n3. Conclusion de la vidéo."
+
+    class FakeGenerativeModel:
+        def __init__(self, model_name: str, *args, **kwargs):
+            self.model_name = model_name
+
+        async def generate_content_async(self, prompt, stream: bool = False, **kwargs):
+            if stream:
+                return _FakeStream(summary, latency)
+            await asyncio.sleep(latency.seconds())
+            return _FakeChunk(summary)
+
+    summarize_service.genai = types.SimpleNamespace(GenerativeModel=FakeGenerativeModel)
+
+
+# --- YouTube ---
+def install_fake_youtube(latency: Latency, segments: int = 400) -> None:
+    """
+    Sustituye YouTubeTranscriptApi por una transcripción sintética de `segments` líneas.
+    """
+    from app.services import summarize_service
+
+    class FakeYouTubeTranscriptApi:
+        @staticmethod
+        def get_transcript(video_id, languages=None):
+            # La librería real es bloqueante; el servicio la llama desde un hilo.
+            time.sleep(latency.seconds())
+            return [
+                {"text": f"Phrase numéro {i} de la vidéo {video_id}, avec un peu de contenu.",
+                 "start": i * 4.0, "duration": 4.0}
+                for i in range(segments)
+            ]
+
+    summarize_service.YouTubeTranscriptApi = FakeYouTubeTranscriptApi
+
+
+# --- BLIP ---
+def install_stub_blip(latency: Latency) -> None:
+    """
+    Sustituye la carga y la inferencia de BLIP por un generador falso: la API
+    se comporta como con el modelo listo, pero cada lote solo espera `latency`.
+    """
+    from app.services import blip_service
+
+    def fake_load_model() -> bool:
+        blip_service.MODEL_STATE = "ready"
+        blip_service.LOAD_SECONDS = 0.0
+        return True
+
+    def fake_generate_batch(image_names: list) -> list:
+        time.sleep(latency.seconds())
+        return [f"Une image de test ({name})." for name in image_names]
+
+    blip_service.load_model = fake_load_model
+    blip_service._generate_batch = fake_generate_batch
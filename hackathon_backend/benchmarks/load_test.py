@@ -0,0 +1,191 @@
+# benchmarks/load_test.py
+#
+# Prueba de carga de la API completa (la app de main.py) en proceso, con OpenAI,
+# Gemini y YouTube sustituidos por falsos con latencia configurable (ver fakes.py).
+# Para cada endpoint lanza N peticiones con C clientes concurrentes e informa del
+# rendimiento (peticiones/s) y de las latencias p50/p95/p99.
+#
+# Uso (desde la carpeta hackathon_backend):
+#     python -m benchmarks.load_test --requests 200 --concurrency 20 --blip stub
+#     python -m benchmarks.load_test --endpoints evaluate quiz --openai-latency 800 --json resultados.json
+#
+# Con --blip real se usa el modelo de ./model/blip2-frances (tarda en cargar).
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import statistics
+import tempfile
+import time
+
+ENDPOINTS = ("exercise", "evaluate", "quiz", "summarize")
+
+STUDENT_TEXTS = [
+    "Un chat est assis sur une chaise.",
+    "Il y a un chat sur la chaise.",
+    "Le chien joue dans la rue.",
+    "Une voiture rouge devant un avion.",
+    "La tour Eiffel est très grande.",
+]
+
+
+def _configure_environment(args) -> None:
+    """
+    Configura el entorno ANTES de importar la app: la configuración de los
+    servicios se lee de variables de entorno al importarlos.
+    """
+    workdir = tempfile.mkdtemp(prefix="bench-")
+    # Los almacenes del benchmark van a una carpeta temporal para no tocar la caché real.
+    os.environ["CAPTION_STORE_PATH"] = os.path.join(workdir, "captions.json")
+    os.environ["RESPONSE_CACHE_PATH"] = os.path.join(workdir, "responses.sqlite3")
+    os.environ["RESPONSE_CACHE_BACKEND"] = args.cache
+    os.environ["PRECOMPUTE_CAPTIONS"] = "0"
+    os.environ["BUILD_IMAGE_VARIANTS"] = "0"
+    os.environ["BUILD_QUIZ_BANK"] = "0"
+    if args.blip == "stub":
+        os.environ["PRECOMPUTE_PIXELS"] = "0"
+        # El BLIP simulado sustituye la inferencia del propio proceso, no la de los procesos dedicados.
+        os.environ["BLIP_WORKERS"] = "0"
+
+
+def _percentile(values: list, fraction: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+
+def _build_request(endpoint: str, i: int) -> tuple:
+    """
+    Devuelve (método, ruta, cuerpo JSON) de la petición número `i` a un endpoint.
+    """
+    if endpoint == "exercise":
+        return "GET", f"/api/exercise/new?client_id=bench-{i % 50}", None
+    if endpoint == "evaluate":
+        return "POST", "/api/evaluate", {
+            "student_text": random.choice(STUDENT_TEXTS) + f" ({i})",
+            "reference_text": "Un chat noir est assis sur une chaise en bois.",
+        }
+    if endpoint == "quiz":
+        return "POST", "/api/quiz/generate", {
+            "image_description": f"Un chat noir est assis sur une chaise en bois ({i}).",
+        }
+    return "POST", "/api/summarize", {"video_url": f"https://www.youtube.com/watch?v=bench{i}"}
+
+
+async def _run_endpoint(client, endpoint: str, total: int, concurrency: int) -> dict:
+    """
+    Lanza `total` peticiones a un endpoint con `concurrency` clientes a la vez.
+    """
+    latencies = []
+    errors = 0
+    counter = iter(range(total))
+
+    async def worker():
+        nonlocal errors
+        for i in counter:
+            method, path, body = _build_request(endpoint, i)
+            started = time.perf_counter()
+            try:
+                response = await client.request(method, path, json=body)
+                ok = response.status_code < 400
+            except Exception:
+                ok = False
+            latencies.append(time.perf_counter() - started)
+            if not ok:
+                errors += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+
+    latencies_ms = [value * 1000 for value in latencies]
+    return {
+        "endpoint": endpoint,
+        "requests": total,
+        "errors": errors,
+        "seconds": round(elapsed, 3),
+        "throughput_rps": round(total / elapsed, 2) if elapsed else 0.0,
+        "mean_ms": round(statistics.mean(latencies_ms), 1),
+        "p50_ms": round(_percentile(latencies_ms, 0.50), 1),
+        "p95_ms": round(_percentile(latencies_ms, 0.95), 1),
+        "p99_ms": round(_percentile(latencies_ms, 0.99), 1),
+    }
+
+
+async def _wait_until_ready(client, timeout: float) -> None:
+    """
+    Espera a que /health/ready responda 200 (modelo BLIP cargado).
+    """
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        response = await client.get("/health/ready")
+        if response.status_code == 200:
+            return
+        await asyncio.sleep(0.5)
+    raise TimeoutError("El modelo BLIP no estuvo listo a tiempo.")
+
+
+async def run(args) -> list:
+    import httpx
+    from benchmarks import fakes
+
+    fakes.install_fake_openai(fakes.Latency(args.openai_latency, args.jitter))
+    fakes.install_fake_gemini(fakes.Latency(args.gemini_latency, args.jitter))
+    fakes.install_fake_youtube(fakes.Latency(args.youtube_latency, args.jitter), args.transcript_segments)
+    if args.blip == "stub":
+        fakes.install_stub_blip(fakes.Latency(args.blip_latency, args.jitter))
+
+    from main import app
+
+    results = []
+    # Se ejecuta el ciclo de vida de la app (arranque y apagado) igual que con uvicorn.
+    async with app.router.lifespan_context(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+            if "exercise" in args.endpoints:
+                await _wait_until_ready(client, args.ready_timeout)
+            for endpoint in args.endpoints:
+                print(f"Midiendo /{endpoint} ({args.requests} peticiones, {args.concurrency} concurrentes)...")
+                results.append(await _run_endpoint(client, endpoint, args.requests, args.concurrency))
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Prueba de carga de la API con servicios externos simulados.")
+    parser.add_argument("--endpoints", nargs="+", default=list(ENDPOINTS), choices=ENDPOINTS)
+    parser.add_argument("--requests", type=int, default=200, help="Peticiones por endpoint.")
+    parser.add_argument("--concurrency", type=int, default=20, help="Clientes concurrentes.")
+    parser.add_argument("--openai-latency", type=float, default=600, help="Latencia simulada de OpenAI (ms).")
+    parser.add_argument("--gemini-latency", type=float, default=1500, help="Latencia simulada de Gemini (ms).")
+    parser.add_argument("--youtube-latency", type=float, default=300, help="Latencia simulada de YouTube (ms).")
+    parser.add_argument("--blip-latency", type=float, default=1500, help="Latencia del BLIP simulado por lote (ms).")
+    parser.add_argument("--jitter", type=float, default=0, help="Variación aleatoria de las latencias (± ms).")
+    parser.add_argument("--transcript-segments", type=int, default=400, help="Líneas de la transcripción falsa.")
+    parser.add_argument("--blip", choices=("stub", "real"), default="stub", help="Modelo BLIP simulado o real.")
+    parser.add_argument("--cache", choices=("none", "memory", "sqlite"), default="none",
+                        help="Backend de la caché de respuestas durante la prueba.")
+    parser.add_argument("--ready-timeout", type=float, default=600, help="Espera máxima a que BLIP esté listo (s).")
+    parser.add_argument("--json", help="Guarda los resultados en este archivo JSON.")
+    args = parser.parse_args()
+
+    _configure_environment(args)
+    results = asyncio.run(run(args))
+
+    header = f"{'endpoint':<10} {'peticiones':>10} {'errores':>8} {'req/s':>8} {'media ms':>9} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}"
+    print("\n" + header)
+    print("-" * len(header))
+    for result in results:
+        print(
+            f"{result['endpoint']:<10} {result['requests']:>10} {result['errors']:>8} "
+            f"{result['throughput_rps']:>8.1f} {result['mean_ms']:>9.1f} {result['p50_ms']:>8.1f} "
+            f"{result['p95_ms']:>8.1f} {result['p99_ms']:>8.1f}"
+        )
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"config": vars(args), "results": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,13 +1,108 @@
 # main.py
 
 # --- Importaciones de FastAPI y Módulos ---
+import asyncio
+import logging
+import os
+import threading
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
-from fastapi.staticfiles import StaticFiles
 from fastapi.middleware.cors import CORSMiddleware # Importante para la comunicación Moodle <-> API
 
 # Importa los 'routers' que contienen los endpoints de la aplicación.
 # Cada router agrupa endpoints relacionados (ej: todo lo de evaluación en evaluation.py).
-from app.routers import exercise, evaluation, quiz, summarize
+from app.routers import exercise, evaluation, quiz, summarize, health, media, metrics
+from app.logging_config import configure_logging
+from app.middleware import MetricsMiddleware
+from app.services import blip_service, caption_store, http_client, image_variants, pixel_cache, quiz_bank
+from app.services import summary_jobs
+from app.services.model_weights import memory_usage
+from app.services.image_index import index as image_index
+
+logger = logging.getLogger(__name__)
+
+
+# --- Logging Estructurado ---
+# Se configura antes que nada para que los mensajes del arranque salgan con el mismo formato.
+configure_logging()
+
+
+# --- Tareas de Arranque ---
+def _build_pixel_cache(get_processor) -> None:
+    """
+    Preprocesa los tensores de todas las imágenes. Si falla (ej: una imagen que no se
+    puede decodificar), se registra y BLIP arranca igualmente sin la caché: cada
+    imagen se preprocesa en el momento de describirla.
+    """
+    try:
+        pixel_cache.build(get_processor())
+    except Exception as e:
+        logger.exception("No se pudo construir la caché de tensores, se continúa sin ella: %s", e)
+
+
+def _prepare_blip() -> None:
+    """
+    Carga el modelo BLIP (con su inferencia de calentamiento) y, cuando está listo,
+    preprocesa los tensores de todas las imágenes y precalcula sus descripciones.
+    Cada precálculo se puede desactivar con PRECOMPUTE_PIXELS=0 o PRECOMPUTE_CAPTIONS=0
+    (ej: si ya se ejecutaron los scripts offline).
+
+    Con BLIP_WORKERS > 0 el modelo se carga en procesos dedicados; los tensores se
+    preprocesan antes de lanzarlos (solo hace falta el procesador), para que cada
+    proceso abra la caché ya completa.
+
+    Se ejecuta en un hilo en segundo plano: cualquier error se registra y, si el modelo
+    no llegó a estar listo, queda como estado "error" en /health/ready en lugar de
+    dejarlo en "loading" para siempre.
+    """
+    try:
+        precompute_pixels = os.getenv("PRECOMPUTE_PIXELS", "1") == "1"
+        if blip_service.WORKERS > 0:
+            if precompute_pixels:
+                _build_pixel_cache(blip_service.load_processor)
+            if not blip_service.start_workers():
+                return
+            memory = memory_usage()
+            logger.info("Memoria del proceso de la API %d: %s MB.", os.getpid(), memory,
+                        extra={"pid": os.getpid(), "memory_mb": memory})
+        else:
+            if not blip_service.load_model():
+                return
+            if precompute_pixels:
+                _build_pixel_cache(lambda: blip_service.processor)
+        if os.getenv("PRECOMPUTE_CAPTIONS", "1") == "1":
+            caption_store.precompute_all()
+    except Exception as e:
+        logger.exception("Error preparando BLIP: %s", e)
+        if not blip_service.is_ready():
+            blip_service.set_error(e)
+
+
+# Al iniciar la aplicación, la preparación de BLIP se lanza en un hilo en segundo plano.
+# Así la API acepta peticiones de inmediato: /evaluate, /quiz/generate y /summarize
+# funcionan mientras el modelo carga, y /health/ready indica cuándo está listo.
+# Al apagarse, se cierran las conexiones del cliente HTTP compartido y se detienen
+# los procesos de inferencia.
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # El índice de imágenes se construye antes de aceptar peticiones (es solo un listado del directorio).
+    image_index.refresh(force=True)
+    threading.Thread(target=_prepare_blip, name="blip-startup", daemon=True).start()
+    # Las variantes redimensionadas de las imágenes no dependen del modelo: se generan en paralelo.
+    if os.getenv("BUILD_IMAGE_VARIANTS", "1") == "1":
+        threading.Thread(target=image_variants.build_all, name="image-variants", daemon=True).start()
+    # El banco de cuestionarios se completa en segundo plano a medida que hay descripciones.
+    quiz_bank_task = None
+    if os.getenv("BUILD_QUIZ_BANK", "1") == "1":
+        quiz_bank_task = asyncio.create_task(quiz_bank.run_forever())
+    yield
+    if quiz_bank_task is not None:
+        quiz_bank_task.cancel()
+    await summary_jobs.manager.stop()
+    await http_client.close_client()
+    blip_service.stop_workers()
+
 
 # --- Creación de la Instancia de la Aplicación FastAPI ---
 # Se crea la aplicación principal y se le asigna metadatos como título y descripción.
@@ -15,7 +110,8 @@ from app.routers import exercise, evaluation, quiz, summarize
 app = FastAPI(
     title="Hackathon MOOC+IA API",
     description="API para evaluar descripciones de imágenes en francés.",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
 # --- Configuración de CORS (Cross-Origin Resource Sharing) ---
@@ -30,11 +126,16 @@ app.add_middleware(
     allow_headers=["*"],          # Permite todas las cabeceras en las peticiones.
 )
 
+# --- Métricas de las Peticiones ---
+# Mide la latencia por ruta y las peticiones en curso (se publican en /metrics).
+app.add_middleware(MetricsMiddleware)
+
 # --- Montar la Carpeta de Imágenes Estáticas ---
 # Esta línea hace que la carpeta 'images' del proyecto sea accesible públicamente
 # a través de la URL '/static'. Por ejemplo, una imagen 'images/ejemplo.jpg'
 # estaría disponible en 'http://localhost:8000/static/ejemplo.jpg'.
-app.mount("/static", StaticFiles(directory="images"), name="static")
+# Las variantes redimensionadas se sirven aparte, en '/media' (ver app/routers/media.py).
+app.mount("/static", media.CachedStaticFiles(directory="images"), name="static")
 
 
 # --- Inclusión de los Routers en la Aplicación Principal ---
@@ -45,6 +146,9 @@ app.include_router(evaluation.router, prefix="/api", tags=["Evaluation"])
 app.include_router(exercise.router, prefix="/api", tags=["Exercise"])
 app.include_router(quiz.router, prefix="/api", tags=["Quiz"])
 app.include_router(summarize.router, prefix="/api", tags=["Summarize"])
+app.include_router(health.router, tags=["Health"])
+app.include_router(media.router, tags=["Media"])
+app.include_router(metrics.router, tags=["Metrics"])
 
 
 # --- Endpoint Raíz (Root) ---
@@ -0,0 +1,17 @@
+# scripts/build_image_variants.py
+#
+# Genera offline las variantes redimensionadas (WebP y JPEG) de todas las
+# imágenes de la carpeta 'images' (por defecto en 'cache/variants').
+# Solo se procesan las imágenes nuevas o cuyo archivo ha cambiado.
+#
+# Uso (desde la carpeta hackathon_backend):
+#     python -m scripts.build_image_variants
+
+from app.logging_config import configure_logging
+from app.services import image_variants
+
+
+if __name__ == "__main__":
+    # El resumen final se registra con logging (ver app/logging_config.py).
+    configure_logging()
+    image_variants.build_all()
@@ -0,0 +1,31 @@
+# scripts/build_quiz_bank.py
+#
+# Genera offline las variantes GIFT de todas las descripciones del almacén
+# (por defecto en 'cache/quiz_bank.json'). Solo se generan las variantes que
+# faltan; las descripciones deben estar precalculadas antes
+# (python -m scripts.precompute_captions).
+#
+# Uso (desde la carpeta hackathon_backend):
+#     python -m scripts.build_quiz_bank
+
+import asyncio
+import logging
+
+from app.logging_config import configure_logging
+from app.services import http_client, quiz_bank
+
+logger = logging.getLogger(__name__)
+
+
+async def main() -> None:
+    try:
+        # Si la API ya está generando el banco, se espera a que termine (ver quiz_bank.build_all).
+        stats = await quiz_bank.build_all()
+        logger.info("Banco de cuestionarios: %s", stats, extra=stats)
+    finally:
+        await http_client.close_client()
+
+
+if __name__ == "__main__":
+    configure_logging()
+    asyncio.run(main())
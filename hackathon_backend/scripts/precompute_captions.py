@@ -0,0 +1,18 @@
+# scripts/precompute_captions.py
+#
+# Precalcula offline las descripciones de todas las imágenes de la carpeta 'images'
+# y las guarda en el almacén persistente (por defecto 'cache/captions.json').
+# Solo se vuelven a describir las imágenes nuevas o cuyo archivo ha cambiado.
+#
+# Uso (desde la carpeta hackathon_backend):
+#     python -m scripts.precompute_captions
+
+from app.logging_config import configure_logging
+from app.services import blip_service, caption_store
+
+
+if __name__ == "__main__":
+    # El resumen final se registra con logging (ver app/logging_config.py).
+    configure_logging()
+    if blip_service.load_model():
+        caption_store.precompute_all()
@@ -0,0 +1,27 @@
+# scripts/precompute_pixels.py
+#
+# Preprocesa offline todas las imágenes de la carpeta 'images' (decodificación,
+# redimensionado y normalización de BLIP) y guarda los tensores en la caché
+# mapeada en memoria (por defecto 'cache/pixel_values.<versión>.npy', con su
+# índice en 'cache/pixel_values.json'). Solo necesita el procesador, no el
+# modelo completo.
+#
+# Uso (desde la carpeta hackathon_backend):
+#     python -m scripts.precompute_pixels
+
+import logging
+
+from transformers import BlipProcessor
+
+from app.logging_config import configure_logging
+from app.services import pixel_cache
+from app.services.blip_service import MODEL_PATH
+
+logger = logging.getLogger(__name__)
+
+
+if __name__ == "__main__":
+    # El resumen final se registra con logging (ver app/logging_config.py).
+    configure_logging()
+    stats = pixel_cache.build(BlipProcessor.from_pretrained(MODEL_PATH))
+    logger.info("Caché de tensores lista: %s", stats, extra=stats)
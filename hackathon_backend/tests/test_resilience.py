@@ -0,0 +1,38 @@
+# tests/test_resilience.py
+#
+# Uso (desde la carpeta hackathon_backend):
+#     python -m pytest tests
+
+import pytest
+
+pytest.importorskip("httpx")
+pytest.importorskip("prometheus_client")
+requests = pytest.importorskip("requests")
+youtube_transcript_api = pytest.importorskip("youtube_transcript_api")
+
+from app.services import resilience
+
+
+@pytest.mark.parametrize("error", [
+    requests.exceptions.ConnectionError("connexion refusée"),
+    requests.exceptions.Timeout("délai dépassé"),
+    youtube_transcript_api.TooManyRequests("abc123"),
+    youtube_transcript_api.YouTubeRequestFailed("abc123", requests.exceptions.HTTPError("503")),
+], ids=["requests-connection", "requests-timeout", "too-many-requests", "youtube-request-failed"])
+def test_youtube_errors_are_transient(error):
+    assert resilience.is_transient(error)
+
+
+@pytest.mark.parametrize("error", [
+    requests.exceptions.ConnectionError("connexion refusée"),
+    youtube_transcript_api.TooManyRequests("abc123"),
+])
+def test_youtube_errors_open_the_circuit(error):
+    breaker = resilience.CircuitBreaker("youtube-test", failure_threshold=2)
+    breaker.record(error)
+    breaker.record(error)
+    assert breaker.state == resilience.OPEN
+
+
+def test_other_os_errors_are_not_transient():
+    assert not resilience.is_transient(FileNotFoundError("cache/captions.json"))